@@ -7,6 +7,7 @@ import logging
 import time 
 
 from config import MAX_API_RETRIES # این ایمپورت باید از config بیاید
+from utils.metrics import observe_panel_request
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -22,14 +23,24 @@ class XuiAPIClient:
         # session_token_value دیگر لازم نیست اگر کوکی 3x-ui به درستی مدیریت شود.
         logger.info(f"XuiAPIClient initialized for {self.panel_url}") 
 
+    def _send(self, method, endpoint, **kwargs):
+        """درخواست HTTP به پنل؛ زمان و کد وضعیت هر درخواست (از جمله تلاش‌های مجدد) در متریک‌ها ثبت می‌شود."""
+        start = time.perf_counter()
+        status = 'error'
+        try:
+            response = self.session.request(method, f"{self.panel_url}{endpoint}", verify=False, **kwargs)
+            status = str(response.status_code)
+            return response
+        finally:
+            observe_panel_request(self.panel_url, endpoint, status, time.perf_counter() - start)
+
     def _make_request(self, method, endpoint, data=None, retries=0):
-        url = f"{self.panel_url}{endpoint}"
         headers = {"Content-Type": "application/json"} 
         # requests.Session() به طور خودکار کوکی‌ها را مدیریت می‌کند.
         # پس از لاگین، کوکی '3x-ui' به طور خودکار در درخواست‌های بعدی ارسال خواهد شد.
 
         try:
-            response = self.session.request(method, url, json=data, headers=headers, verify=False, timeout=15) 
+            response = self._send(method, endpoint, json=data, headers=headers, timeout=15) 
             response.raise_for_status() 
 
             response_json = response.json()
@@ -87,7 +98,7 @@ class XuiAPIClient:
         logger.info(f"Attempting to login to X-UI panel at {self.panel_url}...")
         
         try:
-            res = self.session.post(f"{self.panel_url}{endpoint}", json=data, verify=False, timeout=10) 
+            res = self._send("POST", endpoint, json=data, timeout=10) 
             res.raise_for_status() 
 
             response_json = res.json()
@@ -242,13 +253,28 @@ class XuiAPIClient:
             logger.warning(f"Failed to update client {client_id}: {response}")
             return False
 
+    def get_client_traffics(self, email):
+        """آمار مصرف یک کلاینت (up, down, total, expiryTime, enable) را با ایمیل آن برمی‌گرداند."""
+        if not self.check_login():
+            logger.error("Not logged in to X-UI. Cannot get client traffics.")
+            return None
+        
+        endpoint = f"/panel/api/inbounds/getClientTraffics/{email}"
+        response = self._make_request("GET", endpoint)
+        
+        if response and response.get('success'):
+            return response.get('obj')
+        else:
+            logger.warning(f"Failed to get client traffics for {email}: {response}")
+            return None
+
     def reset_client_traffic(self, id, email):
         if not self.check_login():
             logger.error("Not logged in to X-UI. Cannot reset client traffic.")
             return False
-        url = f"{self.panel_url}/panel/api/inbounds/{id}/resetClientTraffic/{email}"
+        endpoint = f"/panel/api/inbounds/{id}/resetClientTraffic/{email}"
         try:
-            res = self.session.post(url, verify=False, timeout=10)
+            res = self._send("POST", endpoint, timeout=10)
             res.raise_for_status()
             response_json = res.json()
             if response_json.get('success'):
@@ -258,16 +284,16 @@ class XuiAPIClient:
                 logger.warning(f"Failed to reset client traffic for {email} in inbound {id}: {response_json.get('msg', res.text)}")
                 return False
         except requests.exceptions.RequestException as e:
-            logger.error(f"Error resetting client traffic for {email} from {url}: {e}")
+            logger.error(f"Error resetting client traffic for {email} from {self.panel_url}{endpoint}: {e}")
             return False
 
     def reset_all_traffics(self):
         if not self.check_login():
             logger.error("Not logged in to X-UI. Cannot reset all traffics.")
             return False
-        url = f"{self.panel_url}/panel/api/inbounds/resetAllTraffics"
+        endpoint = "/panel/api/inbounds/resetAllTraffics"
         try:
-            res = self.session.post(url, verify=False, timeout=10)
+            res = self._send("POST", endpoint, timeout=10)
             res.raise_for_status()
             response_json = res.json()
             if response_json.get('success'):
@@ -277,16 +303,16 @@ class XuiAPIClient:
                 logger.warning(f"Failed to reset all traffics: {response_json.get('msg', res.text)}")
                 return False
         except requests.exceptions.RequestException as e:
-            logger.error(f"Error resetting all traffics from {url}: {e}")
+            logger.error(f"Error resetting all traffics from {self.panel_url}{endpoint}: {e}")
             return False
 
     def reset_all_client_traffics(self, id):
         if not self.check_login():
             logger.error("Not logged in to X-UI. Cannot reset all client traffics.")
             return False
-        url = f"{self.panel_url}/panel/api/inbounds/resetAllClientTraffics/{id}"
+        endpoint = f"/panel/api/inbounds/resetAllClientTraffics/{id}"
         try:
-            res = self.session.post(url, verify=False, timeout=10)
+            res = self._send("POST", endpoint, timeout=10)
             res.raise_for_status()
             response_json = res.json()
             if response_json.get('success'):
@@ -296,16 +322,16 @@ class XuiAPIClient:
                 logger.warning(f"Failed to reset all client traffics for inbound {id}: {response_json.get('msg', res.text)}")
                 return False
         except requests.exceptions.RequestException as e:
-            logger.error(f"Error resetting all client traffics for {id} from {url}: {e}")
+            logger.error(f"Error resetting all client traffics for {id} from {self.panel_url}{endpoint}: {e}")
             return False
 
     def del_depleted_clients(self, id):
         if not self.check_login():
             logger.error("Not logged in to X-UI. Cannot delete depleted clients.")
             return False
-        url = f"{self.panel_url}/panel/api/inbounds/delDepletedClients/{id}"
+        endpoint = f"/panel/api/inbounds/delDepletedClients/{id}"
         try:
-            res = self.session.post(url, verify=False, timeout=10)
+            res = self._send("POST", endpoint, timeout=10)
             res.raise_for_status()
             response_json = res.json()
             if response_json.get('success'):
@@ -315,16 +341,16 @@ class XuiAPIClient:
                 logger.warning(f"Failed to delete depleted clients for inbound {id}: {response_json.get('msg', res.text)}")
                 return False
         except requests.exceptions.RequestException as e:
-            logger.error(f"Error deleting depleted clients for {id} from {url}: {e}")
+            logger.error(f"Error deleting depleted clients for {id} from {self.panel_url}{endpoint}: {e}")
             return False
 
     def client_ips(self, email):
         if not self.check_login():
             logger.error("Not logged in to X-UI. Cannot get client IPs.")
             return None
-        url = f"{self.panel_url}/panel/api/inbounds/clientIps/{email}"
+        endpoint = f"/panel/api/inbounds/clientIps/{email}"
         try:
-            res = self.session.post(url, verify=False, timeout=10)
+            res = self._send("POST", endpoint, timeout=10)
             res.raise_for_status()
             response_json = res.json()
             if response_json.get('success'):
@@ -334,16 +360,16 @@ class XuiAPIClient:
                 logger.warning(f"Failed to get client IPs for {email}: {response_json.get('msg', res.text)}")
                 return None
         except requests.exceptions.RequestException as e:
-            logger.error(f"Error getting client IPs for {email} from {url}: {e}")
+            logger.error(f"Error getting client IPs for {email} from {self.panel_url}{endpoint}: {e}")
             return None
 
     def clear_client_ips(self, email):
         if not self.check_login():
             logger.error("Not logged in to X-UI. Cannot clear client IPs.")
             return False
-        url = f"{self.panel_url}/panel/api/inbounds/clearClientIps/{email}"
+        endpoint = f"/panel/api/inbounds/clearClientIps/{email}"
         try:
-            res = self.session.post(url, verify=False, timeout=10)
+            res = self._send("POST", endpoint, timeout=10)
             res.raise_for_status()
             response_json = res.json()
             if response_json.get('success'):
@@ -353,16 +379,16 @@ class XuiAPIClient:
                 logger.warning(f"Failed to clear client IPs for {email}: {response_json.get('msg', res.text)}")
                 return False
         except requests.exceptions.RequestException as e:
-            logger.error(f"Error clearing client IPs for {email} from {url}: {e}")
+            logger.error(f"Error clearing client IPs for {email} from {self.panel_url}{endpoint}: {e}")
             return False
 
     def get_online_users(self):
         if not self.check_login():
             logger.error("Not logged in to X-UI. Cannot get online users.")
             return None
-        url = f"{self.panel_url}/panel/api/inbounds/onlines"
+        endpoint = "/panel/api/inbounds/onlines"
         try:
-            res = self.session.post(url, verify=False, timeout=10)
+            res = self._send("POST", endpoint, timeout=10)
             res.raise_for_status()
             response_json = res.json()
             if response_json.get('success'):
@@ -372,7 +398,7 @@ class XuiAPIClient:
                 logger.warning(f"Failed to get online users: {response_json.get('msg', res.text)}")
                 return None
         except requests.exceptions.RequestException as e:
-            logger.error(f"Error getting online users from {url}: {e}")
+            logger.error(f"Error getting online users from {self.panel_url}{endpoint}: {e}")
             return None
         
         
@@ -66,9 +66,53 @@ except:
 
 # تنظیمات دیتابیس
 DATABASE_NAME = os.getenv("DATABASE_NAME_ALAMOR", "database/alamor_vpn.db")
+# موتور دیتابیس: sqlite (پیش‌فرض) یا postgres
+DB_ENGINE = os.getenv("DB_ENGINE_ALAMOR", "sqlite").strip().lower()
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = int(os.getenv("DB_PORT", "5432"))
+DB_NAME = os.getenv("DB_NAME")
+DB_USER = os.getenv("DB_USER")
+DB_PASSWORD = os.getenv("DB_PASSWORD")
+DB_POOL_MIN_CONN = int(os.getenv("DB_POOL_MIN_CONN_ALAMOR", "1"))
+DB_POOL_MAX_CONN = int(os.getenv("DB_POOL_MAX_CONN_ALAMOR", "10"))
+# دستورات SQL کندتر از این مقدار (میلی‌ثانیه) در لاگ ثبت می‌شوند (0 = غیرفعال)
+DB_SLOW_QUERY_MS = int(os.getenv("DB_SLOW_QUERY_MS_ALAMOR", "200"))
+# انبار وضعیت گفتگو: memory (پیش‌فرض، LRU + TTL) یا database (ماندگار و مشترک بین پروسه‌ها)
+STATE_STORE_BACKEND = os.getenv("STATE_STORE_BACKEND_ALAMOR", "memory").strip().lower()
+STATE_TTL_SECONDS = int(os.getenv("STATE_TTL_SECONDS_ALAMOR", "3600"))
+STATE_MAX_ENTRIES = int(os.getenv("STATE_MAX_ENTRIES_ALAMOR", "10000"))
+# صف کارهای پس‌زمینه (ساخت سرویس پس از تأیید پرداخت)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS_ALAMOR", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS_ALAMOR", "5"))
+# حداکثر حجم کش تصاویر QR کد در حافظه (بایت)
+QR_CACHE_MAX_BYTES = int(os.getenv("QR_CACHE_MAX_BYTES_ALAMOR", str(8 * 1024 * 1024)))
+# پیام همگانی: تعداد گیرندگان هر دسته و تعداد ارسال هم‌زمان
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE_ALAMOR", "200"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY_ALAMOR", "8"))
+# نمایش مصرف سرویس‌ها: مدت کش نتیجه پنل (ثانیه)، تعداد درخواست هم‌زمان به پنل‌ها و حداکثر زمان انتظار کاربر
+USAGE_CACHE_TTL_SECONDS = int(os.getenv("USAGE_CACHE_TTL_SECONDS_ALAMOR", "60"))
+USAGE_LOOKUP_WORKERS = int(os.getenv("USAGE_LOOKUP_WORKERS_ALAMOR", "8"))
+USAGE_LOOKUP_TIMEOUT = float(os.getenv("USAGE_LOOKUP_TIMEOUT_ALAMOR", "10"))
+# محدودیت نرخ اکشن‌های پرهزینه برای هر کاربر (بازنویسی پیش‌فرض‌ها در utils/throttle.py)؛ قالب: action=burst/seconds
+THROTTLE_RULES = os.getenv("THROTTLE_RULES_ALAMOR", "")
+# فاصله تطبیق شمارنده‌های داشبورد ادمین با جداول اصلی (دقیقه)
+STATS_RECONCILE_INTERVAL_MINUTES = int(os.getenv("STATS_RECONCILE_INTERVAL_MINUTES_ALAMOR", "60"))
+# متریک‌های Prometheus در /metrics سرور وب‌هوک: فاصله ذخیره متریک‌های پروسه ربات در دیتابیس (ثانیه) و توکن
+# دسترسی (Authorization: Bearer). بدون توکن فقط درخواست مستقیم از خود سرور (نه از پشت nginx) پذیرفته می‌شود
+METRICS_EXPORT_INTERVAL_SECONDS = int(os.getenv("METRICS_EXPORT_INTERVAL_SECONDS_ALAMOR", "15"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN_ALAMOR", "")
+# آرشیو خودکار پرداخت‌ها و خریدهای منقضی (0 = غیرفعال)
+ARCHIVE_PAYMENTS_AFTER_DAYS = int(os.getenv("ARCHIVE_PAYMENTS_AFTER_DAYS_ALAMOR", "30"))
+ARCHIVE_PURCHASES_AFTER_DAYS = int(os.getenv("ARCHIVE_PURCHASES_AFTER_DAYS_ALAMOR", "90"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE_ALAMOR", "500"))
+ARCHIVE_INTERVAL_HOURS = int(os.getenv("ARCHIVE_INTERVAL_HOURS_ALAMOR", "24"))
+# پرداخت آنلاینی که کاربر پس از این مدت از درگاه برنگشته رد (و سپس آرشیو) می‌شود
+ARCHIVE_ABANDONED_ONLINE_PAYMENT_HOURS = int(os.getenv("ARCHIVE_ABANDONED_ONLINE_PAYMENT_HOURS_ALAMOR", "24"))
 
 # تنظیمات رمزنگاری
 ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY_ALAMOR")
+# کلیدهای قبلی (جدا شده با کاما) که فقط برای رمزگشایی و چرخش کلید استفاده می‌شوند
+ENCRYPTION_OLD_KEYS = [k.strip() for k in os.getenv("ENCRYPTION_OLD_KEYS_ALAMOR", "").split(',') if k.strip()]
 
 # بررسی وجود متغیرهای حیاتی
 if not BOT_TOKEN or not ADMIN_IDS or not ENCRYPTION_KEY:
@@ -85,15 +129,45 @@ SUPPORT_CHANNEL_LINK = os.getenv("SUPPORT_CHANNEL_LINK_ALAMOR", "https://t.me/Yo
 REQUIRED_CHANNEL_ID_STR = os.getenv("REQUIRED_CHANNEL_ID_ALAMOR")
 REQUIRED_CHANNEL_ID = int(REQUIRED_CHANNEL_ID_STR) if REQUIRED_CHANNEL_ID_STR and REQUIRED_CHANNEL_ID_STR.lstrip('-').isdigit() else None
 REQUIRED_CHANNEL_LINK = os.getenv("REQUIRED_CHANNEL_LINK_ALAMOR", "https://t.me/YourChannelLink")
+# کش نتیجه بررسی عضویت در کانال (ثانیه): عضو بودن و عضو نبودن (کوتاه‌تر تا پس از عضویت سریع اعمال شود)
+MEMBERSHIP_CACHE_TTL_SECONDS = int(os.getenv("MEMBERSHIP_CACHE_TTL_SECONDS_ALAMOR", "600"))
+MEMBERSHIP_NEGATIVE_TTL_SECONDS = int(os.getenv("MEMBERSHIP_NEGATIVE_TTL_SECONDS_ALAMOR", "15"))
 MAX_API_RETRIES = 3
 # در فایل config.py
 WEBHOOK_DOMAIN = os.getenv("WEBHOOK_DOMAIN")
+# دریافت آپدیت‌های تلگرام: polling (پیش‌فرض) یا webhook (از طریق webhook_server.py)
+TELEGRAM_UPDATE_MODE = os.getenv("TELEGRAM_UPDATE_MODE_ALAMOR", "polling").strip().lower()
+TELEGRAM_WEBHOOK_PATH = os.getenv("TELEGRAM_WEBHOOK_PATH_ALAMOR", "/telegram/webhook")
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET_ALAMOR")
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE_ALAMOR", "1000"))
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS_ALAMOR", "4"))
+# اجرای webhook_server با gunicorn (gunicorn -c gunicorn.conf.py wsgi:app): آدرس، تعداد پروسه‌ها و تردهای هر پروسه،
+# حداکثر زمان یک درخواست و زمان انتظار برای پایان درخواست‌ها و آپدیت‌های در حال پردازش هنگام توقف (ثانیه)
+WEBHOOK_SERVER_BIND = os.getenv("WEBHOOK_SERVER_BIND_ALAMOR", "0.0.0.0:8080")
+WEBHOOK_SERVER_WORKERS = int(os.getenv("WEBHOOK_SERVER_WORKERS_ALAMOR", "1"))
+WEBHOOK_SERVER_THREADS = int(os.getenv("WEBHOOK_SERVER_THREADS_ALAMOR", "16"))
+WEBHOOK_SERVER_TIMEOUT = int(os.getenv("WEBHOOK_SERVER_TIMEOUT_ALAMOR", "60"))
+WEBHOOK_SERVER_GRACEFUL_TIMEOUT = int(os.getenv("WEBHOOK_SERVER_GRACEFUL_TIMEOUT_ALAMOR", "30"))
+# محدودیت ارسال پیام به تلگرام (حدود ۳۰ پیام در ثانیه در کل و ۱ پیام در ثانیه برای هر چت)
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE_ALAMOR", "25"))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE_ALAMOR", "1"))
+SEND_CHAT_BURST = int(os.getenv("SEND_CHAT_BURST_ALAMOR", "3"))
+SEND_GROUP_RATE_PER_MINUTE = int(os.getenv("SEND_GROUP_RATE_PER_MINUTE_ALAMOR", "20"))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES_ALAMOR", "3"))
+SEND_MAX_RETRY_AFTER = int(os.getenv("SEND_MAX_RETRY_AFTER_ALAMOR", "60"))
+# ویرایش پیام‌ها (کلیک روی منوها) سطل جداگانه و آزادتری برای هر چت دارند
+SEND_EDIT_RATE = float(os.getenv("SEND_EDIT_RATE_ALAMOR", "10"))
+SEND_EDIT_BURST = int(os.getenv("SEND_EDIT_BURST_ALAMOR", "10"))
 ZARINPAL_MERCHANT_ID = os.getenv("ZARINPAL_MERCHANT_ID")
 
 
 
 # در انتهای فایل config.py
 ZARINPAL_SANDBOX = os.getenv("ZARINPAL_SANDBOX", "False").lower() in ['true', '1', 't']
+# آدرس‌های API زرین‌پال (مثلاً برای استفاده از درگاه آزمایشی tools/fake_zarinpal.py)
+ZARINPAL_API_URL = os.getenv("ZARINPAL_API_URL_ALAMOR", "https://api.zarinpal.com/pg/v4/payment/request.json")
+ZARINPAL_VERIFY_URL = os.getenv("ZARINPAL_VERIFY_URL_ALAMOR", "https://api.zarinpal.com/pg/v4/payment/verify.json")
+ZARINPAL_STARTPAY_URL = os.getenv("ZARINPAL_STARTPAY_URL_ALAMOR", "https://www.zarinpal.com/pg/StartPay/")
 ZARINPAL_MERCHANT_ID = os.getenv("ZARINPAL_MERCHANT_ID")
 BOT_USERNAME_ALAMOR = os.getenv("BOT_USERNAME_ALAMOR", "YourBotUsername")
 
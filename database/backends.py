@@ -0,0 +1,282 @@
+# database/backends.py
+
+import os
+import re
+import sqlite3
+import logging
+import threading
+import time
+
+from database.instrumentation import db_stats
+
+try:
+    import psycopg2
+    import psycopg2.extras
+    import psycopg2.extensions
+    import psycopg2.pool
+except ImportError:  # psycopg2 فقط برای بک‌اند PostgreSQL لازم است
+    psycopg2 = None
+
+logger = logging.getLogger(__name__)
+
+# خطاهای قابل انتظار از هر دو بک‌اند؛ DatabaseManager فقط همین‌ها را می‌گیرد
+DB_ERRORS = (sqlite3.Error,) + ((psycopg2.Error,) if psycopg2 else ())
+DB_INTEGRITY_ERRORS = (sqlite3.IntegrityError,) + ((psycopg2.IntegrityError,) if psycopg2 else ())
+
+
+def _timed(sql, params, execute, *args):
+    """دستور را اجرا و زمان آن را (همراه با خطا) در db_stats ثبت می‌کند."""
+    start = time.perf_counter()
+    failed = True
+    try:
+        result = execute(*args)
+        failed = False
+        return result
+    finally:
+        db_stats.record_statement(sql, params, (time.perf_counter() - start) * 1000, failed)
+
+
+class _TimedSQLiteCursor(sqlite3.Cursor):
+    """کرسر SQLite که زمان هر دستور را در db_stats ثبت می‌کند."""
+
+    def execute(self, sql, params=()):
+        return _timed(sql, params, super().execute, sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        return _timed(sql, seq_of_params[0] if seq_of_params else (), super().executemany, sql, seq_of_params)
+
+
+class _TimedSQLiteConnection(sqlite3.Connection):
+    def cursor(self, factory=_TimedSQLiteCursor):
+        return super().cursor(factory)
+
+    def commit(self):
+        # fsync و انتظار برای قفل نوشتن در commit اتفاق می‌افتد
+        return _timed("COMMIT", None, super().commit)
+
+
+class SQLiteBackend:
+    """بک‌اند پیش‌فرض: یک فایل SQLite که با هر فراخوانی یک اتصال کوتاه‌مدت باز می‌کند."""
+    name = 'sqlite'
+    supports_fts = True
+    like_operator = 'LIKE'
+    # SQLite هنگام نوشتن کل دیتابیس را قفل می‌کند، پس قفل سطری لازم نیست
+    row_lock_clause = ''
+
+    def __init__(self, db_path, timeout=10):
+        self.db_path = db_path
+        self.timeout = timeout
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, factory=_TimedSQLiteConnection)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def begin_write(self, cursor):
+        """قفل نوشتن را از ابتدای تراکنش می‌گیرد تا خواندن و نوشتن بعدی اتمیک باشند."""
+        cursor.execute("BEGIN IMMEDIATE")
+
+    def adapt_ddl(self, sql):
+        return sql
+
+    def column_exists(self, cursor, table, column):
+        cursor.execute(f"PRAGMA table_info({table})")
+        return any(row['name'] == column for row in cursor.fetchall())
+
+    def describe(self):
+        return self.db_path
+
+    def close(self):
+        pass
+
+
+def _cast_timestamp(value, cursor):
+    # ستون‌های TIMESTAMP مثل SQLite به صورت رشته 'YYYY-MM-DD HH:MM:SS' برگردانده می‌شوند تا
+    # کدهایی که تاریخ را برش می‌زنند یا با رشته مقایسه می‌کنند روی هر دو بک‌اند یکسان کار کنند
+    return value[:19] if value is not None else None
+
+
+if psycopg2:
+    # oid 1114: TIMESTAMP WITHOUT TIME ZONE (تنها نوع تاریخ در جداول ddl())
+    _TIMESTAMP_AS_TEXT = psycopg2.extensions.new_type((1114,), 'ALAMOR_TIMESTAMP', _cast_timestamp)
+
+    class _PgConnection(psycopg2.extensions.connection):
+        """اتصال PostgreSQL که دستورات آماده‌شده سمت سرور را برای همان سشن نگه می‌دارد."""
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.prepared_statements = {}
+            psycopg2.extensions.register_type(_TIMESTAMP_AS_TEXT, self)
+
+
+class _PgCursor:
+    """
+    کرسر سازگار با کدهای SQLite: placeholderهای `?` را می‌پذیرد، سطرها هم با نام و هم با
+    اندیس قابل دسترسی‌اند و دستورات پارامتری به صورت PREPARE/EXECUTE سمت سرور اجرا می‌شوند.
+    """
+    MAX_PREPARED_PER_CONNECTION = 256
+
+    def __init__(self, raw_conn):
+        self._raw = raw_conn
+        self._cur = raw_conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+
+    def execute(self, sql, params=None):
+        return _timed(sql, params, self._execute, sql, params)
+
+    def _execute(self, sql, params):
+        if not params:
+            self._cur.execute(sql)
+            return self
+        params = tuple(params)
+        prepared = self._raw.prepared_statements
+        name = prepared.get(sql)
+        if name is None and len(prepared) < self.MAX_PREPARED_PER_CONNECTION:
+            name = f"alamor_stmt_{len(prepared) + 1}"
+            self._cur.execute(f"PREPARE {name} AS {_to_numbered_placeholders(sql)}")
+            prepared[sql] = name
+        if name is None:
+            self._cur.execute(sql.replace('%', '%%').replace('?', '%s'), params)
+        else:
+            self._cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        for params in seq_of_params:
+            self.execute(sql, params)
+        return self
+
+    def fetchone(self):
+        return self._cur.fetchone()
+
+    def fetchall(self):
+        return self._cur.fetchall()
+
+    def fetchmany(self, size=None):
+        return self._cur.fetchmany(size) if size else self._cur.fetchmany()
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    @property
+    def lastrowid(self):
+        # معادل lastrowid در SQLite: آخرین مقدار sequence در همین سشن
+        self._cur.execute("SELECT lastval()")
+        return self._cur.fetchone()[0]
+
+    def close(self):
+        self._cur.close()
+
+
+class _PooledPgConnection:
+    """پوششی روی اتصال استخرشده که close() آن اتصال را به استخر برمی‌گرداند."""
+
+    def __init__(self, backend, raw_conn):
+        self._backend = backend
+        self._raw = raw_conn
+
+    def cursor(self):
+        return _PgCursor(self._raw)
+
+    def execute(self, sql, params=None):
+        return self.cursor().execute(sql, params)
+
+    def commit(self):
+        _timed("COMMIT", None, self._raw.commit)
+
+    def rollback(self):
+        self._raw.rollback()
+
+    def close(self):
+        if self._raw is not None:
+            self._backend.release(self._raw)
+            self._raw = None
+
+
+def _to_numbered_placeholders(sql):
+    """placeholderهای `?` را به `$1, $2, ...` مورد نیاز PREPARE تبدیل می‌کند."""
+    counter = iter(range(1, sql.count('?') + 1))
+    return re.sub(r'\?', lambda _: f"${next(counter)}", sql)
+
+
+class PostgresBackend:
+    """
+    بک‌اند PostgreSQL با استخر اتصال thread-safe. برخلاف SQLite چند نویسنده هم‌زمان
+    (ربات و وب‌هوک) را بدون قفل کل دیتابیس پشتیبانی می‌کند.
+    """
+    name = 'postgres'
+    supports_fts = False
+    like_operator = 'ILIKE'
+    row_lock_clause = ' FOR UPDATE'
+
+    _DDL_REPLACEMENTS = [
+        (re.compile(r'\bINTEGER PRIMARY KEY AUTOINCREMENT\b', re.IGNORECASE), 'BIGSERIAL PRIMARY KEY'),
+        (re.compile(r'\bINTEGER\b', re.IGNORECASE), 'BIGINT'),  # آیدی‌های تلگرام از int32 بزرگ‌ترند
+        (re.compile(r'\bREAL\b', re.IGNORECASE), 'DOUBLE PRECISION'),
+    ]
+
+    def __init__(self, host, port, dbname, user, password, min_connections=1, max_connections=10, acquire_timeout=10):
+        if psycopg2 is None:
+            raise RuntimeError("The PostgreSQL backend requires the 'psycopg2-binary' package.")
+        self.dbname = dbname
+        self.host = host
+        self.acquire_timeout = acquire_timeout
+        self.pool = psycopg2.pool.ThreadedConnectionPool(
+            min_connections, max_connections,
+            host=host, port=port, dbname=dbname, user=user, password=password,
+            connection_factory=_PgConnection
+        )
+        # ThreadedConnectionPool در صورت پر بودن خطا می‌دهد؛ این سمافور درخواست‌ها را منتظر نگه می‌دارد
+        self._slots = threading.BoundedSemaphore(max_connections)
+
+    def connect(self):
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise psycopg2.OperationalError("Timed out waiting for a free PostgreSQL connection.")
+        try:
+            return _PooledPgConnection(self, self.pool.getconn())
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, raw_conn):
+        try:
+            # putconn تراکنش نیمه‌کاره را rollback و اتصال خراب را دور می‌اندازد
+            self.pool.putconn(raw_conn, close=bool(raw_conn.closed))
+        finally:
+            self._slots.release()
+
+    def begin_write(self, cursor):
+        # psycopg2 تراکنش را به صورت ضمنی شروع می‌کند؛ قفل با SELECT ... FOR UPDATE گرفته می‌شود
+        pass
+
+    def adapt_ddl(self, sql):
+        for pattern, replacement in self._DDL_REPLACEMENTS:
+            sql = pattern.sub(replacement, sql)
+        return sql
+
+    def column_exists(self, cursor, table, column):
+        cursor.execute(
+            "SELECT 1 FROM information_schema.columns WHERE table_name = ? AND column_name = ?",
+            (table, column)
+        )
+        return cursor.fetchone() is not None
+
+    def describe(self):
+        return f"postgresql://{self.host}/{self.dbname}"
+
+    def close(self):
+        self.pool.closeall()
+
+
+def create_backend(db_path=None):
+    """بک‌اند را بر اساس DB_ENGINE_ALAMOR در فایل .env می‌سازد."""
+    from config import (DB_ENGINE, DATABASE_NAME, DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD,
+                        DB_POOL_MIN_CONN, DB_POOL_MAX_CONN)
+    if DB_ENGINE == 'postgres':
+        return PostgresBackend(DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD,
+                               min_connections=DB_POOL_MIN_CONN, max_connections=DB_POOL_MAX_CONN)
+    return SQLiteBackend(db_path or DATABASE_NAME)
+
@@ -2,25 +2,36 @@
 
 import sqlite3
 import logging
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, MultiFernet, InvalidToken
 import os
+import re
 import json
+import time
+import hashlib
+import datetime
 
-from config import ENCRYPTION_KEY, DATABASE_NAME
+from config import ENCRYPTION_KEY, ENCRYPTION_OLD_KEYS, DATABASE_NAME
+from database.backends import create_backend, DB_ERRORS, DB_INTEGRITY_ERRORS
+from database.instrumentation import db_stats, instrument_methods
 
 logger = logging.getLogger(__name__)
 
+@instrument_methods(db_stats)
 class DatabaseManager:
-    def __init__(self, db_path=DATABASE_NAME):
-        self.db_path = db_path
-        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-        self.fernet = Fernet(ENCRYPTION_KEY)
-        logger.info(f"DatabaseManager initialized with DB: {self.db_path}")
+    # placeholder آیدی کلاینت در قالب کانفیگ‌های تکی هر اینباند
+    CONFIG_UUID_PLACEHOLDER = '{client_uuid}'
+
+    def __init__(self, db_path=DATABASE_NAME, backend=None):
+        self.backend = backend or create_backend(db_path)
+        # مسیر فایل فقط برای SQLite معنی دارد (مثلاً برای تهیه بکاپ)
+        self.db_path = getattr(self.backend, 'db_path', None)
+        # اولین کلید برای رمزنگاری استفاده می‌شود؛ کلیدهای قبلی فقط برای رمزگشایی داده‌های چرخش‌نیافته
+        self.fernet = MultiFernet([Fernet(key) for key in [ENCRYPTION_KEY] + ENCRYPTION_OLD_KEYS])
+        self.key_fingerprint = hashlib.sha256(ENCRYPTION_KEY.encode('utf-8')).hexdigest()[:16]
+        logger.info(f"DatabaseManager initialized with {self.backend.name} DB: {self.backend.describe()}")
 
     def _get_connection(self):
-        conn = sqlite3.connect(self.db_path, timeout=10)
-        conn.row_factory = sqlite3.Row
-        return conn
+        return self.backend.connect()
 
     def create_tables(self):
         """
@@ -30,9 +41,10 @@ class DatabaseManager:
         try:
             conn = self._get_connection()
             cursor = conn.cursor()
+            ddl = self.backend.adapt_ddl
 
             # جدول کاربران
-            cursor.execute("""
+            cursor.execute(ddl("""
                 CREATE TABLE IF NOT EXISTS users (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     telegram_id INTEGER UNIQUE NOT NULL,
@@ -43,10 +55,13 @@ class DatabaseManager:
                     join_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
-            """)
+            """))
+            self._ensure_column(cursor, 'users', 'is_blocked', 'BOOLEAN DEFAULT FALSE')
+            if self.backend.supports_fts:
+                self._create_user_search_index(cursor)
 
             # جدول سرورها
-            cursor.execute("""
+            cursor.execute(ddl("""
                 CREATE TABLE IF NOT EXISTS servers (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     name TEXT UNIQUE NOT NULL,
@@ -59,10 +74,10 @@ class DatabaseManager:
                     last_checked TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     is_online BOOLEAN DEFAULT FALSE
                 )
-            """)
+            """))
             
             # جدول پلن‌ها
-            cursor.execute("""
+            cursor.execute(ddl("""
                 CREATE TABLE IF NOT EXISTS plans (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     name TEXT UNIQUE NOT NULL,
@@ -73,10 +88,10 @@ class DatabaseManager:
                     per_gb_price REAL,
                     is_active BOOLEAN DEFAULT TRUE
                 )
-            """)
+            """))
             
             # جدول Inboundهای پیکربندی شده برای هر سرور
-            cursor.execute("""
+            cursor.execute(ddl("""
                 CREATE TABLE IF NOT EXISTS server_inbounds (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     server_id INTEGER NOT NULL,
@@ -86,10 +101,14 @@ class DatabaseManager:
                     FOREIGN KEY (server_id) REFERENCES servers (id) ON DELETE CASCADE,
                     UNIQUE (server_id, inbound_id)
                 )
-            """)
+            """))
+            # قالب کانفیگ تکی هر اینباند؛ کانفیگ خریدها از روی آن بازسازی می‌شوند
+            self._ensure_column(cursor, 'server_inbounds', 'config_template', 'TEXT')
+            self._ensure_column(cursor, 'server_inbounds', 'protocol', 'TEXT')
+            self._ensure_column(cursor, 'server_inbounds', 'network', 'TEXT')
 
             # جدول خریدها
-            cursor.execute("""
+            cursor.execute(ddl("""
                 CREATE TABLE IF NOT EXISTS purchases (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     user_id INTEGER NOT NULL,
@@ -107,10 +126,34 @@ class DatabaseManager:
                     FOREIGN KEY (server_id) REFERENCES servers (id),
                     FOREIGN KEY (plan_id) REFERENCES plans (id)
                 )
-            """)
+            """))
+            # ایندکس‌های جستجوی مستقیم روی خریدها (پشتیبانی)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_purchases_user_id ON purchases (user_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_purchases_client_email ON purchases (xui_client_email)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_purchases_client_uuid ON purchases (xui_client_uuid)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_purchases_subscription_id ON purchases (subscription_id)")
+
+            # جدول کانفیگ‌های تکی هر خرید (جایگزین ستون single_configs_json)
+            cursor.execute(ddl("""
+                CREATE TABLE IF NOT EXISTS purchase_configs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    purchase_id INTEGER NOT NULL,
+                    server_id INTEGER NOT NULL,
+                    inbound_id INTEGER,
+                    client_uuid TEXT,
+                    remark TEXT,
+                    protocol TEXT,
+                    network TEXT,
+                    url TEXT NOT NULL,
+                    FOREIGN KEY (purchase_id) REFERENCES purchases (id) ON DELETE CASCADE
+                )
+            """))
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_purchase_configs_purchase ON purchase_configs (purchase_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_purchase_configs_inbound ON purchase_configs (server_id, inbound_id)")
+            self._migrate_single_configs_json(cursor)
 
             # جدول درگاه‌های پرداخت
-            cursor.execute("""
+            cursor.execute(ddl("""
                     CREATE TABLE IF NOT EXISTS payment_gateways (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                         name TEXT UNIQUE NOT NULL,
@@ -122,16 +165,16 @@ class DatabaseManager:
                         is_active BOOLEAN DEFAULT TRUE,
                         priority INTEGER DEFAULT 0
                     )
-                """)
-            cursor.execute("""
+                """))
+            cursor.execute(ddl("""
                 CREATE TABLE IF NOT EXISTS free_test_usage (
                     user_id INTEGER PRIMARY KEY,
                     usage_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
                 )
-            """)
+            """))
                 
-            cursor.execute("""
+            cursor.execute(ddl("""
                 CREATE TABLE IF NOT EXISTS payments (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     user_id INTEGER NOT NULL,
@@ -145,20 +188,344 @@ class DatabaseManager:
                     admin_notification_message_id INTEGER,
                     authority TEXT,
                     ref_id TEXT,
+                    status TEXT DEFAULT 'pending',
+                    provisioning_json TEXT,
                     FOREIGN KEY (user_id) REFERENCES users (id)
                 )
-            """)
+            """))
+            # وضعیت پرداخت: pending -> processing (در حال ساخت سرویس) -> confirmed، یا pending -> rejected
+            if self._ensure_column(cursor, 'payments', 'status', "TEXT DEFAULT 'pending'"):
+                cursor.execute("""
+                    UPDATE payments SET status = CASE
+                        WHEN is_confirmed = TRUE THEN 'confirmed'
+                        WHEN confirmation_date IS NOT NULL THEN 'rejected'
+                        ELSE 'pending' END
+                """)
+            # پیشرفت ساخت سرویس (شناسه‌های کلاینت و خرید ثبت شده) تا تلاش مجدد کار، کلاینت یا خرید تکراری نسازد
+            self._ensure_column(cursor, 'payments', 'provisioning_json', 'TEXT')
+            # بازگشت زرین‌پال و صفحه وضعیت پرداخت، پرداخت را بر اساس authority پیدا می‌کنند
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_payments_authority ON payments (authority)")
+            # پیام اعلان هر پرداخت نزد هر ادمین (برای به‌روزرسانی همه نسخه‌ها پس از تأیید/رد)
+            cursor.execute(ddl("""
+                CREATE TABLE IF NOT EXISTS payment_admin_messages (
+                    payment_id INTEGER NOT NULL,
+                    admin_id INTEGER NOT NULL,
+                    message_id INTEGER NOT NULL,
+                    PRIMARY KEY (payment_id, admin_id),
+                    FOREIGN KEY (payment_id) REFERENCES payments (id) ON DELETE CASCADE
+                )
+            """))
+            if self.backend.name == 'postgres':
+                # نسخه قبلی این جدول بدون ddl ساخته می‌شد و آیدی ادمین در PostgreSQL از نوع int32 بود
+                cursor.execute("""
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_name = 'payment_admin_messages' AND column_name = 'admin_id' AND data_type = 'integer'
+                """)
+                if cursor.fetchone():
+                    cursor.execute("""
+                        ALTER TABLE payment_admin_messages
+                            ALTER COLUMN payment_id TYPE BIGINT,
+                            ALTER COLUMN admin_id TYPE BIGINT,
+                            ALTER COLUMN message_id TYPE BIGINT
+                    """)
+
+            # --- جداول آرشیو (داده‌های سرد) ---
+            # پرداخت‌ها و خریدهای بسته شده به این جداول منتقل می‌شوند تا جداول اصلی کوچک بمانند
+            cursor.execute(ddl("""
+                CREATE TABLE IF NOT EXISTS payments_archive (
+                    id INTEGER PRIMARY KEY,
+                    user_id INTEGER NOT NULL,
+                    amount REAL NOT NULL,
+                    payment_date TIMESTAMP,
+                    receipt_message_id INTEGER,
+                    is_confirmed BOOLEAN,
+                    admin_confirmed_by INTEGER,
+                    confirmation_date TIMESTAMP,
+                    order_details_json TEXT,
+                    admin_notification_message_id INTEGER,
+                    authority TEXT,
+                    ref_id TEXT,
+                    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """))
+            self._ensure_column(cursor, 'payments_archive', 'status', 'TEXT')
+            cursor.execute(ddl("""
+                CREATE TABLE IF NOT EXISTS purchases_archive (
+                    id INTEGER PRIMARY KEY,
+                    user_id INTEGER NOT NULL,
+                    server_id INTEGER NOT NULL,
+                    plan_id INTEGER,
+                    purchase_date TIMESTAMP,
+                    expire_date TIMESTAMP,
+                    initial_volume_gb REAL NOT NULL,
+                    xui_client_uuid TEXT,
+                    xui_client_email TEXT,
+                    subscription_id TEXT,
+                    is_active BOOLEAN,
+                    single_configs_json TEXT,
+                    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """))
+            cursor.execute(ddl("""
+                CREATE TABLE IF NOT EXISTS purchase_configs_archive (
+                    id INTEGER PRIMARY KEY,
+                    purchase_id INTEGER NOT NULL,
+                    server_id INTEGER NOT NULL,
+                    inbound_id INTEGER,
+                    client_uuid TEXT,
+                    remark TEXT,
+                    protocol TEXT,
+                    network TEXT,
+                    url TEXT NOT NULL
+                )
+            """))
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_payments_archive_user_id ON payments_archive (user_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_payments_archive_authority ON payments_archive (authority)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_purchases_archive_user_id ON purchases_archive (user_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_purchases_archive_client_uuid ON purchases_archive (xui_client_uuid)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_purchases_archive_subscription_id ON purchases_archive (subscription_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_purchase_configs_archive_purchase ON purchase_configs_archive (purchase_id)")
+
+            # وضعیت گفتگوی کاربران و ادمین‌ها (انبار وضعیت ماندگار)
+            cursor.execute(ddl("""
+                CREATE TABLE IF NOT EXISTS conversation_states (
+                    namespace TEXT NOT NULL,
+                    state_key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, state_key)
+                )
+            """))
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_conversation_states_expires ON conversation_states (expires_at)")
+
+            # صف کارهای پس‌زمینه (مثلاً ساخت سرویس پس از تأیید پرداخت)
+            cursor.execute(ddl("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_type TEXT NOT NULL,
+                    payload_json TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL DEFAULT 5,
+                    run_after REAL NOT NULL,
+                    locked_at REAL,
+                    last_error TEXT,
+                    dedupe_key TEXT UNIQUE,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    finished_at TIMESTAMP
+                )
+            """))
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_run_after ON jobs (status, run_after)")
+
+            # پیام‌های همگانی و وضعیت ارسال به هر کاربر (برای ادامه پس از ری‌استارت)
+            cursor.execute(ddl("""
+                CREATE TABLE IF NOT EXISTS broadcasts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    admin_id INTEGER NOT NULL,
+                    content_type TEXT NOT NULL,
+                    text TEXT,
+                    entities_json TEXT,
+                    file_id TEXT,
+                    source_chat_id INTEGER,
+                    source_message_id INTEGER,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    last_user_id INTEGER NOT NULL DEFAULT 0,
+                    total_recipients INTEGER NOT NULL DEFAULT 0,
+                    sent_count INTEGER NOT NULL DEFAULT 0,
+                    failed_count INTEGER NOT NULL DEFAULT 0,
+                    blocked_count INTEGER NOT NULL DEFAULT 0,
+                    status_chat_id INTEGER,
+                    status_message_id INTEGER,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    started_at TIMESTAMP,
+                    finished_at TIMESTAMP
+                )
+            """))
+            cursor.execute(ddl("""
+                CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+                    broadcast_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    error TEXT,
+                    delivered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (broadcast_id, user_id),
+                    FOREIGN KEY (broadcast_id) REFERENCES broadcasts(id) ON DELETE CASCADE
+                )
+            """))
+
+            # نسخه کاتالوگ (سرورها، پلن‌ها، درگاه‌ها)؛ با هر تغییر یکی زیاد می‌شود تا کیبوردهای کش شده باطل شوند
+            cursor.execute(ddl("""
+                CREATE TABLE IF NOT EXISTS catalog_versions (
+                    name TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL DEFAULT 0
+                )
+            """))
+
+            # شمارنده‌های داشبورد ادمین؛ هنگام نوشتن به‌روز و به صورت دوره‌ای با جداول اصلی تطبیق داده می‌شوند
+            cursor.execute(ddl("""
+                CREATE TABLE IF NOT EXISTS stat_counters (
+                    name TEXT PRIMARY KEY,
+                    value REAL NOT NULL DEFAULT 0
+                )
+            """))
+            cursor.execute(ddl("""
+                CREATE TABLE IF NOT EXISTS daily_stats (
+                    day TEXT PRIMARY KEY,
+                    new_users INTEGER NOT NULL DEFAULT 0,
+                    confirmed_payments INTEGER NOT NULL DEFAULT 0,
+                    revenue REAL NOT NULL DEFAULT 0
+                )
+            """))
 
+            # آخرین snapshot متریک‌های هر پروسه (ربات) برای نمایش در /metrics سرور وب‌هوک
+            cursor.execute(ddl("""
+                CREATE TABLE IF NOT EXISTS metrics_snapshots (
+                    process TEXT PRIMARY KEY,
+                    payload_json TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """))
+
+            # وضعیت چرخش کلید رمزنگاری برای هر جدول
+            cursor.execute(ddl("""
+                CREATE TABLE IF NOT EXISTS key_rotation_progress (
+                    table_name TEXT PRIMARY KEY,
+                    key_fingerprint TEXT NOT NULL,
+                    last_id INTEGER NOT NULL DEFAULT 0,
+                    rotated_rows INTEGER NOT NULL DEFAULT 0,
+                    started_at TIMESTAMP,
+                    completed_at TIMESTAMP
+                )
+            """))
 
             conn.commit()
             logger.info("Database tables created or already exist.")
-        except sqlite3.Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Error creating tables: {e}")
             raise e
         finally:
             if conn:
                 conn.close()
 
+    def _ensure_column(self, cursor, table, column, definition):
+        """ستون جدید را به جدول موجود اضافه می‌کند (مهاجرت دیتابیس‌های قدیمی). True یعنی ستون اضافه شد."""
+        if self.backend.column_exists(cursor, table, column):
+            return False
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {self.backend.adapt_ddl(definition)}")
+        logger.info(f"Added column '{column}' to table '{table}'.")
+        return True
+
+    def _bump_catalog_version(self, cursor, catalog):
+        """نسخه یک کاتالوگ را در همان تراکنش تغییر دهنده آن یکی زیاد می‌کند."""
+        cursor.execute("""
+            INSERT INTO catalog_versions (name, version) VALUES (?, 1)
+            ON CONFLICT (name) DO UPDATE SET version = catalog_versions.version + 1
+        """, (catalog,))
+
+    def get_catalog_version(self, catalog):
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT version FROM catalog_versions WHERE name = ?", (catalog,))
+            row = cursor.fetchone()
+            return row['version'] if row else 0
+        except DB_ERRORS as e:
+            logger.error(f"Error getting catalog version of '{catalog}': {e}")
+            return None
+        finally:
+            if conn: conn.close()
+
+    def ping(self):
+        """بررسی در دسترس بودن دیتابیس (برای /readyz)."""
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            return True
+        except DB_ERRORS as e:
+            logger.error(f"Database ping failed: {e}")
+            return False
+        finally:
+            if conn: conn.close()
+
+    def _migrate_single_configs_json(self, cursor):
+        """کانفیگ‌های ذخیره شده به صورت JSON در purchases را یک‌بار به جدول purchase_configs منتقل می‌کند."""
+        cursor.execute("""
+            SELECT id, server_id, xui_client_uuid, single_configs_json FROM purchases
+            WHERE single_configs_json IS NOT NULL
+        """)
+        legacy_purchases = cursor.fetchall()
+        if not legacy_purchases:
+            return
+        for purchase in legacy_purchases:
+            try:
+                configs = json.loads(purchase['single_configs_json'] or '[]')
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping unreadable single configs of purchase {purchase['id']}.")
+                configs = []
+            # inbound_id در JSON قدیمی ذخیره نشده، پس این کانفیگ‌ها قابل بازسازی نیستند
+            cursor.executemany("""
+                INSERT INTO purchase_configs (purchase_id, server_id, inbound_id, client_uuid, remark, protocol, network, url)
+                VALUES (?, ?, NULL, NULL, ?, ?, ?, ?)
+            """, [
+                (purchase['id'], purchase['server_id'], c.get('remark'), c.get('protocol'), c.get('network'), c['url'])
+                for c in configs if c.get('url')
+            ])
+            cursor.execute("UPDATE purchases SET single_configs_json = NULL WHERE id = ?", (purchase['id'],))
+        logger.info(f"Migrated single configs of {len(legacy_purchases)} purchases to purchase_configs.")
+
+    def _create_user_search_index(self, cursor):
+        """
+        ایندکس FTS5 روی نام و نام کاربری کاربران را به همراه تریگرهای همگام‌سازی می‌سازد.
+        اگر SQLite بدون FTS5 کامپایل شده باشد، جستجو به LIKE برمی‌گردد.
+        """
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users_fts'")
+        is_new_index = cursor.fetchone() is None
+        try:
+            cursor.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+                    first_name, last_name, username,
+                    content='users', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                )
+            """)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"FTS5 is not available, user search will fall back to LIKE: {e}")
+            return
+
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS users_fts_ai AFTER INSERT ON users BEGIN
+                INSERT INTO users_fts (rowid, first_name, last_name, username)
+                VALUES (new.id, new.first_name, new.last_name, new.username);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS users_fts_ad AFTER DELETE ON users BEGIN
+                INSERT INTO users_fts (users_fts, rowid, first_name, last_name, username)
+                VALUES ('delete', old.id, old.first_name, old.last_name, old.username);
+            END
+        """)
+        # فقط وقتی نام واقعاً تغییر کرده ایندکس به‌روز می‌شود (نه در هر /start)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE OF first_name, last_name, username ON users
+            WHEN old.first_name IS NOT new.first_name
+              OR old.last_name IS NOT new.last_name
+              OR old.username IS NOT new.username
+            BEGIN
+                INSERT INTO users_fts (users_fts, rowid, first_name, last_name, username)
+                VALUES ('delete', old.id, old.first_name, old.last_name, old.username);
+                INSERT INTO users_fts (rowid, first_name, last_name, username)
+                VALUES (new.id, new.first_name, new.last_name, new.username);
+            END
+        """)
+        if is_new_index:
+            # کاربران موجود قبل از ساخت ایندکس یک‌بار ایندکس می‌شوند
+            cursor.execute("INSERT INTO users_fts (users_fts) VALUES ('rebuild')")
+            logger.info("User search index built for existing users.")
+
     def _encrypt(self, data):
         if data is None: return None
         if isinstance(data, str):
@@ -171,25 +538,413 @@ class DatabaseManager:
             encrypted_data = encrypted_data.encode('utf-8')
         return self.fernet.decrypt(encrypted_data).decode('utf-8')
 
+    # --- چرخش کلید رمزنگاری ---
+    ENCRYPTED_COLUMNS = {
+        'servers': ('panel_url', 'username', 'password', 'subscription_base_url', 'subscription_path_prefix'),
+        'payment_gateways': ('card_number', 'card_holder_name', 'merchant_id'),
+    }
+
+    def rotate_encryption_keys(self, batch_size=50, pause_seconds=0.2):
+        """
+        داده‌های رمز شده را در دسته‌های کوچک با کلید فعلی بازرمزنگاری می‌کند. هر دسته یک تراکنش
+        کوتاه است و بین دسته‌ها مکث می‌شود تا ربات منتظر قفل نماند. پیشرفت در جدول
+        key_rotation_progress ذخیره می‌شود تا پس از ری‌استارت از همان نقطه ادامه یابد.
+        """
+        for table in self.ENCRYPTED_COLUMNS:
+            while True:
+                rotated = self._rotate_table_batch(table, batch_size)
+                if rotated is None:
+                    break
+                time.sleep(pause_seconds)
+        return self.get_key_rotation_progress()
+
+    def _rotate_table_batch(self, table, batch_size):
+        """یک دسته از جدول را بازرمزنگاری می‌کند؛ اگر کاری باقی نمانده باشد None برمی‌گرداند."""
+        columns = self.ENCRYPTED_COLUMNS[table]
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            self.backend.begin_write(cursor)
+            cursor.execute("SELECT * FROM key_rotation_progress WHERE table_name = ?", (table,))
+            progress = cursor.fetchone()
+            now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            if not progress or progress['key_fingerprint'] != self.key_fingerprint:
+                # کلید جدید: چرخش این جدول از ابتدا شروع می‌شود
+                cursor.execute("DELETE FROM key_rotation_progress WHERE table_name = ?", (table,))
+                cursor.execute("""
+                    INSERT INTO key_rotation_progress (table_name, key_fingerprint, last_id, rotated_rows, started_at)
+                    VALUES (?, ?, 0, 0, ?)
+                """, (table, self.key_fingerprint, now))
+                last_id, rotated_rows = 0, 0
+            elif progress['completed_at']:
+                conn.rollback()
+                return None
+            else:
+                last_id, rotated_rows = progress['last_id'], progress['rotated_rows']
+
+            cursor.execute(
+                f"SELECT id, {', '.join(columns)} FROM {table} WHERE id > ? ORDER BY id LIMIT ?{self.backend.row_lock_clause}",
+                (last_id, batch_size)
+            )
+            rows = cursor.fetchall()
+            for row in rows:
+                try:
+                    values = [self._rotate_token(row[column]) for column in columns]
+                except InvalidToken:
+                    logger.error(f"Cannot decrypt {table} row {row['id']} with any configured key; skipping.")
+                    continue
+                assignments = ', '.join(f"{column} = ?" for column in columns)
+                cursor.execute(f"UPDATE {table} SET {assignments} WHERE id = ?", values + [row['id']])
+                rotated_rows += 1
+
+            if rows:
+                cursor.execute(
+                    "UPDATE key_rotation_progress SET last_id = ?, rotated_rows = ? WHERE table_name = ?",
+                    (rows[-1]['id'], rotated_rows, table)
+                )
+            if len(rows) < batch_size:
+                cursor.execute(
+                    "UPDATE key_rotation_progress SET completed_at = ? WHERE table_name = ?", (now, table)
+                )
+                logger.info(f"Key rotation finished for '{table}' ({rotated_rows} rows re-encrypted).")
+            conn.commit()
+            return len(rows)
+        except DB_ERRORS as e:
+            logger.error(f"Error rotating encryption key for table '{table}': {e}")
+            if conn: conn.rollback()
+            return None
+        finally:
+            if conn: conn.close()
+
+    def _rotate_token(self, token):
+        if token is None:
+            return None
+        return self.fernet.rotate(token.encode('utf-8')).decode('utf-8')
+
+    def get_key_rotation_progress(self):
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM key_rotation_progress ORDER BY table_name")
+            return [dict(row) for row in cursor.fetchall()]
+        except DB_ERRORS as e:
+            logger.error(f"Error getting key rotation progress: {e}")
+            return []
+        finally:
+            if conn: conn.close()
+
+    # --- صف کارها ---
+    def enqueue_job(self, job_type, payload, dedupe_key=None, max_attempts=5, delay_seconds=0):
+        """
+        کار جدیدی در صف ثبت می‌کند. اگر کاری با همین dedupe_key قبلاً ثبت شده باشد، کار تکراری
+        ساخته نمی‌شود و None برگردانده می‌شود.
+        """
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO jobs (job_type, payload_json, status, max_attempts, run_after, dedupe_key)
+                VALUES (?, ?, 'queued', ?, ?, ?)
+            """, (job_type, json.dumps(payload), max_attempts, time.time() + delay_seconds, dedupe_key))
+            job_id = cursor.lastrowid
+            conn.commit()
+            return job_id
+        except DB_INTEGRITY_ERRORS:
+            logger.info(f"Job with dedupe key '{dedupe_key}' already exists; not enqueuing again.")
+            return None
+        except DB_ERRORS as e:
+            logger.error(f"Error enqueuing job '{job_type}': {e}")
+            return None
+        finally:
+            if conn: conn.close()
+
+    def claim_next_job(self, job_types):
+        """اولین کار آماده از انواع داده شده را برمی‌دارد و وضعیت آن را running می‌کند."""
+        if not job_types:
+            return None
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            self.backend.begin_write(cursor)
+            placeholders = ', '.join('?' * len(job_types))
+            now = time.time()
+            cursor.execute(f"""
+                SELECT * FROM jobs
+                WHERE status = 'queued' AND run_after <= ? AND job_type IN ({placeholders})
+                ORDER BY run_after, id LIMIT 1{self.backend.row_lock_clause}
+            """, [now] + list(job_types))
+            job = cursor.fetchone()
+            if not job:
+                conn.rollback()
+                return None
+            cursor.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_at = ? WHERE id = ?",
+                (now, job['id'])
+            )
+            conn.commit()
+            job = dict(job)
+            job['attempts'] += 1
+            job['payload'] = json.loads(job['payload_json'])
+            return job
+        except DB_ERRORS as e:
+            logger.error(f"Error claiming next job: {e}")
+            return None
+        finally:
+            if conn: conn.close()
+
+    def complete_job(self, job_id):
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE jobs SET status = 'done', locked_at = NULL, last_error = NULL, finished_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (job_id,)
+            )
+            conn.commit()
+            return True
+        except DB_ERRORS as e:
+            logger.error(f"Error completing job {job_id}: {e}")
+            return False
+        finally:
+            if conn: conn.close()
+
+    def fail_job(self, job_id, error, retry_delay_seconds=None):
+        """
+        خطای کار را ثبت می‌کند. اگر retry_delay_seconds داده شود کار دوباره در صف قرار می‌گیرد،
+        وگرنه به وضعیت failed می‌رود.
+        """
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            if retry_delay_seconds is None:
+                cursor.execute("""
+                    UPDATE jobs SET status = 'failed', locked_at = NULL, last_error = ?, finished_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                """, (str(error)[:1000], job_id))
+            else:
+                cursor.execute(
+                    "UPDATE jobs SET status = 'queued', locked_at = NULL, last_error = ?, run_after = ? WHERE id = ?",
+                    (str(error)[:1000], time.time() + retry_delay_seconds, job_id)
+                )
+            conn.commit()
+            return True
+        except DB_ERRORS as e:
+            logger.error(f"Error recording failure of job {job_id}: {e}")
+            return False
+        finally:
+            if conn: conn.close()
+
+    def requeue_failed_job(self, dedupe_key, payload=None):
+        """
+        کار شکست‌خورده با این dedupe_key را با شمارنده تلاش صفر دوباره در صف قرار می‌دهد (مثلاً
+        پس از تأیید دوباره پرداخت). اگر payload داده شود جایگزین payload قبلی می‌شود. شناسه کار
+        یا None (کاری در وضعیت failed نبود) برگردانده می‌شود.
+        """
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE jobs SET status = 'queued', attempts = 0, run_after = ?, locked_at = NULL, finished_at = NULL,
+                    payload_json = COALESCE(?, payload_json)
+                WHERE dedupe_key = ? AND status = 'failed'
+            """, (time.time(), json.dumps(payload) if payload is not None else None, dedupe_key))
+            if cursor.rowcount != 1:
+                conn.rollback()
+                return None
+            cursor.execute("SELECT id FROM jobs WHERE dedupe_key = ?", (dedupe_key,))
+            job_id = cursor.fetchone()['id']
+            conn.commit()
+            logger.info(f"Requeued failed job {job_id} ('{dedupe_key}').")
+            return job_id
+        except DB_ERRORS as e:
+            logger.error(f"Error requeuing failed job '{dedupe_key}': {e}")
+            return None
+        finally:
+            if conn: conn.close()
+
+    def get_job_status(self, dedupe_key):
+        """وضعیت کار ثبت شده با این dedupe_key (queued/running/done/failed) یا None."""
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT status FROM jobs WHERE dedupe_key = ?", (dedupe_key,))
+            row = cursor.fetchone()
+            return row['status'] if row else None
+        except DB_ERRORS as e:
+            logger.error(f"Error getting status of job '{dedupe_key}': {e}")
+            return None
+        finally:
+            if conn: conn.close()
+
+    def requeue_stale_jobs(self, stale_after_seconds=900):
+        """کارهایی که worker آن‌ها (مثلاً با ری‌استارت) متوقف شده را دوباره در صف قرار می‌دهد."""
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE jobs SET status = 'queued', locked_at = NULL WHERE status = 'running' AND locked_at < ?",
+                (time.time() - stale_after_seconds,)
+            )
+            conn.commit()
+            if cursor.rowcount:
+                logger.warning(f"Requeued {cursor.rowcount} stale jobs.")
+            return cursor.rowcount
+        except DB_ERRORS as e:
+            logger.error(f"Error requeuing stale jobs: {e}")
+            return 0
+        finally:
+            if conn: conn.close()
+
+    def get_job_counts(self):
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT status, COUNT(*) AS total FROM jobs GROUP BY status")
+            return {row['status']: row['total'] for row in cursor.fetchall()}
+        except DB_ERRORS as e:
+            logger.error(f"Error counting jobs: {e}")
+            return {}
+        finally:
+            if conn: conn.close()
+
+    # --- متریک‌ها ---
+    def save_metrics_snapshot(self, process, snapshot):
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO metrics_snapshots (process, payload_json, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT (process) DO UPDATE SET payload_json = excluded.payload_json, updated_at = excluded.updated_at
+            """, (process, json.dumps(snapshot), time.time()))
+            conn.commit()
+            return True
+        except DB_ERRORS as e:
+            logger.error(f"Error saving metrics snapshot of '{process}': {e}")
+            return False
+        finally:
+            if conn: conn.close()
+
+    def get_metrics_snapshots(self, max_age_seconds=600):
+        """snapshot پروسه‌هایی که در max_age_seconds اخیر متریک‌هایشان را ذخیره کرده‌اند."""
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT process, payload_json FROM metrics_snapshots WHERE updated_at >= ?",
+                           (time.time() - max_age_seconds,))
+            return {row['process']: json.loads(row['payload_json']) for row in cursor.fetchall()}
+        except DB_ERRORS as e:
+            logger.error(f"Error getting metrics snapshots: {e}")
+            return {}
+        finally:
+            if conn: conn.close()
+
+    # --- وضعیت گفتگو ---
+    def get_conversation_state(self, namespace, state_key):
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT value FROM conversation_states WHERE namespace = ? AND state_key = ? AND expires_at > ?",
+                (namespace, state_key, time.time())
+            )
+            row = cursor.fetchone()
+            return row['value'] if row else None
+        except DB_ERRORS as e:
+            logger.error(f"Error loading conversation state {namespace}/{state_key}: {e}")
+            return None
+        finally:
+            if conn: conn.close()
+
+    def save_conversation_state(self, namespace, state_key, value, expires_at):
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO conversation_states (namespace, state_key, value, expires_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (namespace, state_key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at
+            """, (namespace, state_key, value, expires_at))
+            conn.commit()
+            return True
+        except DB_ERRORS as e:
+            logger.error(f"Error saving conversation state {namespace}/{state_key}: {e}")
+            return False
+        finally:
+            if conn: conn.close()
+
+    def delete_conversation_state(self, namespace, state_key):
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM conversation_states WHERE namespace = ? AND state_key = ?", (namespace, state_key))
+            conn.commit()
+            return cursor.rowcount > 0
+        except DB_ERRORS as e:
+            logger.error(f"Error deleting conversation state {namespace}/{state_key}: {e}")
+            return False
+        finally:
+            if conn: conn.close()
+
+    def purge_expired_conversation_states(self, namespace=None):
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            query = "DELETE FROM conversation_states WHERE expires_at <= ?"
+            params = [time.time()]
+            if namespace:
+                query += " AND namespace = ?"
+                params.append(namespace)
+            cursor.execute(query, params)
+            conn.commit()
+            return cursor.rowcount
+        except DB_ERRORS as e:
+            logger.error(f"Error purging expired conversation states: {e}")
+            return 0
+        finally:
+            if conn: conn.close()
+
     # --- توابع کاربران ---
     def add_or_update_user(self, telegram_id, first_name, last_name=None, username=None):
         conn = None
         try:
             conn = self._get_connection()
             cursor = conn.cursor()
+            # درج و به‌روزرسانی جدا انجام می‌شوند تا کاربر جدید در شمارنده‌های داشبورد ثبت شود
             cursor.execute("""
                 INSERT INTO users (telegram_id, first_name, last_name, username, last_activity)
                 VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-                ON CONFLICT(telegram_id) DO UPDATE SET
-                    first_name = excluded.first_name,
-                    last_name = excluded.last_name,
-                    username = excluded.username,
-                    last_activity = CURRENT_TIMESTAMP
+                ON CONFLICT(telegram_id) DO NOTHING
             """, (telegram_id, first_name, last_name, username))
+            if cursor.rowcount:
+                user_db_id = cursor.lastrowid
+                self._add_to_counter(cursor, 'users_total', 1)
+                self._add_to_daily_stats(cursor, new_users=1)
+            else:
+                user_db_id = None
+                cursor.execute("""
+                    UPDATE users SET first_name = ?, last_name = ?, username = ?,
+                        is_blocked = FALSE, last_activity = CURRENT_TIMESTAMP
+                    WHERE telegram_id = ?
+                """, (first_name, last_name, username, telegram_id))
             conn.commit()
             logger.info(f"User {telegram_id} added or updated.")
-            return cursor.lastrowid
-        except sqlite3.Error as e:
+            return user_db_id
+        except DB_ERRORS as e:
             logger.error(f"Error adding/updating user {telegram_id}: {e}")
             return None
         finally:
@@ -203,7 +958,7 @@ class DatabaseManager:
             cursor.execute("SELECT id, telegram_id, first_name, username, join_date FROM users ORDER BY id DESC")
             users = cursor.fetchall()
             return [dict(user) for user in users]
-        except sqlite3.Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Error getting all users: {e}")
             return []
         finally:
@@ -217,7 +972,7 @@ class DatabaseManager:
             cursor.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
             user = cursor.fetchone()
             return dict(user) if user else None
-        except sqlite3.Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Error getting user by telegram_id {telegram_id}: {e}")
             return None
         finally:
@@ -231,12 +986,283 @@ class DatabaseManager:
             cursor.execute("SELECT * FROM users WHERE id = ?", (user_db_id,))
             user = cursor.fetchone()
             return dict(user) if user else None
-        except sqlite3.Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Error getting user by DB ID {user_db_id}: {e}")
             return None
         finally:
             if conn: conn.close()
 
+    def search_users(self, query: str, limit: int = 10, include_archive: bool = False):
+        """
+        کاربران را بر اساس نام/نام کاربری (ایندکس FTS) یا به صورت دقیق بر اساس
+        آیدی تلگرام، شماره سرویس، ایمیل کلاینت، UUID و شناسه سابسکریپشن پیدا می‌کند.
+        با include_archive خریدهای آرشیو شده هم جستجو می‌شوند.
+        """
+        query = (query or "").strip()
+        if not query:
+            return []
+
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            found = {}
+            purchase_tables = ('purchases', 'purchases_archive') if include_archive else ('purchases',)
+
+            def _collect(rows, matched_purchase_id=None):
+                for row in rows:
+                    if row['id'] not in found and len(found) < limit:
+                        user = dict(row)
+                        user['matched_purchase_id'] = matched_purchase_id
+                        found[row['id']] = user
+
+            # --- جستجوی دقیق عددی: آیدی تلگرام یا شماره سرویس ---
+            if query.lstrip('-').isdigit():
+                number = int(query)
+                cursor.execute("SELECT * FROM users WHERE telegram_id = ?", (number,))
+                _collect(cursor.fetchall())
+                for table in purchase_tables:
+                    cursor.execute(f"""
+                        SELECT u.*, p.id AS purchase_id FROM {table} p
+                        JOIN users u ON u.id = p.user_id
+                        WHERE p.id = ?
+                    """, (number,))
+                    for row in cursor.fetchall():
+                        _collect([row], row['purchase_id'])
+
+            # --- جستجوی دقیق روی کانفیگ/لینک ارسال شده توسط کاربر ---
+            for token in self._extract_purchase_lookup_tokens(query):
+                for table in purchase_tables:
+                    cursor.execute(f"""
+                        SELECT u.*, p.id AS purchase_id FROM {table} p
+                        JOIN users u ON u.id = p.user_id
+                        WHERE p.xui_client_email = ? OR p.subscription_id = ? OR p.xui_client_uuid = ?
+                    """, (token, token, token))
+                    for row in cursor.fetchall():
+                        _collect([row], row['purchase_id'])
+
+            # --- جستجوی متنی روی نام و نام کاربری ---
+            if len(found) < limit:
+                _collect(self._search_users_by_name(cursor, query, limit))
+
+            return list(found.values())
+        except DB_ERRORS as e:
+            logger.error(f"Error searching users for '{query}': {e}")
+            return []
+        finally:
+            if conn: conn.close()
+
+    @staticmethod
+    def _extract_purchase_lookup_tokens(query: str):
+        """از متن ورودی (ایمیل، لینک سابسکریپشن یا کانفیگ) کلیدهای جستجوی دقیق را استخراج می‌کند."""
+        tokens = {query}
+        if '://' in query:
+            # لینک سابسکریپشن: آخرین بخش مسیر همان subscription_id است
+            path = query.split('://', 1)[1].split('?', 1)[0].split('#', 1)[0]
+            last_segment = path.rstrip('/').rsplit('/', 1)[-1]
+            if last_segment:
+                tokens.add(last_segment)
+        # کانفیگ تکی (مثلاً vless://UUID@host) شامل UUID کلاینت است
+        tokens.update(re.findall(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}', query))
+        return tokens
+
+    def _search_users_by_name(self, cursor, query, limit):
+        words = [w for w in re.split(r'\s+', query.lstrip('@')) if w]
+        if not words:
+            return []
+        if self.backend.supports_fts:
+            fts_query = " ".join('"' + w.replace('"', '""') + '"*' for w in words)
+            try:
+                cursor.execute("""
+                    SELECT u.* FROM users_fts
+                    JOIN users u ON u.id = users_fts.rowid
+                    WHERE users_fts MATCH ?
+                    ORDER BY rank
+                    LIMIT ?
+                """, (fts_query, limit))
+                return cursor.fetchall()
+            except sqlite3.OperationalError as e:
+                logger.warning(f"FTS user search unavailable, falling back to LIKE: {e}")
+
+        like = self.backend.like_operator
+        pattern = f"%{words[0]}%"
+        cursor.execute(f"""
+            SELECT * FROM users
+            WHERE first_name {like} ? OR last_name {like} ? OR username {like} ?
+            ORDER BY id DESC
+            LIMIT ?
+        """, (pattern, pattern, pattern, limit))
+        return cursor.fetchall()
+
+    # --- پیام همگانی ---
+    def create_broadcast(self, admin_id, content_type, text=None, entities_json=None, file_id=None,
+                         source_chat_id=None, source_message_id=None):
+        """پیام همگانی جدیدی در صف ثبت می‌کند؛ تعداد گیرندگان همان لحظه شمرده می‌شود."""
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) AS total FROM users WHERE is_blocked = FALSE")
+            total = cursor.fetchone()['total']
+            cursor.execute("""
+                INSERT INTO broadcasts (admin_id, content_type, text, entities_json, file_id,
+                                        source_chat_id, source_message_id, total_recipients)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (admin_id, content_type, text, entities_json, file_id, source_chat_id, source_message_id, total))
+            broadcast_id = cursor.lastrowid
+            conn.commit()
+            logger.info(f"Broadcast {broadcast_id} queued by admin {admin_id} for {total} users.")
+            return broadcast_id
+        except DB_ERRORS as e:
+            logger.error(f"Error creating broadcast: {e}")
+            return None
+        finally:
+            if conn: conn.close()
+
+    def count_broadcast_recipients(self):
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) AS total FROM users WHERE is_blocked = FALSE")
+            return cursor.fetchone()['total']
+        except DB_ERRORS as e:
+            logger.error(f"Error counting broadcast recipients: {e}")
+            return 0
+        finally:
+            if conn: conn.close()
+
+    def get_broadcast(self, broadcast_id):
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM broadcasts WHERE id = ?", (broadcast_id,))
+            broadcast = cursor.fetchone()
+            return dict(broadcast) if broadcast else None
+        except DB_ERRORS as e:
+            logger.error(f"Error getting broadcast {broadcast_id}: {e}")
+            return None
+        finally:
+            if conn: conn.close()
+
+    def get_next_active_broadcast(self):
+        """قدیمی‌ترین پیام همگانی در صف یا نیمه‌کاره (مثلاً به دلیل ری‌استارت) را برمی‌گرداند."""
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM broadcasts WHERE status IN ('queued', 'running') ORDER BY id LIMIT 1")
+            broadcast = cursor.fetchone()
+            return dict(broadcast) if broadcast else None
+        except DB_ERRORS as e:
+            logger.error(f"Error getting next active broadcast: {e}")
+            return None
+        finally:
+            if conn: conn.close()
+
+    def set_broadcast_status_message(self, broadcast_id, chat_id, message_id):
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE broadcasts SET status_chat_id = ?, status_message_id = ? WHERE id = ?",
+                (chat_id, message_id, broadcast_id)
+            )
+            conn.commit()
+            return True
+        except DB_ERRORS as e:
+            logger.error(f"Error saving status message of broadcast {broadcast_id}: {e}")
+            return False
+        finally:
+            if conn: conn.close()
+
+    def update_broadcast_status(self, broadcast_id, status):
+        """
+        وضعیت پیام همگانی را تغییر می‌دهد (running، done یا cancelled). پیام پایان یافته یا لغو
+        شده دوباره فعال نمی‌شود.
+        """
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            if status == 'running':
+                cursor.execute("""
+                    UPDATE broadcasts SET status = 'running', started_at = COALESCE(started_at, CURRENT_TIMESTAMP)
+                    WHERE id = ? AND status IN ('queued', 'running')
+                """, (broadcast_id,))
+            else:
+                cursor.execute("""
+                    UPDATE broadcasts SET status = ?, finished_at = CURRENT_TIMESTAMP
+                    WHERE id = ? AND status IN ('queued', 'running')
+                """, (status, broadcast_id))
+            conn.commit()
+            return cursor.rowcount > 0
+        except DB_ERRORS as e:
+            logger.error(f"Error updating status of broadcast {broadcast_id}: {e}")
+            return False
+        finally:
+            if conn: conn.close()
+
+    def get_broadcast_recipients(self, broadcast_id, after_user_id, limit=200):
+        """
+        دسته بعدی گیرندگان به ترتیب id (keyset)؛ کاربران مسدودکننده ربات و کاربرانی که پیام
+        قبلاً برایشان ثبت شده کنار گذاشته می‌شوند.
+        """
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT u.id, u.telegram_id FROM users u
+                LEFT JOIN broadcast_deliveries d ON d.broadcast_id = ? AND d.user_id = u.id
+                WHERE u.id > ? AND u.is_blocked = FALSE AND d.user_id IS NULL
+                ORDER BY u.id
+                LIMIT ?
+            """, (broadcast_id, after_user_id, limit))
+            return [dict(row) for row in cursor.fetchall()]
+        except DB_ERRORS as e:
+            logger.error(f"Error getting recipients of broadcast {broadcast_id}: {e}")
+            return []
+        finally:
+            if conn: conn.close()
+
+    def record_broadcast_batch(self, broadcast_id, results, last_user_id):
+        """
+        نتیجه یک دسته ارسال را در یک تراکنش ثبت می‌کند: وضعیت هر گیرنده، علامت‌گذاری کاربرانی که
+        ربات را مسدود کرده‌اند، شمارنده‌ها و نشانگر ادامه (last_user_id).
+        results: لیست (user_id, status, error) که status یکی از sent، failed یا blocked است.
+        """
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            if results:
+                cursor.executemany("""
+                    INSERT INTO broadcast_deliveries (broadcast_id, user_id, status, error)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (broadcast_id, user_id) DO NOTHING
+                """, [(broadcast_id, user_id, status, error) for user_id, status, error in results])
+            blocked_ids = [user_id for user_id, status, _ in results if status == 'blocked']
+            if blocked_ids:
+                placeholders = ', '.join('?' * len(blocked_ids))
+                cursor.execute(f"UPDATE users SET is_blocked = TRUE WHERE id IN ({placeholders})", blocked_ids)
+            counts = {status: sum(1 for _, s, _ in results if s == status) for status in ('sent', 'failed', 'blocked')}
+            cursor.execute("""
+                UPDATE broadcasts SET
+                    sent_count = sent_count + ?, failed_count = failed_count + ?, blocked_count = blocked_count + ?,
+                    last_user_id = ?
+                WHERE id = ?
+            """, (counts['sent'], counts['failed'], counts['blocked'], last_user_id, broadcast_id))
+            conn.commit()
+            return True
+        except DB_ERRORS as e:
+            logger.error(f"Error recording batch of broadcast {broadcast_id}: {e}")
+            return False
+        finally:
+            if conn: conn.close()
+
     # --- توابع سرورها ---
     def add_server(self, name, panel_url, username, password, sub_base_url, sub_path_prefix):
         conn = None
@@ -247,13 +1273,15 @@ class DatabaseManager:
                 INSERT INTO servers (name, panel_url, username, password, subscription_base_url, subscription_path_prefix)
                 VALUES (?, ?, ?, ?, ?, ?)
             """, (name, self._encrypt(panel_url), self._encrypt(username), self._encrypt(password), self._encrypt(sub_base_url), self._encrypt(sub_path_prefix)))
+            server_id = cursor.lastrowid
+            self._bump_catalog_version(cursor, 'servers')
             conn.commit()
             logger.info(f"Server '{name}' added successfully.")
-            return cursor.lastrowid
-        except sqlite3.IntegrityError:
+            return server_id
+        except DB_INTEGRITY_ERRORS:
             logger.warning(f"Server with name '{name}' already exists.")
             return None
-        except sqlite3.Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Error adding server '{name}': {e}")
             return None
         finally:
@@ -277,7 +1305,7 @@ class DatabaseManager:
                 server_dict['subscription_path_prefix'] = self._decrypt(server_dict['subscription_path_prefix'])
                 decrypted_servers.append(server_dict)
             return decrypted_servers
-        except sqlite3.Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Error getting all servers: {e}")
             return []
         finally:
@@ -299,7 +1327,7 @@ class DatabaseManager:
                 server_dict['subscription_path_prefix'] = self._decrypt(server_dict['subscription_path_prefix'])
                 return server_dict
             return None
-        except sqlite3.Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Error getting server by ID {server_id}: {e}")
             return None
         finally:
@@ -312,10 +1340,13 @@ class DatabaseManager:
             cursor = conn.cursor()
             # Deleting a server will cascade and delete related inbounds
             cursor.execute("DELETE FROM servers WHERE id = ?", (server_id,))
+            deleted = cursor.rowcount > 0
+            if deleted:
+                self._bump_catalog_version(cursor, 'servers')
             conn.commit()
             logger.info(f"Server with ID {server_id} has been deleted.")
-            return cursor.rowcount > 0
-        except sqlite3.Error as e:
+            return deleted
+        except DB_ERRORS as e:
             logger.error(f"Error deleting server with ID {server_id}: {e}")
             return False
         finally:
@@ -326,12 +1357,17 @@ class DatabaseManager:
         try:
             conn = self._get_connection()
             cursor = conn.cursor()
+            cursor.execute("SELECT is_online FROM servers WHERE id = ?", (server_id,))
+            row = cursor.fetchone()
             cursor.execute("""
                 UPDATE servers SET is_online = ?, last_checked = ? WHERE id = ?
             """, (is_online, last_checked, server_id))
+            # بررسی دوره‌ای سلامت سرورها فقط وقتی وضعیت واقعاً عوض شود منوها را باطل می‌کند
+            if row and bool(row['is_online']) != bool(is_online):
+                self._bump_catalog_version(cursor, 'servers')
             conn.commit()
             return True
-        except sqlite3.Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Error updating server status for ID {server_id}: {e}")
             return False
         finally:
@@ -350,7 +1386,7 @@ class DatabaseManager:
             cursor.execute(query, params)
             inbounds = cursor.fetchall()
             return [dict(inbound) for inbound in inbounds]
-        except sqlite3.Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Error getting inbounds for server {server_id}: {e}")
             return []
         finally:
@@ -361,9 +1397,15 @@ class DatabaseManager:
         try:
             conn = self._get_connection()
             cursor = conn.cursor()
-            # First, remove all existing inbounds for this server
-            cursor.execute("DELETE FROM server_inbounds WHERE server_id = ?", (server_id,))
-            # Then, insert the new selection
+            # First, remove the inbounds that are no longer selected
+            selected_ids = [inbound['id'] for inbound in selected_inbounds]
+            if selected_ids:
+                placeholders = ', '.join('?' * len(selected_ids))
+                cursor.execute(f"DELETE FROM server_inbounds WHERE server_id = ? AND inbound_id NOT IN ({placeholders})",
+                               [server_id] + selected_ids)
+            else:
+                cursor.execute("DELETE FROM server_inbounds WHERE server_id = ?", (server_id,))
+            # Then, upsert the selection (keeping the stored config templates of existing rows)
             if selected_inbounds:
                 inbounds_to_insert = [
                     (server_id, inbound['id'], inbound['remark'], True)
@@ -372,17 +1414,90 @@ class DatabaseManager:
                 cursor.executemany("""
                     INSERT INTO server_inbounds (server_id, inbound_id, remark, is_active)
                     VALUES (?, ?, ?, ?)
+                    ON CONFLICT (server_id, inbound_id) DO UPDATE SET is_active = excluded.is_active
                 """, inbounds_to_insert)
             conn.commit()
             logger.info(f"Updated inbounds for server ID {server_id}.")
             return True
-        except sqlite3.Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Error updating inbounds for server ID {server_id}: {e}")
             conn.rollback()
             return False
         finally:
             if conn: conn.close()
 
+    def set_inbound_config_template(self, server_id, inbound_id, template, protocol=None, network=None, remark=None):
+        """
+        قالب کانفیگ تکی یک اینباند را ذخیره می‌کند. اگر قالب تغییر کرده باشد، کانفیگ تمام
+        خریدهای همان اینباند با یک UPDATE مجموعه‌ای بازسازی می‌شوند.
+        """
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT config_template, protocol, network, remark FROM server_inbounds WHERE server_id = ? AND inbound_id = ?",
+                (server_id, inbound_id)
+            )
+            current = cursor.fetchone()
+            if not current:
+                return False
+            if (current['config_template'], current['protocol'], current['network'], current['remark']) == (template, protocol, network, remark):
+                return False
+            cursor.execute("""
+                UPDATE server_inbounds SET config_template = ?, protocol = ?, network = ?, remark = ?
+                WHERE server_id = ? AND inbound_id = ?
+            """, (template, protocol, network, remark, server_id, inbound_id))
+            rebuilt = self._rebuild_purchase_configs(cursor, server_id, inbound_id)
+            conn.commit()
+            logger.info(f"Config template of inbound {inbound_id} on server {server_id} changed; rebuilt {rebuilt} purchase configs.")
+            return True
+        except DB_ERRORS as e:
+            logger.error(f"Error setting config template for inbound {inbound_id} on server {server_id}: {e}")
+            return False
+        finally:
+            if conn: conn.close()
+
+    def rebuild_purchase_configs(self, server_id, inbound_id=None):
+        """کانفیگ‌های تکی خریدهای یک سرور (یا یک اینباند) را از روی قالب فعلی اینباندها بازسازی می‌کند."""
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            rebuilt = self._rebuild_purchase_configs(cursor, server_id, inbound_id)
+            conn.commit()
+            return rebuilt
+        except DB_ERRORS as e:
+            logger.error(f"Error rebuilding purchase configs for server {server_id}: {e}")
+            return 0
+        finally:
+            if conn: conn.close()
+
+    def _rebuild_purchase_configs(self, cursor, server_id, inbound_id=None):
+        template_of = """
+            (SELECT si.{column} FROM server_inbounds si
+             WHERE si.server_id = purchase_configs.server_id AND si.inbound_id = purchase_configs.inbound_id)
+        """
+        query = f"""
+            UPDATE purchase_configs SET
+                url = REPLACE({template_of.format(column='config_template')}, ?, client_uuid),
+                protocol = {template_of.format(column='protocol')},
+                network = {template_of.format(column='network')},
+                remark = {template_of.format(column='remark')}
+            WHERE server_id = ? AND client_uuid IS NOT NULL
+              AND EXISTS (
+                  SELECT 1 FROM server_inbounds si
+                  WHERE si.server_id = purchase_configs.server_id AND si.inbound_id = purchase_configs.inbound_id
+                    AND si.config_template IS NOT NULL
+              )
+        """
+        params = [self.CONFIG_UUID_PLACEHOLDER, server_id]
+        if inbound_id is not None:
+            query += " AND inbound_id = ?"
+            params.append(inbound_id)
+        cursor.execute(query, params)
+        return cursor.rowcount
+
     # --- توابع پلن‌ها ---
     def add_plan(self, name, plan_type, volume_gb, duration_days, price, per_gb_price):
         conn = None
@@ -393,11 +1508,13 @@ class DatabaseManager:
                 INSERT INTO plans (name, plan_type, volume_gb, duration_days, price, per_gb_price, is_active)
                 VALUES (?, ?, ?, ?, ?, ?, TRUE)
             """, (name, plan_type, volume_gb, duration_days, price, per_gb_price))
+            plan_id = cursor.lastrowid
+            self._bump_catalog_version(cursor, 'plans')
             conn.commit()
-            return cursor.lastrowid
-        except sqlite3.IntegrityError:
+            return plan_id
+        except DB_INTEGRITY_ERRORS:
             return None
-        except sqlite3.Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Error adding plan '{name}': {e}")
             return None
         finally:
@@ -415,7 +1532,7 @@ class DatabaseManager:
             cursor.execute(query)
             plans = cursor.fetchall()
             return [dict(plan) for plan in plans]
-        except sqlite3.Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Error getting plans: {e}")
             return []
         finally:
@@ -429,7 +1546,7 @@ class DatabaseManager:
             cursor.execute("SELECT * FROM plans WHERE id = ?", (plan_id,))
             plan = cursor.fetchone()
             return dict(plan) if plan else None
-        except sqlite3.Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Error getting plan by ID {plan_id}: {e}")
             return None
         finally:
@@ -441,9 +1558,10 @@ class DatabaseManager:
             conn = self._get_connection()
             cursor = conn.cursor()
             cursor.execute("UPDATE plans SET is_active = ? WHERE id = ?", (is_active, plan_id))
+            self._bump_catalog_version(cursor, 'plans')
             conn.commit()
             return True
-        except sqlite3.Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Error updating plan status for ID {plan_id}: {e}")
             return False
         finally:
@@ -466,13 +1584,15 @@ class DatabaseManager:
                 INSERT INTO payment_gateways (name, type, card_number, card_holder_name, merchant_id, description, is_active, priority)
                 VALUES (?, ?, ?, ?, ?, ?, TRUE, ?)
             """, (name, gateway_type, encrypted_card_number, encrypted_card_holder_name, encrypted_merchant_id, description, priority))
+            gateway_id = cursor.lastrowid
+            self._bump_catalog_version(cursor, 'gateways')
             conn.commit()
             logger.info(f"Payment Gateway '{name}' ({gateway_type}) added successfully.")
-            return cursor.lastrowid
-        except sqlite3.IntegrityError:
+            return gateway_id
+        except DB_INTEGRITY_ERRORS:
             logger.warning(f"Payment Gateway with name '{name}' already exists.")
             return None
-        except sqlite3.Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Error adding payment gateway '{name}': {e}")
             return None
         finally:
@@ -548,9 +1668,10 @@ class DatabaseManager:
             conn = self._get_connection()
             cursor = conn.cursor()
             cursor.execute("UPDATE payment_gateways SET is_active = ? WHERE id = ?", (is_active, gateway_id))
+            self._bump_catalog_version(cursor, 'gateways')
             conn.commit()
             return True
-        except sqlite3.Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Error updating gateway status for ID {gateway_id}: {e}")
             return False
         finally:
@@ -566,45 +1687,123 @@ class DatabaseManager:
                 INSERT INTO payments (user_id, amount, receipt_message_id, order_details_json, is_confirmed)
                 VALUES (?, ?, ?, ?, FALSE)
             """, (user_id, amount, receipt_message_id, order_details_json))
+            payment_id = cursor.lastrowid
+            if self._is_receipt_payment(order_details_json):
+                self._add_to_counter(cursor, 'payments_pending', 1)
             conn.commit()
-            return cursor.lastrowid
-        except sqlite3.Error as e:
+            return payment_id
+        except DB_ERRORS as e:
             logger.error(f"Error adding payment request for user {user_id}: {e}")
             return None
         finally:
             if conn: conn.close()
 
-    def get_payment_by_id(self, payment_id):
+    def get_payment_by_id(self, payment_id, include_archive=False):
         conn = None
         try:
             conn = self._get_connection()
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM payments WHERE id = ?", (payment_id,))
             payment = cursor.fetchone()
+            if not payment and include_archive:
+                cursor.execute("SELECT * FROM payments_archive WHERE id = ?", (payment_id,))
+                payment = cursor.fetchone()
             return dict(payment) if payment else None
-        except sqlite3.Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Error getting payment {payment_id}: {e}")
             return None
         finally:
             if conn: conn.close()
 
     def update_payment_status(self, payment_id, is_confirmed, admin_id=None):
+        """
+        نتیجه بررسی ادمین را ثبت می‌کند. تغییر وضعیت با یک UPDATE شرطی و اتمیک انجام می‌شود:
+        تأیید فقط برای پرداخت در انتظار یا در حال پردازش و رد فقط برای پرداخت در انتظار.
+        اگر پرداخت قبلاً بسته شده باشد False برمی‌گردد و چیزی تغییر نمی‌کند.
+        """
         conn = None
         try:
             conn = self._get_connection()
             cursor = conn.cursor()
-            cursor.execute("""
-                UPDATE payments 
-                SET is_confirmed = ?, admin_confirmed_by = ?, confirmation_date = CURRENT_TIMESTAMP
-                WHERE id = ?
-            """, (is_confirmed, admin_id, payment_id))
+            if is_confirmed:
+                cursor.execute("""
+                    UPDATE payments
+                    SET status = 'confirmed', is_confirmed = TRUE, admin_confirmed_by = COALESCE(?, admin_confirmed_by),
+                        confirmation_date = CURRENT_TIMESTAMP
+                    WHERE id = ? AND status IN ('pending', 'processing')
+                """, (admin_id, payment_id))
+            else:
+                cursor.execute("""
+                    UPDATE payments
+                    SET status = 'rejected', is_confirmed = FALSE, admin_confirmed_by = ?, confirmation_date = CURRENT_TIMESTAMP
+                    WHERE id = ? AND status = 'pending'
+                """, (admin_id, payment_id))
+            if cursor.rowcount != 1:
+                conn.rollback()
+                logger.warning(f"Payment {payment_id} is not open for review; skipping update.")
+                return False
+            self._record_payment_review(cursor, payment_id, is_confirmed)
             conn.commit()
             return True
-        except sqlite3.Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Error updating payment status for ID {payment_id}: {e}")
             return False
         finally:
             if conn: conn.close()
+
+    def claim_payment(self, payment_id, admin_id=None, ref_id=None):
+        """
+        پرداخت در انتظار را برای ساخت سرویس رزرو می‌کند (pending -> processing). فقط یک
+        فراخوانی برای هر پرداخت True می‌گیرد؛ کلیک دوباره، ادمین دوم یا callback تکراری درگاه
+        False می‌گیرند و نباید سرویسی بسازند. ref_id کد رهگیری درگاه (پرداخت آنلاین) است.
+        """
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE payments
+                SET status = 'processing', admin_confirmed_by = COALESCE(?, admin_confirmed_by), ref_id = COALESCE(?, ref_id)
+                WHERE id = ? AND status = 'pending'
+            """, (admin_id, ref_id, payment_id))
+            claimed = cursor.rowcount == 1
+            conn.commit()
+            return claimed
+        except DB_ERRORS as e:
+            logger.error(f"Error claiming payment {payment_id}: {e}")
+            return False
+        finally:
+            if conn: conn.close()
+
+    def save_payment_provisioning(self, payment_id, provisioning):
+        """پیشرفت ساخت سرویس پرداخت را (پیش از ساخت کلاینت در پنل) ذخیره می‌کند."""
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("UPDATE payments SET provisioning_json = ? WHERE id = ?", (json.dumps(provisioning), payment_id))
+            conn.commit()
+            return cursor.rowcount == 1
+        except DB_ERRORS as e:
+            logger.error(f"Error saving provisioning progress of payment {payment_id}: {e}")
+            return False
+        finally:
+            if conn: conn.close()
+
+    def release_payment_claim(self, payment_id):
+        """رزرو پرداخت را (مثلاً پس از شکست نهایی ساخت سرویس) آزاد می‌کند تا دوباره قابل بررسی باشد."""
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("UPDATE payments SET status = 'pending' WHERE id = ? AND status = 'processing'", (payment_id,))
+            conn.commit()
+            return cursor.rowcount == 1
+        except DB_ERRORS as e:
+            logger.error(f"Error releasing claim of payment {payment_id}: {e}")
+            return False
+        finally:
+            if conn: conn.close()
             
     def update_payment_admin_notification_id(self, payment_id, message_id):
         conn = None
@@ -614,69 +1813,410 @@ class DatabaseManager:
             cursor.execute("UPDATE payments SET admin_notification_message_id = ? WHERE id = ?", (message_id, payment_id))
             conn.commit()
             return True
-        except sqlite3.Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Error updating admin notification message ID for payment {payment_id}: {e}")
             return False
         finally:
             if conn: conn.close()
 
+    def add_payment_admin_messages(self, payment_id, admin_messages):
+        """شناسه پیام اعلان پرداخت نزد ادمین‌ها را ثبت می‌کند. admin_messages: لیست (admin_id, message_id)."""
+        if not admin_messages:
+            return True
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.executemany("""
+                INSERT INTO payment_admin_messages (payment_id, admin_id, message_id) VALUES (?, ?, ?)
+                ON CONFLICT (payment_id, admin_id) DO UPDATE SET message_id = excluded.message_id
+            """, [(payment_id, admin_id, message_id) for admin_id, message_id in admin_messages])
+            conn.commit()
+            return True
+        except DB_ERRORS as e:
+            logger.error(f"Error saving admin messages of payment {payment_id}: {e}")
+            return False
+        finally:
+            if conn: conn.close()
+
+    def get_payment_admin_messages(self, payment_id):
+        """لیست (admin_id, message_id) پیام‌های اعلان یک پرداخت."""
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT admin_id, message_id FROM payment_admin_messages WHERE payment_id = ? ORDER BY admin_id",
+                (payment_id,)
+            )
+            return [(row['admin_id'], row['message_id']) for row in cursor.fetchall()]
+        except DB_ERRORS as e:
+            logger.error(f"Error getting admin messages of payment {payment_id}: {e}")
+            return []
+        finally:
+            if conn: conn.close()
+
     # --- توابع خریدها (Purchases) ---
-    def add_purchase(self, user_id, server_id, plan_id, expire_date, initial_volume_gb, client_uuid, client_email, sub_id, single_configs):
+    def add_purchase(self, user_id, server_id, plan_id, expire_date, initial_volume_gb, client_uuid, client_email, sub_id, single_configs,
+                     payment_id=None, provisioning=None):
+        """
+        خرید را ثبت می‌کند. اگر payment_id داده شود، پیشرفت ساخت سرویس (provisioning به همراه
+        شناسه خرید) در همان تراکنش روی پرداخت ذخیره می‌شود تا تلاش مجدد خرید دوم نسازد.
+        """
         conn = None
         try:
             conn = self._get_connection()
             cursor = conn.cursor()
             cursor.execute("""
-                INSERT INTO purchases (user_id, server_id, plan_id, expire_date, initial_volume_gb, xui_client_uuid, xui_client_email, subscription_id, single_configs_json, is_active)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, TRUE)
-            """, (user_id, server_id, plan_id, expire_date, initial_volume_gb, client_uuid, client_email, sub_id, json.dumps(single_configs)))
+                INSERT INTO purchases (user_id, server_id, plan_id, expire_date, initial_volume_gb, xui_client_uuid, xui_client_email, subscription_id, is_active)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, TRUE)
+            """, (user_id, server_id, plan_id, expire_date, initial_volume_gb, client_uuid, client_email, sub_id))
+            purchase_id = cursor.lastrowid
+            self._add_to_counter(cursor, 'purchases_active', 1)
+            if single_configs:
+                cursor.executemany("""
+                    INSERT INTO purchase_configs (purchase_id, server_id, inbound_id, client_uuid, remark, protocol, network, url)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, [
+                    (purchase_id, server_id, c.get('inbound_id'), c.get('client_uuid'),
+                     c.get('remark'), c.get('protocol'), c.get('network'), c['url'])
+                    for c in single_configs
+                ])
+            if payment_id is not None:
+                cursor.execute("UPDATE payments SET provisioning_json = ? WHERE id = ?",
+                               (json.dumps({**(provisioning or {}), 'purchase_id': purchase_id}), payment_id))
             conn.commit()
-            return cursor.lastrowid
-        except sqlite3.Error as e:
+            return purchase_id
+        except DB_ERRORS as e:
             logger.error(f"Error adding purchase for user {user_id}: {e}")
             return None
         finally:
             if conn: conn.close()
 
-    def get_user_purchases(self, user_db_id):
+    def get_user_purchases(self, user_db_id, include_archive=False):
         conn = None
         try:
             conn = self._get_connection()
             cursor = conn.cursor()
-            cursor.execute("""
-                SELECT p.id, p.purchase_date, p.expire_date, p.initial_volume_gb, p.is_active, s.name as server_name
-                FROM purchases p
+            source = "purchases"
+            if include_archive:
+                # purchases_archive یک ستون archived_at اضافه دارد، پس ستون‌ها صریح انتخاب می‌شوند
+                source = (f"(SELECT {self._PURCHASE_COLUMNS} FROM purchases "
+                          f"UNION ALL SELECT {self._PURCHASE_COLUMNS} FROM purchases_archive)")
+            cursor.execute(f"""
+                SELECT p.id, p.server_id, p.purchase_date, p.expire_date, p.initial_volume_gb, p.is_active, p.xui_client_email, s.name as server_name
+                FROM {source} p
                 JOIN servers s ON p.server_id = s.id
                 WHERE p.user_id = ?
                 ORDER BY p.id DESC
             """, (user_db_id,))
             purchases = cursor.fetchall()
             return [dict(p) for p in purchases]
-        except sqlite3.Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Error getting purchases for user DB ID {user_db_id}: {e}")
             return []
         finally:
             if conn: conn.close()
             
-    def get_purchase_by_id(self, purchase_id):
+    def get_purchase_by_id(self, purchase_id, include_archive=False):
         conn = None
         try:
             conn = self._get_connection()
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM purchases WHERE id = ?", (purchase_id,))
             purchase = cursor.fetchone()
-            if purchase:
-                purchase_dict = dict(purchase)
-                purchase_dict['single_configs_json'] = json.loads(purchase_dict['single_configs_json'] or '[]')
-                return purchase_dict
-            return None
-        except (sqlite3.Error, json.JSONDecodeError) as e:
+            if not purchase and include_archive:
+                cursor.execute("SELECT * FROM purchases_archive WHERE id = ?", (purchase_id,))
+                purchase = cursor.fetchone()
+            return dict(purchase) if purchase else None
+        except DB_ERRORS as e:
             logger.error(f"Error getting purchase by ID {purchase_id}: {e}")
             return None
         finally:
             if conn: conn.close()
+
+    def get_purchase_configs(self, purchase_id, include_archive=False):
+        """کانفیگ‌های تکی یک خرید را برمی‌گرداند."""
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT remark, protocol, network, url FROM purchase_configs
+                WHERE purchase_id = ? ORDER BY id
+            """, (purchase_id,))
+            configs = cursor.fetchall()
+            if not configs and include_archive:
+                cursor.execute("""
+                    SELECT remark, protocol, network, url FROM purchase_configs_archive
+                    WHERE purchase_id = ? ORDER BY id
+                """, (purchase_id,))
+                configs = cursor.fetchall()
+            return [dict(c) for c in configs]
+        except DB_ERRORS as e:
+            logger.error(f"Error getting single configs for purchase {purchase_id}: {e}")
+            return []
+        finally:
+            if conn: conn.close()
             
             
+    # --- شمارنده‌های داشبورد ---
+    _PENDING_RECEIPT_CONDITION = (
+        "status IN ('pending', 'processing') AND order_details_json LIKE '%\"receipt_file_id\"%'"
+    )
+
+    @staticmethod
+    def _stats_day(moment=None):
+        # روزها بر اساس UTC هستند، مثل CURRENT_TIMESTAMP در SQLite
+        return (moment or datetime.datetime.now(datetime.timezone.utc)).strftime("%Y-%m-%d")
+
+    @staticmethod
+    def _is_receipt_payment(order_details_json):
+        # پرداخت کارت به کارت (رسید منتظر بررسی ادمین)؛ پرداخت‌های آنلاین رسید ندارند
+        try:
+            return bool(json.loads(order_details_json or '{}').get('receipt_file_id'))
+        except (TypeError, ValueError):
+            return False
+
+    def _add_to_counter(self, cursor, name, delta):
+        cursor.execute("""
+            INSERT INTO stat_counters (name, value) VALUES (?, ?)
+            ON CONFLICT (name) DO UPDATE SET value = stat_counters.value + excluded.value
+        """, (name, delta))
+
+    def _add_to_daily_stats(self, cursor, new_users=0, confirmed_payments=0, revenue=0):
+        cursor.execute("""
+            INSERT INTO daily_stats (day, new_users, confirmed_payments, revenue) VALUES (?, ?, ?, ?)
+            ON CONFLICT (day) DO UPDATE SET
+                new_users = daily_stats.new_users + excluded.new_users,
+                confirmed_payments = daily_stats.confirmed_payments + excluded.confirmed_payments,
+                revenue = daily_stats.revenue + excluded.revenue
+        """, (self._stats_day(), new_users, confirmed_payments, revenue))
+
+    def _record_payment_review(self, cursor, payment_id, is_confirmed):
+        """شمارنده‌ها را برای تأیید یا رد پرداخت (در همان تراکنشی که وضعیت را بسته است) به‌روز می‌کند."""
+        cursor.execute("SELECT amount, order_details_json FROM payments WHERE id = ?", (payment_id,))
+        payment = cursor.fetchone()
+        if self._is_receipt_payment(payment['order_details_json']):
+            self._add_to_counter(cursor, 'payments_pending', -1)
+        if is_confirmed:
+            self._add_to_daily_stats(cursor, confirmed_payments=1, revenue=payment['amount'])
+
+    def get_dashboard_stats(self):
+        """آمار داشبورد را فقط از جداول شمارنده (چند ردیف) می‌خواند."""
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT name, value FROM stat_counters")
+            counters = {row['name']: row['value'] for row in cursor.fetchall()}
+            today = datetime.datetime.now(datetime.timezone.utc)
+            cursor.execute("SELECT * FROM daily_stats WHERE day >= ?",
+                           (self._stats_day(today - datetime.timedelta(days=29)),))
+            days = {row['day']: dict(row) for row in cursor.fetchall()}
+            cursor.execute("""
+                SELECT COUNT(*) AS total, SUM(CASE WHEN is_online THEN 1 ELSE 0 END) AS online
+                FROM servers WHERE is_active = TRUE
+            """)
+            servers = cursor.fetchone()
+
+            def revenue_since(days_back):
+                first_day = self._stats_day(today - datetime.timedelta(days=days_back - 1))
+                return sum(d['revenue'] for day, d in days.items() if day >= first_day)
+
+            today_stats = days.get(self._stats_day(today), {})
+            return {
+                'users_total': int(counters.get('users_total', 0)),
+                'users_today': today_stats.get('new_users', 0),
+                'purchases_active': int(counters.get('purchases_active', 0)),
+                'payments_pending': int(counters.get('payments_pending', 0)),
+                'revenue_today': today_stats.get('revenue', 0),
+                'revenue_week': revenue_since(7),
+                'revenue_month': revenue_since(30),
+                'servers_online': servers['online'] or 0,
+                'servers_total': servers['total'],
+            }
+        except DB_ERRORS as e:
+            logger.error(f"Error getting dashboard stats: {e}")
+            return None
+        finally:
+            if conn: conn.close()
+
+    def reconcile_stats(self, days=31):
+        """
+        شمارنده‌ها و آمار روزانه N روز اخیر را از روی جداول اصلی دوباره محاسبه می‌کند تا
+        انحراف‌های احتمالی (انقضای خریدها، آرشیو، تغییرات دستی) اصلاح شود.
+        """
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            self.backend.begin_write(cursor)
+            now = datetime.datetime.now(datetime.timezone.utc)
+            cursor.execute("SELECT COUNT(*) AS total FROM users")
+            users_total = cursor.fetchone()['total']
+            cursor.execute("""
+                SELECT COUNT(*) AS total FROM purchases
+                WHERE is_active = TRUE AND (expire_date IS NULL OR expire_date > ?)
+            """, (datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),))
+            purchases_active = cursor.fetchone()['total']
+            cursor.execute(f"SELECT COUNT(*) AS total FROM payments WHERE {self._PENDING_RECEIPT_CONDITION}")
+            payments_pending = cursor.fetchone()['total']
+
+            first_day = self._stats_day(now - datetime.timedelta(days=days - 1))
+            since = f"{first_day} 00:00:00"
+            daily = {}
+            cursor.execute("SELECT join_date FROM users WHERE join_date >= ?", (since,))
+            for row in cursor.fetchall():
+                stats = daily.setdefault(str(row['join_date'])[:10], [0, 0, 0])
+                stats[0] += 1
+            # پرداخت‌های تأیید شده ممکن است در همین بازه آرشیو شده باشند
+            cursor.execute("""
+                SELECT confirmation_date, amount FROM payments WHERE is_confirmed = TRUE AND confirmation_date >= ?
+                UNION ALL
+                SELECT confirmation_date, amount FROM payments_archive WHERE is_confirmed = TRUE AND confirmation_date >= ?
+            """, (since, since))
+            for row in cursor.fetchall():
+                stats = daily.setdefault(str(row['confirmation_date'])[:10], [0, 0, 0])
+                stats[1] += 1
+                stats[2] += row['amount'] or 0
+
+            for name, value in (('users_total', users_total), ('purchases_active', purchases_active),
+                                ('payments_pending', payments_pending)):
+                cursor.execute("""
+                    INSERT INTO stat_counters (name, value) VALUES (?, ?)
+                    ON CONFLICT (name) DO UPDATE SET value = excluded.value
+                """, (name, value))
+            cursor.execute("DELETE FROM daily_stats WHERE day >= ?", (first_day,))
+            cursor.executemany(
+                "INSERT INTO daily_stats (day, new_users, confirmed_payments, revenue) VALUES (?, ?, ?, ?)",
+                [(day, *stats) for day, stats in daily.items() if day >= first_day]
+            )
+            conn.commit()
+            logger.info(f"Dashboard stats reconciled: {users_total} users, {purchases_active} active purchases, "
+                        f"{payments_pending} pending receipts.")
+            return True
+        except DB_ERRORS as e:
+            logger.error(f"Error reconciling dashboard stats: {e}")
+            if conn: conn.rollback()
+            return False
+        finally:
+            if conn: conn.close()
+
+    # --- آرشیو داده‌های سرد ---
+    _PAYMENT_COLUMNS = (
+        "id, user_id, amount, payment_date, receipt_message_id, is_confirmed, admin_confirmed_by, "
+        "confirmation_date, order_details_json, admin_notification_message_id, authority, ref_id, status"
+    )
+    _PURCHASE_COLUMNS = (
+        "id, user_id, server_id, plan_id, purchase_date, expire_date, initial_volume_gb, "
+        "xui_client_uuid, xui_client_email, subscription_id, is_active, single_configs_json"
+    )
+    _PURCHASE_CONFIG_COLUMNS = "id, purchase_id, server_id, inbound_id, client_uuid, remark, protocol, network, url"
+
+    def archive_closed_records(self, payments_older_than_days=30, purchases_expired_days=90,
+                               batch_size=500, max_batches=20, abandoned_online_payment_hours=24):
+        """
+        پرداخت‌های بسته شده (تأیید یا رد شده) و خریدهای منقضی قدیمی را در دسته‌های محدود به
+        جداول آرشیو منتقل می‌کند. پرداخت‌های باز (در انتظار بررسی یا استعلام) هر قدر هم قدیمی
+        باشند منتقل نمی‌شوند. هر دسته یک تراکنش جداست تا قفل نوشتن طولانی نشود.
+
+        پرداخت آنلاینی که کاربر از درگاه برنگشته (بدون رسید و بدون کار استعلام) پس از
+        abandoned_online_payment_hours ساعت رد می‌شود تا به عنوان پرداخت بسته شده آرشیو شود.
+        مقدار 0 برای هر بازه، آن بخش را غیرفعال می‌کند.
+        """
+        now = datetime.datetime.now()
+        moved = {'payments': 0, 'purchases': 0, 'abandoned_payments': 0}
+        if abandoned_online_payment_hours:
+            cutoff = (datetime.datetime.now(datetime.timezone.utc)
+                      - datetime.timedelta(hours=abandoned_online_payment_hours)).strftime("%Y-%m-%d %H:%M:%S")
+            moved['abandoned_payments'] = self._archive_in_batches(
+                f"""
+                SELECT id FROM payments
+                WHERE payment_date < ? AND status = 'pending' AND authority IS NOT NULL
+                    AND order_details_json NOT LIKE '%"receipt_file_id"%'
+                    AND NOT EXISTS (SELECT 1 FROM jobs WHERE jobs.dedupe_key = 'verify_zarinpal_payment:' || payments.id)
+                ORDER BY id LIMIT ?
+                """,
+                (cutoff,), self._reject_abandoned_payments, batch_size, max_batches
+            )
+        if payments_older_than_days:
+            # payment_date با CURRENT_TIMESTAMP (به وقت UTC) ثبت می‌شود
+            cutoff = (datetime.datetime.now(datetime.timezone.utc)
+                      - datetime.timedelta(days=payments_older_than_days)).strftime("%Y-%m-%d %H:%M:%S")
+            moved['payments'] = self._archive_in_batches(
+                """
+                SELECT id FROM payments
+                WHERE payment_date < ? AND status IN ('confirmed', 'rejected')
+                ORDER BY id LIMIT ?
+                """,
+                (cutoff,), self._move_payments_to_archive, batch_size, max_batches
+            )
+        if purchases_expired_days:
+            cutoff = (now - datetime.timedelta(days=purchases_expired_days)).strftime("%Y-%m-%d %H:%M:%S")
+            moved['purchases'] = self._archive_in_batches(
+                """
+                SELECT id FROM purchases
+                WHERE expire_date < ? OR (is_active = FALSE AND purchase_date < ?)
+                ORDER BY id LIMIT ?
+                """,
+                (cutoff, cutoff), self._move_purchases_to_archive, batch_size, max_batches
+            )
+        if moved['payments'] or moved['purchases'] or moved['abandoned_payments']:
+            logger.info(f"Archived {moved['payments']} payments and {moved['purchases']} purchases; "
+                        f"rejected {moved['abandoned_payments']} abandoned online payments.")
+        return moved
+
+    def _archive_in_batches(self, select_ids_query, params, move_batch, batch_size, max_batches):
+        total = 0
+        for _ in range(max_batches):
+            conn = None
+            try:
+                conn = self._get_connection()
+                cursor = conn.cursor()
+                self.backend.begin_write(cursor)
+                cursor.execute(select_ids_query, params + (batch_size,))
+                ids = [row['id'] for row in cursor.fetchall()]
+                if ids:
+                    move_batch(cursor, ids)
+                conn.commit()
+            except DB_ERRORS as e:
+                logger.error(f"Error archiving batch: {e}")
+                if conn: conn.rollback()
+                break
+            finally:
+                if conn: conn.close()
+            total += len(ids)
+            if len(ids) < batch_size:
+                break
+        return total
+
+    def _move_rows(self, cursor, table, columns, key_column, ids):
+        placeholders = ', '.join('?' * len(ids))
+        cursor.execute(
+            f"INSERT INTO {table}_archive ({columns}) SELECT {columns} FROM {table} WHERE {key_column} IN ({placeholders})",
+            ids
+        )
+        cursor.execute(f"DELETE FROM {table} WHERE {key_column} IN ({placeholders})", ids)
+
+    def _move_payments_to_archive(self, cursor, ids):
+        # پیام‌های اعلان ادمین فقط برای پرداخت‌های باز لازم‌اند و آرشیو نمی‌شوند
+        placeholders = ', '.join('?' * len(ids))
+        cursor.execute(f"DELETE FROM payment_admin_messages WHERE payment_id IN ({placeholders})", ids)
+        self._move_rows(cursor, 'payments', self._PAYMENT_COLUMNS, 'id', ids)
+
+    def _reject_abandoned_payments(self, cursor, ids):
+        # پرداخت‌های آنلاین رسید ندارند و در شمارنده رسیدهای منتظر بررسی حساب نمی‌شوند
+        placeholders = ', '.join('?' * len(ids))
+        cursor.execute(f"""
+            UPDATE payments SET status = 'rejected', is_confirmed = FALSE, confirmation_date = CURRENT_TIMESTAMP
+            WHERE id IN ({placeholders}) AND status = 'pending'
+        """, ids)
+
+    def _move_purchases_to_archive(self, cursor, ids):
+        self._move_rows(cursor, 'purchase_configs', self._PURCHASE_CONFIG_COLUMNS, 'purchase_id', ids)
+        self._move_rows(cursor, 'purchases', self._PURCHASE_COLUMNS, 'id', ids)
+
     def check_free_test_usage(self, user_db_id: int) -> bool:
         """بررسی می‌کند آیا کاربر قبلاً از تست رایگان استفاده کرده است."""
         conn = None
@@ -685,7 +2225,7 @@ class DatabaseManager:
             cursor = conn.cursor()
             cursor.execute("SELECT 1 FROM free_test_usage WHERE user_id = ?", (user_db_id,))
             return cursor.fetchone() is not None
-        except sqlite3.Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Error checking free test usage for user {user_db_id}: {e}")
             return True # در صورت خطا، فرض می‌کنیم استفاده کرده تا از سوءاستفاده جلوگیری شود
         finally:
@@ -700,7 +2240,7 @@ class DatabaseManager:
             cursor.execute("INSERT INTO free_test_usage (user_id) VALUES (?)", (user_db_id,))
             conn.commit()
             return True
-        except sqlite3.Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Error recording free test usage for user {user_db_id}: {e}")
             return False
 
@@ -713,7 +2253,7 @@ class DatabaseManager:
             cursor.execute("DELETE FROM free_test_usage WHERE user_id = ?", (user_db_id,))
             conn.commit()
             return cursor.rowcount > 0
-        except sqlite3.Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Error resetting free test usage for user {user_db_id}: {e}")
             return False
         
@@ -730,12 +2270,27 @@ class DatabaseManager:
             cursor.execute("SELECT * FROM payments WHERE authority = ?", (authority,))
             payment = cursor.fetchone()
             return dict(payment) if payment else None
-        except sqlite3.Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Error getting payment by authority {authority}: {e}")
             return None
         finally:
             if conn: conn.close()
 
+    def get_payment_status_by_authority(self, authority: str):
+        """فقط شناسه، وضعیت و کد رهگیری پرداخت (برای صفحه وضعیت که مرتب از مرورگر خوانده می‌شود)."""
+        conn = None
+        try:
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, status, ref_id FROM payments WHERE authority = ?", (authority,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+        except DB_ERRORS as e:
+            logger.error(f"Error getting payment status by authority {authority}: {e}")
+            return None
+        finally:
+            if conn: conn.close()
+
     def confirm_online_payment(self, payment_id: int, ref_id: str):
         """وضعیت یک پرداخت آنلاین را به 'تایید شده' تغییر داده و کد رهگیری را ذخیره می‌کند."""
         conn = None
@@ -744,12 +2299,17 @@ class DatabaseManager:
             cursor = conn.cursor()
             cursor.execute("""
                 UPDATE payments 
-                SET is_confirmed = TRUE, ref_id = ?, confirmation_date = CURRENT_TIMESTAMP
-                WHERE id = ?
+                SET status = 'confirmed', is_confirmed = TRUE, ref_id = ?, confirmation_date = CURRENT_TIMESTAMP
+                WHERE id = ? AND status IN ('pending', 'processing')
             """, (ref_id, payment_id))
+            if cursor.rowcount != 1:
+                conn.rollback()
+                logger.warning(f"Payment {payment_id} is already closed; skipping confirmation.")
+                return False
+            self._record_payment_review(cursor, payment_id, True)
             conn.commit()
             return True
-        except sqlite3.Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Error confirming online payment for ID {payment_id}: {e}")
             return False
         finally:
@@ -766,7 +2326,7 @@ class DatabaseManager:
             cursor.execute("UPDATE payments SET authority = ? WHERE id = ?", (authority, payment_id))
             conn.commit()
             return True
-        except sqlite3.Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Error setting authority for payment ID {payment_id}: {e}")
             return False
         finally:
@@ -0,0 +1,204 @@
+# database/instrumentation.py
+
+import time
+import bisect
+import logging
+import functools
+import threading
+
+from config import DB_SLOW_QUERY_MS
+
+logger = logging.getLogger(__name__)
+
+# مرزهای هیستوگرام تأخیر (میلی‌ثانیه)
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class _MethodStats:
+    __slots__ = ('calls', 'errors', 'total_ms', 'max_ms', 'connect_ms', 'sql_ms', 'statements', 'rows', 'buckets')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.connect_ms = 0.0
+        self.sql_ms = 0.0
+        self.statements = 0
+        self.rows = 0
+        # یک خانه اضافه برای مقادیر بزرگ‌تر از آخرین مرز (+Inf)
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'total_ms': self.total_ms,
+            'avg_ms': self.total_ms / self.calls if self.calls else 0.0,
+            'max_ms': self.max_ms,
+            'connect_ms': self.connect_ms,
+            'sql_ms': self.sql_ms,
+            'statements': self.statements,
+            'rows': self.rows,
+            'buckets': dict(zip([*LATENCY_BUCKETS_MS, float('inf')], self.buckets)),
+        }
+
+
+class DBStats:
+    """
+    آمار زمان‌بندی متدهای DatabaseManager: تعداد فراخوانی، هیستوگرام تأخیر، زمان گرفتن
+    اتصال، زمان اجرای دستورات SQL و تعداد سطرهای برگشتی. دستورات کندتر از آستانه با
+    پارامترهای پوشانده شده لاگ می‌شوند.
+    """
+
+    def __init__(self, slow_query_ms=200):
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        self._methods = {}
+        self._local = threading.local()
+
+    # --- ثبت ---
+    def _get(self, method):
+        stats = self._methods.get(method)
+        if stats is None:
+            stats = self._methods.setdefault(method, _MethodStats())
+        return stats
+
+    def _current_method(self):
+        stack = getattr(self._local, 'stack', None)
+        return stack[-1] if stack else None
+
+    def record_call(self, method, elapsed_ms, rows=0, failed=False):
+        with self._lock:
+            stats = self._get(method)
+            stats.calls += 1
+            stats.errors += int(failed)
+            stats.total_ms += elapsed_ms
+            stats.max_ms = max(stats.max_ms, elapsed_ms)
+            stats.rows += rows
+            stats.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+    def record_connect(self, elapsed_ms):
+        method = self._current_method() or '<unattributed>'
+        with self._lock:
+            self._get(method).connect_ms += elapsed_ms
+
+    def record_statement(self, sql, params, elapsed_ms, failed=False):
+        method = self._current_method() or '<unattributed>'
+        with self._lock:
+            stats = self._get(method)
+            stats.sql_ms += elapsed_ms
+            stats.statements += 1
+            # متدهای DatabaseManager خطای دیتابیس را می‌گیرند، پس خطا همین‌جا شمرده می‌شود
+            stats.errors += int(failed)
+        if self.slow_query_ms and elapsed_ms >= self.slow_query_ms:
+            logger.warning(
+                f"Slow query in {method} ({elapsed_ms:.1f} ms): {' '.join(sql.split())} "
+                f"params={redact_params(params)}"
+            )
+
+    # --- خواندن ---
+    def snapshot(self):
+        with self._lock:
+            return {method: stats.as_dict() for method, stats in self._methods.items()}
+
+    def reset(self):
+        with self._lock:
+            self._methods.clear()
+
+    def format_report(self, limit=15):
+        """خلاصه متنی آمار، مرتب شده بر اساس مجموع زمان (برای دستور ادمین)."""
+        rows = sorted(self.snapshot().items(), key=lambda item: item[1]['total_ms'], reverse=True)[:limit]
+        if not rows:
+            return "No database calls recorded yet."
+        lines = ["method | calls | avg ms | max ms | connect ms | sql ms | rows"]
+        for method, s in rows:
+            lines.append(
+                f"{method} | {s['calls']} | {s['avg_ms']:.1f} | {s['max_ms']:.1f} | "
+                f"{s['connect_ms']:.1f} | {s['sql_ms']:.1f} | {s['rows']}"
+            )
+        return "\n".join(lines)
+
+    # --- زمینه اجرای متد ---
+    def push(self, method):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(method)
+
+    def pop(self):
+        self._local.stack.pop()
+
+
+def redact_params(params):
+    """مقادیر پارامترها را با نوع و طولشان جایگزین می‌کند تا داده کاربران در لاگ نیاید."""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: _redact(value) for key, value in params.items()}
+    return [_redact(value) for value in params]
+
+
+def _redact(value):
+    if value is None:
+        return None
+    if isinstance(value, (str, bytes)):
+        return f"<{type(value).__name__}:{len(value)}>"
+    return f"<{type(value).__name__}>"
+
+
+def _count_rows(result):
+    if result is None or isinstance(result, bool):
+        return 0
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    return 1
+
+
+def instrument_methods(stats, include_private=('_encrypt', '_decrypt')):
+    """
+    دکوراتور کلاس: همه متدهای عمومی (و متدهای خصوصی نام‌برده) را زمان‌بندی می‌کند.
+    زمان `_get_connection` جداگانه به عنوان زمان گرفتن اتصال متد فراخواننده ثبت می‌شود.
+    """
+    def decorate(cls):
+        for name, attr in list(vars(cls).items()):
+            if not callable(attr) or isinstance(attr, (staticmethod, classmethod, type)):
+                continue
+            if name == '_get_connection':
+                setattr(cls, name, _wrap_connect(stats, attr))
+            elif not name.startswith('_') or name in include_private:
+                setattr(cls, name, _wrap_method(stats, f"{cls.__name__}.{name}", attr))
+        return cls
+    return decorate
+
+
+def _wrap_method(stats, method_name, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        stats.push(method_name)
+        start = time.perf_counter()
+        failed = True
+        result = None
+        try:
+            result = func(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            stats.pop()
+            stats.record_call(method_name, (time.perf_counter() - start) * 1000, _count_rows(result), failed)
+    return wrapper
+
+
+def _wrap_connect(stats, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stats.record_connect((time.perf_counter() - start) * 1000)
+    return wrapper
+
+
+# نمونه سراسری که DatabaseManager و کرسرهای بک‌اندها روی آن ثبت می‌کنند
+db_stats = DBStats(slow_query_ms=DB_SLOW_QUERY_MS)
@@ -0,0 +1,24 @@
+# gunicorn.conf.py
+
+# تنظیمات gunicorn برای webhook_server (gunicorn -c gunicorn.conf.py wsgi:app).
+# هر درخواست روی یک ترد جدا اجرا می‌شود، پس استعلام کند زرین‌پال بقیه درخواست‌ها را معطل نمی‌کند.
+from config import (WEBHOOK_SERVER_BIND, WEBHOOK_SERVER_WORKERS, WEBHOOK_SERVER_THREADS,
+                    WEBHOOK_SERVER_TIMEOUT, WEBHOOK_SERVER_GRACEFUL_TIMEOUT)
+
+bind = WEBHOOK_SERVER_BIND
+# در حالت webhook ترتیب آپدیت‌های هر چت فقط داخل یک پروسه تضمین می‌شود؛ مقیاس با تعداد تردها
+workers = WEBHOOK_SERVER_WORKERS
+worker_class = 'gthread'
+threads = WEBHOOK_SERVER_THREADS
+timeout = WEBHOOK_SERVER_TIMEOUT
+graceful_timeout = WEBHOOK_SERVER_GRACEFUL_TIMEOUT
+# ربات و صف آپدیت‌ها تردهای پس‌زمینه دارند و باید در خود هر پروسه ساخته شوند، نه قبل از fork
+preload_app = False
+accesslog = '-'
+errorlog = '-'
+
+
+def worker_exit(server, worker):
+    # درخواست‌های در حال اجرا تمام شده‌اند؛ آپدیت‌های باقی‌مانده در صف پیش از پایان زمان توقف پردازش می‌شوند
+    from webhook_server import shutdown
+    shutdown(timeout=max(graceful_timeout - 5, 1))
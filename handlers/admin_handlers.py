@@ -9,11 +9,19 @@ import os
 import zipfile
 from config import ADMIN_IDS, SUPPORT_CHANNEL_LINK
 from database.db_manager import DatabaseManager
+from database.instrumentation import db_stats
 from api_client.xui_api_client import XuiAPIClient
 from utils import messages, helpers
 from keyboards import inline_keyboards
 from utils.config_generator import ConfigGenerator
 from utils.bot_helpers import send_subscription_info # این ایمپورت جدید است
+from utils.state_store import StateStore, create_state_store
+from utils.provisioning import enqueue_payment_provisioning, retry_payment_provisioning
+from utils.broadcast import broadcast_content_from_message
+from utils.admin_notifier import AdminPaymentNotifier
+from utils.callback_router import CallbackRouter, callback_data
+from utils.cache import TTLCache
+from utils.metrics import record_payment_outcome
 
 logger = logging.getLogger(__name__)
 
@@ -22,14 +30,19 @@ _bot: telebot.TeleBot = None
 _db_manager: DatabaseManager = None
 _xui_api: XuiAPIClient = None
 _config_generator: ConfigGenerator = None
-_admin_states = {}
+_admin_states: StateStore = None
+_admin_notifier: AdminPaymentNotifier = None
+# شناسه callback هایی که پردازش شده‌اند؛ تحویل دوباره همان کلیک (مثلاً تکرار وب‌هوک) هیچ کاری انجام نمی‌دهد
+_processed_callbacks = TTLCache(max_entries=10000, ttl_seconds=600)
 
 def register_admin_handlers(bot_instance, db_manager_instance, xui_api_instance):
-    global _bot, _db_manager, _xui_api, _config_generator
+    global _bot, _db_manager, _xui_api, _config_generator, _admin_states, _admin_notifier
     _bot = bot_instance
     _db_manager = db_manager_instance
     _xui_api = xui_api_instance
     _config_generator = ConfigGenerator(xui_api_instance, db_manager_instance)
+    _admin_states = create_state_store('admin', db_manager_instance)
+    _admin_notifier = AdminPaymentNotifier(bot_instance, db_manager_instance, ADMIN_IDS)
 
     # =============================================================================
     # SECTION: Helper and Menu Functions
@@ -63,6 +76,17 @@ def register_admin_handlers(bot_instance, db_manager_instance, xui_api_instance)
     # SECTION: Single-Action Functions (Listing, Testing)
     # =============================================================================
 
+    def show_dashboard(admin_id, message):
+        """داشبورد از شمارنده‌های دیتابیس و کاربران متصل (کش شده) پنل‌ها ساخته می‌شود."""
+        stats = _db_manager.get_dashboard_stats()
+        if stats is None:
+            _bot.edit_message_text(messages.OPERATION_FAILED, admin_id, message.message_id, reply_markup=inline_keyboards.get_back_button("admin_main_menu"))
+            return
+        online_servers = [s for s in _db_manager.get_all_servers() if s['is_active'] and s['is_online']]
+        online_users = _bot.usage_service.count_online_users(online_servers)
+        text = messages.ADMIN_DASHBOARD_TEXT.format(online_users=online_users if online_users is not None else "?", **stats)
+        _show_menu(admin_id, text, inline_keyboards.get_dashboard_menu(), message)
+
     def list_all_servers(admin_id, message):
         _bot.edit_message_text(_generate_server_list_text(), admin_id, message.message_id, parse_mode='Markdown', reply_markup=inline_keyboards.get_back_button("admin_server_management"))
 
@@ -123,6 +147,75 @@ def register_admin_handlers(bot_instance, db_manager_instance, xui_api_instance)
         
         _show_menu(admin_id, text, inline_keyboards.get_back_button("admin_user_management"), message)
 
+    def start_search_user_flow(admin_id, message):
+        _clear_admin_state(admin_id)
+        _admin_states[admin_id] = {'state': 'waiting_for_user_search_query', 'prompt_message_id': message.message_id}
+        _bot.edit_message_text(messages.SEARCH_USER_PROMPT, admin_id, message.message_id, reply_markup=inline_keyboards.get_back_button("admin_user_management"))
+
+    def execute_search_user(admin_id, message):
+        prompt_id = _admin_states.get(admin_id, {}).get('prompt_message_id')
+        _clear_admin_state(admin_id)
+        query = message.text.strip()
+        try: _bot.delete_message(admin_id, message.message_id)
+        except Exception: pass
+
+        users = _db_manager.search_users(query, include_archive=True)
+        safe_query = helpers.escape_markdown_v1(query)
+        if not users:
+            text = messages.SEARCH_USER_NO_RESULTS.format(query=safe_query)
+        else:
+            text = messages.SEARCH_USER_RESULTS_HEADER.format(query=safe_query)
+            for user in users:
+                text += messages.SEARCH_USER_RESULT_ITEM.format(
+                    first_name=helpers.escape_markdown_v1(user.get('first_name') or ''),
+                    username=helpers.escape_markdown_v1(user.get('username') or 'N/A'),
+                    telegram_id=user['telegram_id'], id=user['id'],
+                    join_date=str(user.get('join_date') or '')[:10]
+                )
+                if user.get('matched_purchase_id'):
+                    text += messages.SEARCH_USER_MATCHED_PURCHASE.format(purchase_id=user['matched_purchase_id'])
+                text += "---\n"
+        _bot.edit_message_text(text, admin_id, prompt_id, parse_mode='Markdown', reply_markup=inline_keyboards.get_back_button("admin_user_management"))
+
+    def start_broadcast_flow(admin_id, message):
+        _clear_admin_state(admin_id)
+        _admin_states[admin_id] = {'state': 'waiting_for_broadcast_message', 'prompt_message_id': message.message_id}
+        _bot.edit_message_text(messages.BROADCAST_PROMPT, admin_id, message.message_id, reply_markup=inline_keyboards.get_back_button("admin_main_menu"))
+
+    def process_broadcast_message(admin_id, message):
+        content = broadcast_content_from_message(message)
+        if not content:
+            _bot.send_message(admin_id, messages.BROADCAST_UNSUPPORTED); return
+        # پیام ادمین حذف نمی‌شود چون پیام فوروارد شده از همین‌جا برای کاربران فوروارد می‌شود
+        _admin_states[admin_id] = {'state': 'waiting_for_broadcast_confirm', 'data': content}
+        recipients = _db_manager.count_broadcast_recipients()
+        markup = inline_keyboards.get_confirmation_menu("admin_broadcast_confirm", "admin_main_menu")
+        _bot.reply_to(message, messages.BROADCAST_CONFIRM.format(recipients=recipients), parse_mode='Markdown', reply_markup=markup)
+
+    def execute_broadcast(admin_id, message):
+        state_info = _admin_states.get(admin_id, {})
+        _clear_admin_state(admin_id)
+        if state_info.get('state') != 'waiting_for_broadcast_confirm':
+            _show_admin_main_menu(admin_id, message); return
+        broadcast_id = _db_manager.create_broadcast(admin_id, **state_info['data'])
+        if not broadcast_id:
+            _bot.edit_message_text(messages.BROADCAST_CREATE_ERROR, admin_id, message.message_id); return
+        broadcast = _db_manager.get_broadcast(broadcast_id)
+        text = messages.BROADCAST_PROGRESS.format(
+            id=broadcast_id, status=messages.BROADCAST_STATUS_LABELS['queued'], sent=0, failed=0, blocked=0,
+            total=broadcast['total_recipients']
+        )
+        _bot.edit_message_text(text, admin_id, message.message_id, parse_mode='Markdown',
+                               reply_markup=inline_keyboards.get_broadcast_progress_menu(broadcast_id))
+        # پیشرفت ارسال روی همین پیام نمایش داده می‌شود
+        _db_manager.set_broadcast_status_message(broadcast_id, admin_id, message.message_id)
+
+    def cancel_broadcast(admin_id, message, broadcast_id):
+        if _db_manager.update_broadcast_status(broadcast_id, 'cancelled'):
+            _bot.edit_message_text(messages.BROADCAST_CANCELLED.format(id=broadcast_id), admin_id, message.message_id)
+        else:
+            _bot.send_message(admin_id, messages.BROADCAST_NOT_ACTIVE)
+
     def test_all_servers(admin_id, message):
         _bot.edit_message_text(messages.TESTING_ALL_SERVERS, admin_id, message.message_id, reply_markup=None)
         servers = _db_manager.get_all_servers()
@@ -171,7 +264,7 @@ def register_admin_handlers(bot_instance, db_manager_instance, xui_api_instance)
             if not text.isdigit() or not (server := _db_manager.get_server_by_id(int(text))):
                 _bot.edit_message_text(f"{messages.SERVER_NOT_FOUND}\n\n{messages.DELETE_SERVER_PROMPT}", admin_id, prompt_id); return
             confirm_text = messages.DELETE_SERVER_CONFIRM.format(server_name=server['name'], server_id=server['id'])
-            markup = inline_keyboards.get_confirmation_menu(f"confirm_delete_server_{server['id']}", "admin_server_management")
+            markup = inline_keyboards.get_confirmation_menu(callback_data("confirm_delete_server", server['id']), "admin_server_management")
             _bot.edit_message_text(confirm_text, admin_id, prompt_id, reply_markup=markup)
 
         # --- Plan Flows ---
@@ -231,6 +324,10 @@ def register_admin_handlers(bot_instance, db_manager_instance, xui_api_instance)
         elif state == 'waiting_for_server_id_for_inbounds':
             process_manage_inbounds_flow(admin_id, message)
 
+        # --- User Flows ---
+        elif state == 'waiting_for_user_search_query':
+            execute_search_user(admin_id, message)
+
         
     # =============================================================================
     # SECTION: Process Starters and Callback Handlers
@@ -302,26 +399,47 @@ def register_admin_handlers(bot_instance, db_manager_instance, xui_api_instance)
         _clear_admin_state(message.from_user.id)
         _show_admin_main_menu(message.from_user.id)
 
-    @_bot.callback_query_handler(func=lambda call: helpers.is_admin(call.from_user.id))
-    def handle_admin_callbacks(call):
-        """این هندلر تمام کلیک‌های ادمین را به صورت یکپارچه مدیریت می‌کند."""
-        _bot.answer_callback_query(call.id)
-        admin_id, message, data = call.from_user.id, call.message, call.data
+    @_bot.message_handler(commands=['dbstats'])
+    def handle_dbstats_command(message):
+        """آمار زمان‌بندی متدهای دیتابیس را برای ادمین ارسال می‌کند."""
+        if not helpers.is_admin(message.from_user.id):
+            _bot.reply_to(message, messages.NOT_ADMIN_ACCESS); return
+        text = messages.DB_STATS_HEADER.format(backend=_db_manager.backend.name)
+        text += f"```\n{db_stats.format_report()}\n```"
+        _bot.send_message(message.chat.id, text, parse_mode='Markdown')
 
-        # --- بخش اصلاح شده ---
-        # تعریف توابع داخلی برای خوانایی بهتر
-        def list_plans_action(a_id, msg):
-            # پاس دادن صحیح پارامترها به تابع اصلی
-            text = list_all_plans(a_id, msg, return_text=True)
-            _bot.edit_message_text(text, a_id, msg.message_id, parse_mode='Markdown', reply_markup=inline_keyboards.get_back_button("admin_plan_management"))
-
-        def list_gateways_action(a_id, msg):
-            # پاس دادن صحیح پارامترها به تابع اصلی
-            text = list_all_gateways(a_id, msg, return_text=True)
-            _bot.edit_message_text(text, a_id, msg.message_id, parse_mode='Markdown', reply_markup=inline_keyboards.get_back_button("admin_payment_management"))
-        # --- پایان بخش اصلاح شده ---
-
-        actions = {
+    @_bot.message_handler(commands=['queuestats'])
+    def handle_queuestats_command(message):
+        """عمق صف آپدیت‌ها، وضعیت کارگرها و آمار صف ارسال را برای ادمین ارسال می‌کند."""
+        if not helpers.is_admin(message.from_user.id):
+            _bot.reply_to(message, messages.NOT_ADMIN_ACCESS); return
+        update_queue = getattr(_bot, 'update_queue', None)
+        if update_queue is None:
+            _bot.send_message(message.chat.id, messages.QUEUE_STATS_UNAVAILABLE); return
+        stats = {**update_queue.stats(), **_bot.send_scheduler.stats(), **CallbackRouter.for_bot(_bot).throttle.stats()}
+        _bot.send_message(message.chat.id, messages.QUEUE_STATS_TEXT.format(**stats), parse_mode='Markdown')
+
+    def list_plans_action(admin_id, message):
+        text = list_all_plans(admin_id, message, return_text=True)
+        _bot.edit_message_text(text, admin_id, message.message_id, parse_mode='Markdown', reply_markup=inline_keyboards.get_back_button("admin_plan_management"))
+
+    def list_gateways_action(admin_id, message):
+        text = list_all_gateways(admin_id, message, return_text=True)
+        _bot.edit_message_text(text, admin_id, message.message_id, parse_mode='Markdown', reply_markup=inline_keyboards.get_back_button("admin_payment_management"))
+
+    def _register_callback_routes(router):
+        """
+        دکمه‌های ادمین را در مسیریاب ثبت می‌کند. در انتهای register_admin_handlers صدا زده
+        می‌شود تا همه توابع داخلی تعریف شده باشند.
+        """
+        def menu_action(func):
+            # انتخاب یک منو، فرآیند نیمه‌کاره قبلی ادمین را لغو می‌کند
+            def handler(call):
+                _clear_admin_state(call.from_user.id)
+                func(call.from_user.id, call.message)
+            return handler
+
+        menu_actions = {
             "admin_create_backup": create_backup,
             "admin_main_menu": _show_admin_main_menu,
             "admin_server_management": _show_server_management_menu,
@@ -339,29 +457,43 @@ def register_admin_handlers(bot_instance, db_manager_instance, xui_api_instance)
             "admin_list_plans": list_plans_action,
             "admin_list_gateways": list_gateways_action,
             "admin_list_users": list_all_users,
+            "admin_search_user": start_search_user_flow,
             "admin_manage_inbounds": start_manage_inbounds_flow,
+            "admin_broadcast": start_broadcast_flow,
+            "admin_dashboard": show_dashboard,
         }
-        
-        if data in actions:
-            _clear_admin_state(admin_id)
-            actions[data](admin_id, message)
-            return
+        for name, func in menu_actions.items():
+            router.add(name, menu_action(func), admin_only=True)
+
+        router.add("gateway_type", lambda call, gateway_type: handle_gateway_type_selection(call.from_user.id, call.message, gateway_type), str, admin_only=True)
+        router.add("plan_type", lambda call, plan_type: get_plan_details_from_callback(call.from_user.id, call.message, plan_type), str, admin_only=True)
+        router.add("confirm_delete_server", lambda call, server_id: execute_delete_server(call.from_user.id, call.message, server_id), int, admin_only=True)
+        router.add("inbound_toggle", lambda call, server_id, inbound_id, _is_active: handle_inbound_selection(call.from_user.id, call, 'toggle', server_id, inbound_id), int, int, int, admin_only=True)
+        router.add("inbound_select_all", lambda call, server_id: handle_inbound_selection(call.from_user.id, call, 'select_all', server_id), int, admin_only=True)
+        router.add("inbound_deselect_all", lambda call, server_id: handle_inbound_selection(call.from_user.id, call, 'deselect_all', server_id), int, admin_only=True)
+        router.add("inbound_save", lambda call, server_id: handle_inbound_selection(call.from_user.id, call, 'save', server_id), int, admin_only=True)
+        router.add("admin_approve_payment", lambda call, payment_id: process_payment_approval(call.from_user.id, payment_id, call), int, admin_only=True, answer=False)
+        router.add("admin_reject_payment", lambda call, payment_id: process_payment_rejection(call.from_user.id, payment_id, call), int, admin_only=True, answer=False)
+        router.add("admin_retry_provisioning", lambda call, payment_id: process_provisioning_retry(call.from_user.id, payment_id, call), int, admin_only=True, answer=False)
+        router.add("admin_broadcast_confirm", lambda call: execute_broadcast(call.from_user.id, call.message), admin_only=True)
+        router.add("admin_broadcast_cancel", lambda call, broadcast_id: cancel_broadcast(call.from_user.id, call.message, broadcast_id), int, admin_only=True)
+
+        @router.fallback
+        def admin_under_construction(call):
+            # دکمه‌های ادمین که هنوز مسیری برایشان ثبت نشده است
+            if not helpers.is_admin(call.from_user.id):
+                return False
+            _bot.answer_callback_query(call.id)
+            _bot.edit_message_text(messages.UNDER_CONSTRUCTION, call.from_user.id, call.message.message_id, reply_markup=inline_keyboards.get_back_button("admin_main_menu"))
+            return True
+
+    # پیام همگانی می‌تواند عکس هم باشد، پس قبل از هندلر عمومی (فقط متن) ثبت می‌شود
+    @_bot.message_handler(content_types=['text', 'photo'],
+                          func=lambda msg: helpers.is_admin(msg.from_user.id) and
+                          _admin_states.get(msg.from_user.id, {}).get('state') == 'waiting_for_broadcast_message')
+    def handle_broadcast_message(message):
+        process_broadcast_message(message.from_user.id, message)
 
-        # --- هندل کردن موارد پیچیده‌تر ---
-        if data.startswith("gateway_type_"):
-            handle_gateway_type_selection(admin_id, call.message, data.replace('gateway_type_', ''))
-        elif data.startswith("plan_type_"):
-            get_plan_details_from_callback(admin_id, message, data.replace('plan_type_', ''))
-        elif data.startswith("confirm_delete_server_"):
-            execute_delete_server(admin_id, message, int(data.split('_')[-1]))
-        elif data.startswith("inbound_"):
-            handle_inbound_selection(admin_id, call)
-        elif data.startswith("admin_approve_payment_"):
-            process_payment_approval(admin_id, int(data.split('_')[-1]), message)
-        elif data.startswith("admin_reject_payment_"):
-            process_payment_rejection(admin_id, int(data.split('_')[-1]), message)
-        else:
-            _bot.edit_message_text(messages.UNDER_CONSTRUCTION, admin_id, message.message_id, reply_markup=inline_keyboards.get_back_button("admin_main_menu"))
     @_bot.message_handler(func=lambda msg: helpers.is_admin(msg.from_user.id) and _admin_states.get(msg.from_user.id))
     def handle_admin_stateful_messages(message):
         _handle_stateful_message(message.from_user.id, message)
@@ -485,122 +617,68 @@ def register_admin_handlers(bot_instance, db_manager_instance, xui_api_instance)
             _clear_admin_state(admin_id); return
         active_db_inbound_ids = [i['inbound_id'] for i in _db_manager.get_server_inbounds(server_id, only_active=True)]
         state_info['state'] = f'selecting_inbounds_for_{server_id}'
-        state_info['data'] = {'panel_inbounds': panel_inbounds, 'selected_inbound_ids': active_db_inbound_ids}
+        # فقط فیلدهای لازم برای منوی انتخاب نگه داشته می‌شوند، نه کل جواب پنل
+        compact_inbounds = [{'id': i['id'], 'remark': i.get('remark', '')} for i in panel_inbounds]
+        state_info['data'] = {'panel_inbounds': compact_inbounds, 'selected_inbound_ids': active_db_inbound_ids}
         markup = inline_keyboards.get_inbound_selection_menu(server_id, panel_inbounds, active_db_inbound_ids)
         _bot.edit_message_text(messages.SELECT_INBOUNDS_TO_ACTIVATE.format(server_name=server_data['name']), admin_id, prompt_id, reply_markup=markup, parse_mode='Markdown')
 
-    def handle_inbound_selection(admin_id, call):
-        """کلیک روی دکمه‌های کیبورد انتخاب اینباند را به درستی مدیریت می‌کند."""
-        data = call.data
-        parts = data.split('_')
-        action = parts[1]
-
-        state_info = _admin_states.get(admin_id)
-        if not state_info: return
-
-        server_id = None
-        
-        # استخراج server_id بر اساس نوع اکشن
-        if action == 'toggle':
-            # فرمت: inbound_toggle_{server_id}_{inbound_id}
-            if len(parts) == 4:
-                server_id = int(parts[2])
-        else: # برای select, deselect, save
-            # فرمت: inbound_select_all_{server_id}
-            server_id = int(parts[-1])
-
-        if server_id is None or state_info.get('state') != f'selecting_inbounds_for_{server_id}':
+    def process_payment_approval(admin_id, payment_id, call):
+        """
+        پرداخت با یک UPDATE شرطی رزرو و ساخت سرویس به صف کارها سپرده می‌شود؛ پیشرفت کار روی
+        کپشن پیام همه ادمین‌ها نمایش داده می‌شود. کلیک دوباره یا ادمین دوم رزرو را نمی‌گیرد.
+        """
+        if not _processed_callbacks.add(call.id):
             return
+        message = call.message
+        if not _db_manager.claim_payment(payment_id, admin_id):
+            _bot.answer_callback_query(call.id, messages.PAYMENT_ALREADY_PROCESSED, show_alert=True); return
+        job_id = enqueue_payment_provisioning(
+            _db_manager, payment_id, 'admin', admin_id=admin_id,
+            chat_id=message.chat.id, message_id=message.message_id, caption=message.caption
+        )
+        if not job_id:
+            # کار ساخت این پرداخت قبلاً ثبت شده یا ثبت نشد؛ رزرو آزاد می‌شود تا پرداخت قفل نماند
+            _db_manager.release_payment_claim(payment_id)
+            _bot.answer_callback_query(call.id, messages.PAYMENT_ALREADY_PROCESSED, show_alert=True); return
+        _bot.answer_callback_query(call.id)
+        _admin_notifier.update_payment_messages(
+            payment_id, f"{message.caption}\n\n{messages.PROVISIONING_QUEUED_ADMIN}",
+            fallback=(message.chat.id, message.message_id)
+        )
 
-        # دریافت اطلاعات لازم از state
-        selected_ids = state_info['data'].get('selected_inbound_ids', [])
-        panel_inbounds = state_info['data'].get('panel_inbounds', [])
 
-        # انجام عملیات بر اساس اکشن
-        if action == 'toggle':
-            inbound_id_to_toggle = int(parts[3])
-            if inbound_id_to_toggle in selected_ids:
-                selected_ids.remove(inbound_id_to_toggle)
-            else:
-                selected_ids.append(inbound_id_to_toggle)
-        
-        elif action == 'select' and parts[2] == 'all':
-            panel_ids = {p['id'] for p in panel_inbounds}
-            selected_ids.extend([pid for pid in panel_ids if pid not in selected_ids])
-            selected_ids = list(set(selected_ids)) # حذف موارد تکراری
-        
-        elif action == 'deselect' and parts[2] == 'all':
-            selected_ids.clear()
-            
-        elif action == 'save':
-            save_inbound_changes(admin_id, call.message, server_id, selected_ids)
+    def process_provisioning_retry(admin_id, payment_id, call):
+        """
+        ساخت سرویس پرداخت آنلاینی که کار آن شکست نهایی خورده است را دوباره اجرا می‌کند. پرداخت
+        مثل تأیید ادمین رزرو می‌شود تا کلیک دوباره یا ادمین دوم کار تکراری نسازد.
+        """
+        if not _processed_callbacks.add(call.id):
             return
-        
-        # به‌روزرسانی state و کیبورد
-        state_info['data']['selected_inbound_ids'] = selected_ids
-        markup = inline_keyboards.get_inbound_selection_menu(server_id, panel_inbounds, selected_ids)
-        
-        try:
-            _bot.edit_message_reply_markup(chat_id=admin_id, message_id=call.message.message_id, reply_markup=markup)
-        except telebot.apihelper.ApiTelegramException as e:
-            if 'message is not modified' not in e.description:
-                logger.warning(f"Error updating inbound selection keyboard: {e}")
-
-    def process_payment_approval(admin_id, payment_id, message):
-            _bot.edit_message_caption("⏳ در حال ساخت سرویس...", message.chat.id, message.message_id)
-            payment = _db_manager.get_payment_by_id(payment_id)
-            if not payment or payment['is_confirmed']:
-                _bot.answer_callback_query(message.id, "این پرداخت قبلاً پردازش شده است.", show_alert=True); return
-            order_details = json.loads(payment['order_details_json'])
-            user_telegram_id = order_details['user_telegram_id']
-            user_db_id = order_details['user_db_id']
-            
-            if order_details['plan_type'] == 'fixed_monthly':
-                plan = order_details['plan_details']
-                total_gb = plan['volume_gb']
-                duration_days = plan['duration_days']
-                plan_id = plan['id']
-            else: # gigabyte_based
-                gb_plan = order_details['gb_plan_details']
-                total_gb = order_details['requested_gb']
-                duration_days = gb_plan.get('duration_days', 0)
-                plan_id = gb_plan['id']
-                
-            client_details, sub_link, single_configs = _config_generator.create_client_and_configs(user_telegram_id, order_details['server_id'], total_gb, duration_days)
-            if not client_details:
-                _bot.edit_message_caption("❌ خطا در ساخت سرویس در پنل X-UI.", message.chat.id, message.message_id); return
-            
-            expire_date = (datetime.datetime.now() + datetime.timedelta(days=duration_days)) if duration_days and duration_days > 0 else None
-            purchase_id = _db_manager.add_purchase(
-                user_db_id, order_details['server_id'], plan_id,
-                expire_date.strftime("%Y-%m-%d %H:%M:%S") if expire_date else None,
-                total_gb, client_details['uuid'], client_details['email'],
-                client_details['subscription_id'], single_configs
-            )
-            if not purchase_id:
-                _bot.edit_message_caption("❌ خطا در ذخیره خرید در دیتابیس.", message.chat.id, message.message_id); return
-                
-            _db_manager.update_payment_status(payment_id, True, admin_id)
-            admin_user = _bot.get_chat_member(admin_id, admin_id).user
-            new_caption = message.caption + "\n\n" + messages.ADMIN_PAYMENT_CONFIRMED_DISPLAY.format(admin_username=f"@{admin_user.username}" if admin_user.username else admin_user.first_name)
-            _bot.edit_message_caption(new_caption, message.chat.id, message.message_id, parse_mode='Markdown')
-            
-            _bot.send_message(user_telegram_id, messages.SERVICE_ACTIVATION_SUCCESS_USER)
-            
-            # --- بخش اصلاح شده ---
-            # فراخوانی تابع مشترک جدید برای ارسال لینک و QR کد
-            send_subscription_info(_bot, user_telegram_id, sub_link)
-
+        message = call.message
+        if not _db_manager.claim_payment(payment_id):
+            _bot.answer_callback_query(call.id, messages.PROVISIONING_RETRY_FAILED_ADMIN, show_alert=True); return
+        if not retry_payment_provisioning(_db_manager, payment_id):
+            _db_manager.release_payment_claim(payment_id)
+            _bot.answer_callback_query(call.id, messages.PROVISIONING_RETRY_FAILED_ADMIN, show_alert=True); return
+        _bot.answer_callback_query(call.id)
+        _bot.edit_message_text(f"{message.text}\n\n{messages.PROVISIONING_QUEUED_ADMIN}", message.chat.id, message.message_id)
 
 
-    def process_payment_rejection(admin_id, payment_id, message):
+    def process_payment_rejection(admin_id, payment_id, call):
+        if not _processed_callbacks.add(call.id):
+            return
+        message = call.message
+        # رد فقط برای پرداختی که هنوز رزرو نشده انجام می‌شود (UPDATE شرطی روی وضعیت)
+        if not _db_manager.update_payment_status(payment_id, False, admin_id):
+            _bot.answer_callback_query(call.id, messages.PAYMENT_ALREADY_PROCESSED, show_alert=True); return
+        record_payment_outcome('card', 'rejected')
+        _bot.answer_callback_query(call.id)
         payment = _db_manager.get_payment_by_id(payment_id)
-        if not payment or payment['is_confirmed']:
-            _bot.answer_callback_query(message.id, "این پرداخت قبلاً پردازش شده است.", show_alert=True); return
-        _db_manager.update_payment_status(payment_id, False, admin_id)
         admin_user = _bot.get_chat_member(admin_id, admin_id).user
         new_caption = message.caption + "\n\n" + messages.ADMIN_PAYMENT_REJECTED_DISPLAY.format(admin_username=f"@{admin_user.username}" if admin_user.username else admin_user.first_name)
-        _bot.edit_message_caption(new_caption, message.chat.id, message.message_id, parse_mode='Markdown')
+        _admin_notifier.update_payment_messages(payment_id, new_caption, parse_mode='Markdown',
+                                                fallback=(message.chat.id, message.message_id))
         order_details = json.loads(payment['order_details_json'])
         _bot.send_message(order_details['user_telegram_id'], messages.PAYMENT_REJECTED_USER.format(support_link=SUPPORT_CHANNEL_LINK))
         
@@ -674,7 +752,9 @@ def register_admin_handlers(bot_instance, db_manager_instance, xui_api_instance)
         active_db_inbound_ids = [i['inbound_id'] for i in _db_manager.get_server_inbounds(server_id, only_active=True)]
         
         state_info['state'] = f'selecting_inbounds_for_{server_id}'
-        state_info['data'] = {'panel_inbounds': panel_inbounds, 'selected_inbound_ids': active_db_inbound_ids}
+        # فقط فیلدهای لازم برای منوی انتخاب نگه داشته می‌شوند، نه کل جواب پنل
+        compact_inbounds = [{'id': i['id'], 'remark': i.get('remark', '')} for i in panel_inbounds]
+        state_info['data'] = {'panel_inbounds': compact_inbounds, 'selected_inbound_ids': active_db_inbound_ids}
         
         markup = inline_keyboards.get_inbound_selection_menu(server_id, panel_inbounds, active_db_inbound_ids)
         _bot.edit_message_text(messages.SELECT_INBOUNDS_TO_ACTIVATE.format(server_name=server_data['name']), admin_id, prompt_id, reply_markup=markup, parse_mode='Markdown')
@@ -691,35 +771,26 @@ def register_admin_handlers(bot_instance, db_manager_instance, xui_api_instance)
             
         _clear_admin_state(admin_id)
 
-    def handle_inbound_selection(admin_id, call):
-        """با منطق جدید برای خواندن callback_data اصلاح شده است."""
-        data = call.data
-        parts = data.split('_')
-        action = parts[1]
-
+    def handle_inbound_selection(admin_id, call, action, server_id, inbound_id=None):
+        """کلیک روی دکمه‌های کیبورد انتخاب اینباند (toggle, select_all, deselect_all, save) را مدیریت می‌کند."""
         state_info = _admin_states.get(admin_id)
         if not state_info: return
-
-        # استخراج server_id با روشی که برای همه اکشن‌ها کار کند
-        server_id = int(parts[2]) if action == 'toggle' else int(parts[-1])
-            
         if state_info.get('state') != f'selecting_inbounds_for_{server_id}': return
 
         selected_ids = state_info['data'].get('selected_inbound_ids', [])
         panel_inbounds = state_info['data'].get('panel_inbounds', [])
 
         if action == 'toggle':
-            inbound_id_to_toggle = int(parts[3]) # آیدی اینباند همیشه پارامتر چهارم است
-            if inbound_id_to_toggle in selected_ids:
-                selected_ids.remove(inbound_id_to_toggle)
+            if inbound_id in selected_ids:
+                selected_ids.remove(inbound_id)
             else:
-                selected_ids.append(inbound_id_to_toggle)
+                selected_ids.append(inbound_id)
         
-        elif action == 'select' and parts[2] == 'all':
+        elif action == 'select_all':
             panel_ids = {p['id'] for p in panel_inbounds}
             selected_ids.extend([pid for pid in panel_ids if pid not in selected_ids])
         
-        elif action == 'deselect' and parts[2] == 'all':
+        elif action == 'deselect_all':
             selected_ids.clear()
             
         elif action == 'save':
@@ -742,10 +813,12 @@ def register_admin_handlers(bot_instance, db_manager_instance, xui_api_instance)
         
         backup_filename = f"alamor_backup_{datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.zip"
         
-        files_to_backup = [
-            os.path.join(os.getcwd(), '.env'),
-            _db_manager.db_path
-        ]
+        files_to_backup = [os.path.join(os.getcwd(), '.env')]
+        if _db_manager.db_path:
+            files_to_backup.append(_db_manager.db_path)
+        else:
+            # دیتابیس PostgreSQL باید با pg_dump جداگانه پشتیبان‌گیری شود
+            logger.warning(f"Database backend '{_db_manager.backend.name}' is not file-based; only .env is included in the backup.")
         
         try:
             with zipfile.ZipFile(backup_filename, 'w') as zipf:
@@ -781,4 +854,6 @@ def register_admin_handlers(bot_instance, db_manager_instance, xui_api_instance)
             _bot.edit_message_text(messages.ADD_GATEWAY_PROMPT_MERCHANT_ID, admin_id, message.message_id)
         elif gateway_type == 'card_to_card':
             state_info['state'] = 'waiting_for_card_number'
-            _bot.edit_message_text(messages.ADD_GATEWAY_PROMPT_CARD_NUMBER, admin_id, message.message_id)
\ No newline at end of file
+            _bot.edit_message_text(messages.ADD_GATEWAY_PROMPT_CARD_NUMBER, admin_id, message.message_id)
+
+    _register_callback_routes(CallbackRouter.for_bot(_bot))
@@ -0,0 +1,92 @@
+# handlers/common_handlers.py
+
+import telebot
+import logging
+
+from config import REQUIRED_CHANNEL_ID, REQUIRED_CHANNEL_LINK
+from handlers import admin_handlers, user_handlers
+from utils import messages, helpers
+from keyboards import inline_keyboards
+from utils.callback_router import CallbackRouter
+from utils.throttle import create_action_throttle
+from utils.usage_service import create_usage_service
+
+logger = logging.getLogger(__name__)
+
+# انواع آپدیتی که ربات از تلگرام دریافت می‌کند؛ chat_member فقط وقتی ربات ادمین کانال باشد ارسال می‌شود
+ALLOWED_UPDATES = ['message', 'callback_query', 'chat_member']
+
+
+def register_common_handlers(bot: telebot.TeleBot, db_manager):
+    """دستورات عمومی (/start و /myid) و بررسی عضویت کانال را ثبت می‌کند."""
+
+    def needs_channel_join(user_id):
+        return (REQUIRED_CHANNEL_ID and not helpers.is_admin(user_id)
+                and not helpers.is_user_member_of_channel(bot, REQUIRED_CHANNEL_ID, user_id))
+
+    @bot.chat_member_handler(func=lambda update: update.chat.id == REQUIRED_CHANNEL_ID)
+    def handle_channel_membership_change(update):
+        helpers.update_channel_membership(update)
+
+    # این هندلر قبل از هندلرهای ادمین و کاربر ثبت می‌شود تا کلیک‌های کاربران غیرعضو را متوقف کند
+    @bot.callback_query_handler(func=lambda call: needs_channel_join(call.from_user.id))
+    def handle_callback_without_membership(call):
+        bot.answer_callback_query(call.id, messages.REQUIRED_CHANNEL_ALERT, show_alert=True)
+        bot.send_message(call.from_user.id, messages.REQUIRED_CHANNEL_PROMPT.format(channel_link=REQUIRED_CHANNEL_LINK))
+
+    # محدودیت نرخ کلیک‌ها و /start برای هر کاربر
+    throttle = CallbackRouter.for_bot(bot).throttle = create_action_throttle()
+
+    @bot.message_handler(commands=['start'])
+    def send_welcome(message):
+        user_id = message.from_user.id
+        first_name = message.from_user.first_name
+        # /start پشت سر هم بی‌پاسخ می‌ماند تا به نوشتن در دیتابیس و بررسی عضویت تبدیل نشود
+        if not helpers.is_admin(user_id) and not throttle.check(user_id, 'start')[0]:
+            return
+        logger.info(f"Received /start from user ID: {user_id} ({first_name})")
+
+        # ذخیره/به‌روزرسانی کاربر در دیتابیس
+        db_manager.add_or_update_user(
+            telegram_id=user_id,
+            first_name=first_name,
+            last_name=message.from_user.last_name,
+            username=message.from_user.username
+        )
+
+        # بررسی عضویت در کانال
+        if needs_channel_join(user_id):
+            bot.send_message(user_id, messages.REQUIRED_CHANNEL_PROMPT.format(channel_link=REQUIRED_CHANNEL_LINK))
+            logger.info(f"User {user_id} is not a member of the required channel.")
+            return
+
+        # نمایش منوی مناسب
+        if helpers.is_admin(user_id):
+            bot.send_message(user_id, messages.ADMIN_WELCOME, reply_markup=inline_keyboards.get_admin_main_inline_menu())
+        else:
+            welcome_text = messages.START_WELCOME.format(first_name=helpers.escape_markdown_v1(first_name))
+            bot.send_message(user_id, welcome_text, parse_mode='Markdown', reply_markup=inline_keyboards.get_user_main_inline_menu())
+
+    @bot.message_handler(commands=['myid'])
+    def send_user_id(message):
+        user_id = message.from_user.id
+        bot.reply_to(message, f"آیدی عددی شما:\n`{user_id}`", parse_mode='Markdown')
+
+
+def register_all_handlers(bot: telebot.TeleBot, db_manager, xui_api_class):
+    """
+    همه هندلرهای ربات را به ترتیب درست ثبت می‌کند. هم حالت polling (main.py) و هم
+    حالت وب‌هوک (webhook_server.py) از همین تابع استفاده می‌کنند.
+    """
+    # دستورات عمومی باید قبل از هندلرهای وضعیت ثبت شوند تا /start همیشه کار کند
+    register_common_handlers(bot, db_manager)
+
+    # خواندن مصرف و کاربران متصل از پنل‌ها (کش و سشن پنل‌ها بین بخش کاربر و ادمین مشترک است)
+    bot.usage_service = create_usage_service(db_manager, xui_api_class)
+
+    # XUI API Client به صورت موقت در هر تابع ساخته می‌شود، پس کلاس آن پاس داده می‌شود
+    admin_handlers.register_admin_handlers(bot, db_manager, xui_api_class)
+    logger.info("Admin handlers registered.")
+
+    user_handlers.register_user_handlers(bot, db_manager, xui_api_class)
+    logger.info("User handlers registered.")
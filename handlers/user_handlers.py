@@ -2,18 +2,22 @@ import telebot
 from telebot import types
 import logging
 import json
-import qrcode
-from io import BytesIO
 import requests
 from config import SUPPORT_CHANNEL_LINK, ADMIN_IDS
 from database.db_manager import DatabaseManager
 from api_client.xui_api_client import XuiAPIClient
 from utils import messages, helpers
 from keyboards import inline_keyboards
+from keyboards.markup_cache import catalog_markups
 from utils.config_generator import ConfigGenerator
 from utils.helpers import is_float_or_int , escape_markdown_v1
 from utils.bot_helpers import send_subscription_info # این ایمپورت جدید است
-from config import ZARINPAL_MERCHANT_ID, WEBHOOK_DOMAIN , ZARINPAL_SANDBOX
+from utils.qr_service import qr_service
+from utils.state_store import StateStore, create_state_store
+from utils.usage_service import UsageService
+from utils.admin_notifier import enqueue_admin_payment_notification
+from utils.callback_router import CallbackRouter, callback_data
+from config import ZARINPAL_MERCHANT_ID, WEBHOOK_DOMAIN , ZARINPAL_SANDBOX, ZARINPAL_API_URL, ZARINPAL_STARTPAY_URL
 
 logger = logging.getLogger(__name__)
 
@@ -22,87 +26,25 @@ _bot: telebot.TeleBot = None
 _db_manager: DatabaseManager = None
 _xui_api: XuiAPIClient = None
 _config_generator: ConfigGenerator = None
+_usage_service: UsageService = None
 
 # متغیرهای وضعیت
 _user_menu_message_ids = {} # {user_id: message_id}
-_user_states = {} # {user_id: {'state': '...', 'data': {...}}}
+_user_states: StateStore = None # {user_id: {'state': '...', 'data': {...}}}
 
 
-
-ZARINPAL_API_URL = "https://api.zarinpal.com/pg/v4/payment/request.json"
-ZARINPAL_STARTPAY_URL = "https://www.zarinpal.com/pg/StartPay/"
-
 def register_user_handlers(bot_instance, db_manager_instance, xui_api_instance):
-    global _bot, _db_manager, _xui_api, _config_generator
+    global _bot, _db_manager, _xui_api, _config_generator, _user_states, _usage_service
     _bot = bot_instance
     _db_manager = db_manager_instance
     _xui_api = xui_api_instance
     _config_generator = ConfigGenerator(_xui_api, _db_manager)
+    _user_states = create_state_store('user', _db_manager)
+    # سرویس مصرف بین هندلرهای کاربر و ادمین مشترک است (register_all_handlers)
+    _usage_service = _bot.usage_service
 
     # --- هندلرهای اصلی ---
-    @_bot.callback_query_handler(func=lambda call: not call.from_user.is_bot and call.data.startswith('user_'))
-    def handle_main_callbacks(call):
-        """هندل کردن دکمه‌های منوی اصلی کاربر"""
-        user_id = call.from_user.id
-        _bot.answer_callback_query(call.id)
-        
-        # فقط در صورتی وضعیت را پاک کن که یک آیتم از منوی اصلی انتخاب شده باشد
-        if call.data in ["user_main_menu", "user_buy_service", "user_my_services", "user_free_test", "user_support"]:
-            _clear_user_state(user_id)
-
-        data = call.data
-        if data == "user_main_menu":
-            _show_user_main_menu(user_id, message_to_edit=call.message)
-        elif data == "user_buy_service":
-            start_purchase(user_id, call.message)
-        elif data == "user_my_services":
-            show_my_services_list(user_id, call.message)
-        
-        # --- بخش اصلاح شده ---
-        elif data == "user_free_test":
-            # اکنون تابع ساخت اکانت تست فراخوانی می‌شود
-            handle_free_test_request(user_id, call.message)
-        # --- پایان بخش اصلاح شده ---
-
-        elif data == "user_support":
-            _bot.edit_message_text(f"📞 برای پشتیبانی با ما در ارتباط باشید: {SUPPORT_CHANNEL_LINK}", user_id, call.message.message_id)
-        elif data.startswith("user_service_details_"):
-            purchase_id = int(data.replace("user_service_details_", ""))
-            show_service_details(user_id, purchase_id, call.message)
-        elif data.startswith("user_get_single_configs_"):
-            purchase_id = int(data.replace("user_get_single_configs_", ""))
-            send_single_configs(user_id, purchase_id)
-    @_bot.callback_query_handler(func=lambda call: not call.from_user.is_bot and call.data.startswith(('buy_', 'select_', 'confirm_', 'cancel_')))
-    def handle_purchase_callbacks(call):
-        """هندل کردن دکمه‌های فرآیند خرید"""
-        _bot.answer_callback_query(call.id)
-        user_id = call.from_user.id
-        data = call.data
-        
-        # پاک کردن پیام قبلی
-        try:
-            _bot.edit_message_reply_markup(user_id, call.message.message_id, reply_markup=None)
-        except Exception:
-            pass
-
-        if data.startswith("buy_select_server_"):
-            server_id = int(data.replace("buy_select_server_", ""))
-            select_server_for_purchase(user_id, server_id, call.message)
-        elif data.startswith("buy_plan_type_"):
-            select_plan_type(user_id, data.replace("buy_plan_type_", ""), call.message)
-        elif data.startswith("buy_select_plan_"):
-            plan_id = int(data.replace("buy_select_plan_", ""))
-            select_fixed_plan(user_id, plan_id, call.message)
-        elif data == "confirm_and_pay":
-            display_payment_gateways(user_id, call.message)
-        elif data.startswith("select_gateway_"):
-            gateway_id = int(data.replace("select_gateway_", ""))
-            select_payment_gateway(user_id, gateway_id, call.message)
-        elif data == "cancel_order":
-            _clear_user_state(user_id)
-            _bot.edit_message_text(messages.ORDER_CANCELED, user_id, call.message.message_id, reply_markup=inline_keyboards.get_back_button("user_main_menu"))
-
-
+    # کلیک دکمه‌ها از طریق CallbackRouter (انتهای همین تابع) به توابع زیر می‌رسند
     @_bot.message_handler(content_types=['text', 'photo'], func=lambda msg: _user_states.get(msg.from_user.id))
     def handle_stateful_messages(message):
         """هندل کردن پیام‌های متنی یا عکسی که کاربر در یک وضعیت خاص ارسال می‌کند"""
@@ -139,38 +81,47 @@ def register_user_handlers(bot_instance, db_manager_instance, xui_api_instance):
             _bot.send_message(user_id, menu_text, reply_markup=menu_markup)
 
     # --- فرآیند خرید ---
-    def start_purchase(user_id, message):
+    def _build_server_selection_menu():
         active_servers = [s for s in _db_manager.get_all_servers() if s['is_active'] and s['is_online']]
-        if not active_servers:
+        return inline_keyboards.get_server_selection_menu(active_servers) if active_servers else None
+
+    def start_purchase(user_id, message):
+        # منوی سرورها تا تغییر بعدی کاتالوگ سرورها از کش خوانده می‌شود
+        markup = catalog_markups.get(_db_manager, 'servers', 'user_server_selection', _build_server_selection_menu)
+        if markup is None:
             _bot.edit_message_text(messages.NO_ACTIVE_SERVERS_FOR_BUY, user_id, message.message_id, reply_markup=inline_keyboards.get_back_button("user_main_menu"))
             return
         
         _user_states[user_id] = {'state': 'selecting_server', 'data': {}}
-        _bot.edit_message_text(messages.SELECT_SERVER_PROMPT, user_id, message.message_id, reply_markup=inline_keyboards.get_server_selection_menu(active_servers))
+        _bot.edit_message_text(messages.SELECT_SERVER_PROMPT, user_id, message.message_id, reply_markup=markup)
 
     def select_server_for_purchase(user_id, server_id, message):
         _user_states[user_id]['data']['server_id'] = server_id
         _user_states[user_id]['state'] = 'selecting_plan_type'
         _bot.edit_message_text(messages.SELECT_PLAN_TYPE_PROMPT_USER, user_id, message.message_id, reply_markup=inline_keyboards.get_plan_type_selection_menu_user(server_id))
     
+    def _build_fixed_plan_selection_menu():
+        active_plans = [p for p in _db_manager.get_all_plans(only_active=True) if p['plan_type'] == 'fixed_monthly']
+        return inline_keyboards.get_fixed_plan_selection_menu(active_plans) if active_plans else None
+
     def select_plan_type(user_id, plan_type, message):
         _user_states[user_id]['data']['plan_type'] = plan_type
         if plan_type == 'fixed_monthly':
-            active_plans = [p for p in _db_manager.get_all_plans(only_active=True) if p['plan_type'] == 'fixed_monthly']
-            if not active_plans:
-                _bot.edit_message_text(messages.NO_FIXED_PLANS_AVAILABLE, user_id, message.message_id, reply_markup=inline_keyboards.get_back_button(f"buy_select_server_{_user_states[user_id]['data']['server_id']}"))
+            markup = catalog_markups.get(_db_manager, 'plans', 'user_fixed_plan_selection', _build_fixed_plan_selection_menu)
+            if markup is None:
+                _bot.edit_message_text(messages.NO_FIXED_PLANS_AVAILABLE, user_id, message.message_id, reply_markup=inline_keyboards.get_back_button(callback_data("buy_select_server", _user_states[user_id]['data']['server_id'])))
                 return
             _user_states[user_id]['state'] = 'selecting_fixed_plan'
-            _bot.edit_message_text(messages.SELECT_FIXED_PLAN_PROMPT, user_id, message.message_id, reply_markup=inline_keyboards.get_fixed_plan_selection_menu(active_plans))
+            _bot.edit_message_text(messages.SELECT_FIXED_PLAN_PROMPT, user_id, message.message_id, reply_markup=markup)
         
         elif plan_type == 'gigabyte_based':
             gb_plan = next((p for p in _db_manager.get_all_plans(only_active=True) if p['plan_type'] == 'gigabyte_based'), None)
             if not gb_plan or not gb_plan.get('per_gb_price'):
-                _bot.edit_message_text(messages.GIGABYTE_PLAN_NOT_CONFIGURED, user_id, message.message_id, reply_markup=inline_keyboards.get_back_button(f"buy_select_server_{_user_states[user_id]['data']['server_id']}"))
+                _bot.edit_message_text(messages.GIGABYTE_PLAN_NOT_CONFIGURED, user_id, message.message_id, reply_markup=inline_keyboards.get_back_button(callback_data("buy_select_server", _user_states[user_id]['data']['server_id'])))
                 return
             _user_states[user_id]['data']['gb_plan_details'] = gb_plan
             _user_states[user_id]['state'] = 'waiting_for_gigabytes_input'
-            sent_msg = _bot.edit_message_text(messages.ENTER_GIGABYTES_PROMPT, user_id, message.message_id, reply_markup=inline_keyboards.get_back_button(f"buy_select_server_{_user_states[user_id]['data']['server_id']}"))
+            sent_msg = _bot.edit_message_text(messages.ENTER_GIGABYTES_PROMPT, user_id, message.message_id, reply_markup=inline_keyboards.get_back_button(callback_data("buy_select_server", _user_states[user_id]['data']['server_id'])))
             _user_states[user_id]['prompt_message_id'] = sent_msg.message_id
 
     def select_fixed_plan(user_id, plan_id, message):
@@ -230,14 +181,18 @@ def register_user_handlers(bot_instance, db_manager_instance, xui_api_instance):
         _bot.edit_message_text(summary_text, user_id, prompt_id, reply_markup=inline_keyboards.get_order_confirmation_menu())
 
     # --- فرآیند پرداخت ---
+    def _build_payment_gateway_selection_menu():
+        active_gateways = _db_manager.get_all_payment_gateways(only_active=True)
+        return inline_keyboards.get_payment_gateway_selection_menu(active_gateways) if active_gateways else None
+
     def display_payment_gateways(user_id, message):
         _user_states[user_id]['state'] = 'selecting_gateway'
-        active_gateways = _db_manager.get_all_payment_gateways(only_active=True)
-        if not active_gateways:
+        markup = catalog_markups.get(_db_manager, 'gateways', 'user_gateway_selection', _build_payment_gateway_selection_menu)
+        if markup is None:
             _bot.edit_message_text(messages.NO_ACTIVE_PAYMENT_GATEWAYS, user_id, message.message_id, reply_markup=inline_keyboards.get_back_button("show_order_summary"))
             return
         
-        _bot.edit_message_text(messages.SELECT_PAYMENT_GATEWAY_PROMPT, user_id, message.message_id, reply_markup=inline_keyboards.get_payment_gateway_selection_menu(active_gateways))
+        _bot.edit_message_text(messages.SELECT_PAYMENT_GATEWAY_PROMPT, user_id, message.message_id, reply_markup=markup)
         
     def select_payment_gateway(user_id, gateway_id, message):
         gateway = _db_manager.get_payment_gateway_by_id(gateway_id)
@@ -375,9 +330,7 @@ def register_user_handlers(bot_instance, db_manager_instance, xui_api_instance):
             _clear_user_state(user_id)
             return
 
-        # --- بخش جدید: ارسال نوتیفیکیشن به ادمین‌ها مستقیماً از اینجا ---
-        from config import ADMIN_IDS # ایمپورت لیست ادمین‌ها
-
+        # --- بخش جدید: ارسال نوتیفیکیشن به ادمین‌ها ---
         caption = messages.ADMIN_NEW_PAYMENT_NOTIFICATION_DETAILS.format(
             user_first_name=helpers.escape_markdown_v1(order_details_for_db['user_first_name']),
             user_telegram_id=order_details_for_db['user_telegram_id'],
@@ -386,23 +339,11 @@ def register_user_handlers(bot_instance, db_manager_instance, xui_api_instance):
             plan_details=helpers.escape_markdown_v1(order_details_for_db['plan_details_text_display']),
             gateway_name=helpers.escape_markdown_v1(order_details_for_db['gateway_name'])
         )
-        markup = inline_keyboards.get_admin_payment_action_menu(payment_id)
-        
-        # ارسال پیام به تمام ادمین‌ها
-        for admin_id in ADMIN_IDS:
-            try:
-                sent_msg = _bot.send_photo(
-                    admin_id,
-                    order_details_for_db['receipt_file_id'],
-                    caption=messages.ADMIN_NEW_PAYMENT_NOTIFICATION_HEADER + caption,
-                    parse_mode='Markdown',
-                    reply_markup=markup
-                )
-                # آیدی پیام ارسال شده به اولین ادمین را برای ویرایش‌های بعدی ذخیره می‌کنیم
-                if admin_id == ADMIN_IDS[0]:
-                    _db_manager.update_payment_admin_notification_id(payment_id, sent_msg.message_id)
-            except Exception as e:
-                logger.error(f"Failed to send payment notification to admin {admin_id}: {e}")
+        # ارسال هم‌زمان رسید برای همه ادمین‌ها در پس‌زمینه انجام می‌شود تا کاربر منتظر نماند
+        enqueue_admin_payment_notification(
+            _db_manager, payment_id, order_details_for_db['receipt_file_id'],
+            messages.ADMIN_NEW_PAYMENT_NOTIFICATION_HEADER + caption
+        )
         # --- پایان بخش جدید ---
 
         _bot.send_message(user_id, messages.RECEIPT_RECEIVED_USER)
@@ -410,6 +351,25 @@ def register_user_handlers(bot_instance, db_manager_instance, xui_api_instance):
         _show_user_main_menu(user_id)
 
     # --- سرویس‌های من ---
+    def _format_usage(purchase, usage):
+        if usage is None:
+            return messages.SERVICE_USAGE_UNAVAILABLE
+        if usage['expiry_time']:
+            expire_date = usage['expiry_time'].strftime("%Y-%m-%d %H:%M")
+        else:
+            expire_date = purchase['expire_date'][:10] if purchase.get('expire_date') else messages.USAGE_UNLIMITED
+        if not usage['enabled']:
+            status = messages.USAGE_STATUS_DISABLED
+        else:
+            status = messages.USAGE_STATUS_ONLINE if usage['online'] else messages.USAGE_STATUS_OFFLINE
+        remaining = usage['remaining_bytes']
+        return messages.SERVICE_USAGE_DETAILS.format(
+            used=helpers.format_bytes(usage['used_bytes']),
+            remaining=helpers.format_bytes(remaining) if remaining is not None else messages.USAGE_UNLIMITED,
+            expire_date=expire_date,
+            status=status
+        )
+
     def show_service_details(user_id, purchase_id, message):
         purchase = _db_manager.get_purchase_by_id(purchase_id)
         if not purchase:
@@ -427,11 +387,12 @@ def register_user_handlers(bot_instance, db_manager_instance, xui_api_instance):
             # --- بخش اصلاح شده ---
             # فراخوانی escape_markdown_v1 از اینجا نیز حذف شد
             text = messages.CONFIG_DELIVERY_HEADER + \
-                messages.CONFIG_DELIVERY_SUB_LINK.format(sub_link=sub_link)
+                messages.CONFIG_DELIVERY_SUB_LINK.format(sub_link=sub_link) + \
+                _format_usage(purchase, _usage_service.get_usage(purchase))
             
             # ساخت کیبورد با دکمه‌های بازگشت و دریافت کانفیگ تکی
             markup = types.InlineKeyboardMarkup()
-            btn_single_configs = types.InlineKeyboardButton(messages.GET_SINGLE_CONFIGS_BUTTON, callback_data=f"user_get_single_configs_{purchase_id}")
+            btn_single_configs = types.InlineKeyboardButton(messages.GET_SINGLE_CONFIGS_BUTTON, callback_data=callback_data("user_get_single_configs", purchase_id))
             btn_back = types.InlineKeyboardButton("🔙 بازگشت به سرویس‌ها", callback_data="user_my_services")
             markup.add(btn_single_configs)
             markup.add(btn_back)
@@ -440,25 +401,18 @@ def register_user_handlers(bot_instance, db_manager_instance, xui_api_instance):
             
             # ارسال QR کد به صورت یک پیام جدید
             try:
-                import qrcode
-                from io import BytesIO
-                qr_image = qrcode.make(sub_link)
-                bio = BytesIO()
-                bio.name = 'qrcode.jpeg'
-                qr_image.save(bio, 'JPEG')
-                bio.seek(0)
-                _bot.send_photo(user_id, bio, caption=messages.QR_CODE_CAPTION)
+                qr_service.send(_bot, user_id, sub_link, caption=messages.QR_CODE_CAPTION)
             except Exception as e:
                 logger.error(f"Failed to generate or send QR code in service details: {e}")
         else:
             _bot.edit_message_text(messages.OPERATION_FAILED, user_id, message.message_id)
     def send_single_configs(user_id, purchase_id):
-        purchase = _db_manager.get_purchase_by_id(purchase_id)
-        if not purchase or not purchase['single_configs_json']:
+        # کانفیگ‌ها فقط هنگام درخواست کاربر از جدول purchase_configs خوانده می‌شوند
+        configs = _db_manager.get_purchase_configs(purchase_id)
+        if not configs:
             _bot.send_message(user_id, messages.NO_SINGLE_CONFIGS_AVAILABLE)
             return
             
-        configs = purchase['single_configs_json']
         text = messages.SINGLE_CONFIG_HEADER
         for config in configs:
             text += f"**{config['remark']} ({config['protocol']}/{config['network']})**:\n`{config['url']}`\n\n"
@@ -544,27 +498,10 @@ def register_user_handlers(bot_instance, db_manager_instance, xui_api_instance):
             _db_manager.record_free_test_usage(user_db_info['id'])
             _bot.delete_message(user_id, message.message_id)
             _bot.send_message(user_id, messages.GET_FREE_TEST_SUCCESS)
-            send_subscription_info(user_id, sub_link)
+            send_subscription_info(_bot, user_id, sub_link)
         else:
             _bot.edit_message_text(messages.OPERATION_FAILED, user_id, message.message_id)
 
-    # تابع جدید برای ارسال لینک و QR کد
-    def send_subscription_info(user_id, sub_link):
-        _bot.send_message(user_id, messages.CONFIG_DELIVERY_HEADER, parse_mode='Markdown')
-        
-        # Create QR Code in memory
-        qr_image = qrcode.make(sub_link)
-        bio = BytesIO()
-        bio.name = 'qrcode.jpeg'
-        qr_image.save(bio, 'JPEG')
-        bio.seek(0)
-
-        # Send QR Code
-        _bot.send_photo(user_id, bio, caption=messages.QR_CODE_CAPTION)
-        
-        # Send Subscription Link
-        _bot.send_message(user_id, messages.CONFIG_DELIVERY_SUB_LINK.format(sub_link=sub_link), parse_mode='Markdown')
-
     def show_my_services_list(user_id, message):
         user_db_info = _db_manager.get_user_by_telegram_id(user_id)
         if not user_db_info:
@@ -572,6 +509,8 @@ def register_user_handlers(bot_instance, db_manager_instance, xui_api_instance):
             return
 
         purchases = _db_manager.get_user_purchases(user_db_info['id'])
+        # مصرف همه سرویس‌های فعال از همین حالا (هم‌زمان برای همه سرورها) خوانده می‌شود تا صفحه جزئیات منتظر پنل نماند
+        _usage_service.prefetch([p for p in purchases if p['is_active']])
         
         _bot.edit_message_text(
             messages.MY_SERVICES_HEADER,
@@ -579,4 +518,92 @@ def register_user_handlers(bot_instance, db_manager_instance, xui_api_instance):
             message.message_id,
             reply_markup=inline_keyboards.get_my_services_menu(purchases),
             parse_mode='Markdown'
-        )
\ No newline at end of file
+        )
+
+    def _register_callback_routes(router):
+        """دکمه‌های منوی کاربر و فرآیند خرید را در مسیریاب ثبت می‌کند."""
+        def menu_route(name):
+            # انتخاب یک آیتم از منوی اصلی، وضعیت قبلی کاربر را پاک می‌کند
+            def decorator(handler):
+                def wrapper(call, *args):
+                    _clear_user_state(call.from_user.id)
+                    handler(call, *args)
+                router.add(name, wrapper)
+                return handler
+            return decorator
+
+        def purchase_route(name, *arg_types):
+            # دکمه‌های پیام قبلی خرید حذف می‌شوند تا دوباره کلیک نشوند
+            def decorator(handler):
+                def wrapper(call, *args):
+                    try:
+                        _bot.edit_message_reply_markup(call.from_user.id, call.message.message_id, reply_markup=None)
+                    except Exception:
+                        pass
+                    handler(call, *args)
+                router.add(name, wrapper, *arg_types)
+                return handler
+            return decorator
+
+        @menu_route("user_main_menu")
+        def on_main_menu(call):
+            _show_user_main_menu(call.from_user.id, message_to_edit=call.message)
+
+        @menu_route("user_buy_service")
+        def on_buy_service(call):
+            start_purchase(call.from_user.id, call.message)
+
+        @menu_route("user_my_services")
+        def on_my_services(call):
+            show_my_services_list(call.from_user.id, call.message)
+
+        @menu_route("user_free_test")
+        def on_free_test(call):
+            handle_free_test_request(call.from_user.id, call.message)
+
+        @menu_route("user_support")
+        def on_support(call):
+            _bot.edit_message_text(f"📞 برای پشتیبانی با ما در ارتباط باشید: {SUPPORT_CHANNEL_LINK}", call.from_user.id, call.message.message_id)
+
+        router.add("user_service_details", lambda call, purchase_id: show_service_details(call.from_user.id, purchase_id, call.message), int)
+        router.add("user_get_single_configs", lambda call, purchase_id: send_single_configs(call.from_user.id, purchase_id), int)
+
+        @purchase_route("buy_select_server", int)
+        def on_select_server(call, server_id):
+            select_server_for_purchase(call.from_user.id, server_id, call.message)
+
+        @purchase_route("buy_plan_type", str)
+        def on_plan_type(call, plan_type):
+            select_plan_type(call.from_user.id, plan_type, call.message)
+
+        @purchase_route("buy_select_plan", int)
+        def on_select_plan(call, plan_id):
+            select_fixed_plan(call.from_user.id, plan_id, call.message)
+
+        @purchase_route("confirm_and_pay")
+        def on_confirm_and_pay(call):
+            display_payment_gateways(call.from_user.id, call.message)
+
+        @purchase_route("select_gateway", int)
+        def on_select_gateway(call, gateway_id):
+            select_payment_gateway(call.from_user.id, gateway_id, call.message)
+
+        @purchase_route("show_order_summary")
+        def on_show_order_summary(call):
+            user_id = call.from_user.id
+            state_info = _user_states.get(user_id)
+            if not state_info or 'plan_type' not in state_info.get('data', {}):
+                _show_user_main_menu(user_id, message_to_edit=call.message)
+                return
+            # خلاصه سفارش روی همین پیام نمایش داده می‌شود
+            state_info['prompt_message_id'] = call.message.message_id
+            _user_states[user_id] = state_info
+            show_order_summary(user_id, call.message)
+
+        @purchase_route("cancel_order")
+        def on_cancel_order(call):
+            user_id = call.from_user.id
+            _clear_user_state(user_id)
+            _bot.edit_message_text(messages.ORDER_CANCELED, user_id, call.message.message_id, reply_markup=inline_keyboards.get_back_button("user_main_menu"))
+
+    _register_callback_routes(CallbackRouter.for_bot(_bot))
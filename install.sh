@@ -42,9 +42,11 @@ setup_database() {
     sudo -u postgres psql -c "CREATE DATABASE $db_name;"
     sudo -u postgres psql -c "CREATE USER $db_user WITH PASSWORD '$db_password';"
     sudo -u postgres psql -c "GRANT ALL PRIVILEGES ON DATABASE $db_name TO $db_user;"
+    sudo -u postgres psql -c "ALTER DATABASE $db_name OWNER TO $db_user;"
     
     # Save credentials to the .env file
     echo -e "\n# --- PostgreSQL Database Settings ---" >> .env
+    echo "DB_ENGINE_ALAMOR=\"postgres\"" >> .env
     echo "DB_NAME=\"$db_name\"" >> .env
     echo "DB_USER=\"$db_user\"" >> .env
     echo "DB_PASSWORD=\"$db_password\"" >> .env
@@ -216,9 +218,11 @@ After=network.target
 [Service]
 User=root
 WorkingDirectory=$INSTALL_DIR
-ExecStart=$INSTALL_DIR/.venv/bin/python3 $INSTALL_DIR/webhook_server.py
+ExecStart=$INSTALL_DIR/.venv/bin/gunicorn -c $INSTALL_DIR/gunicorn.conf.py wsgi:app
 Restart=always
 RestartSec=10s
+KillSignal=SIGTERM
+TimeoutStopSec=60s
 [Install]
 WantedBy=multi-user.target
 EOL
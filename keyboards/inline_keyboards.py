@@ -3,10 +3,14 @@
 from telebot import types
 import logging
 
+from utils.callback_router import CallbackRouter
+from keyboards.markup_cache import static_markup
+
 logger = logging.getLogger(__name__)
 
 # --- توابع کیبورد ادمین ---
 
+@static_markup
 def get_admin_main_inline_menu():
     markup = types.InlineKeyboardMarkup(row_width=2)
     markup.add(
@@ -15,10 +19,26 @@ def get_admin_main_inline_menu():
         types.InlineKeyboardButton("💳 مدیریت درگاه‌ها", callback_data="admin_payment_management"),
         types.InlineKeyboardButton("👥 مدیریت کاربران", callback_data="admin_user_management"),
         types.InlineKeyboardButton("📊 داشبورد", callback_data="admin_dashboard"),
+        types.InlineKeyboardButton("📣 پیام همگانی", callback_data="admin_broadcast"),
         types.InlineKeyboardButton("🗄 تهیه نسخه پشتیبان", callback_data="admin_create_backup")
     )
     return markup
 
+def get_broadcast_progress_menu(broadcast_id):
+    markup = types.InlineKeyboardMarkup(row_width=1)
+    markup.add(types.InlineKeyboardButton("⛔ توقف ارسال", callback_data=CallbackRouter.build("admin_broadcast_cancel", broadcast_id)))
+    return markup
+
+@static_markup
+def get_dashboard_menu():
+    markup = types.InlineKeyboardMarkup(row_width=2)
+    markup.add(
+        types.InlineKeyboardButton("🔄 به‌روزرسانی", callback_data="admin_dashboard"),
+        types.InlineKeyboardButton("🔙 بازگشت", callback_data="admin_main_menu")
+    )
+    return markup
+
+@static_markup
 def get_server_management_inline_menu():
     markup = types.InlineKeyboardMarkup(row_width=2)
     markup.add(
@@ -31,6 +51,7 @@ def get_server_management_inline_menu():
     )
     return markup
     
+@static_markup
 def get_plan_management_inline_menu():
     markup = types.InlineKeyboardMarkup(row_width=2)
     markup.add(
@@ -41,6 +62,7 @@ def get_plan_management_inline_menu():
     )
     return markup
 
+@static_markup
 def get_payment_gateway_management_inline_menu():
     markup = types.InlineKeyboardMarkup(row_width=2)
     markup.add(
@@ -51,6 +73,7 @@ def get_payment_gateway_management_inline_menu():
     )
     return markup
     
+@static_markup
 def get_user_management_inline_menu():
     markup = types.InlineKeyboardMarkup(row_width=1)
     markup.add(
@@ -60,19 +83,21 @@ def get_user_management_inline_menu():
     )
     return markup
 
+@static_markup
 def get_plan_type_selection_menu_admin():
     markup = types.InlineKeyboardMarkup(row_width=2)
     markup.add(
-        types.InlineKeyboardButton("ماهانه (Fixed)", callback_data="plan_type_fixed_monthly"),
-        types.InlineKeyboardButton("حجمی (Gigabyte)", callback_data="plan_type_gigabyte_based"),
+        types.InlineKeyboardButton("ماهانه (Fixed)", callback_data=CallbackRouter.build("plan_type", "fixed_monthly")),
+        types.InlineKeyboardButton("حجمی (Gigabyte)", callback_data=CallbackRouter.build("plan_type", "gigabyte_based")),
         types.InlineKeyboardButton("🔙 انصراف", callback_data="admin_plan_management")
     )
     return markup
     
+@static_markup
 def get_gateway_type_selection_menu():
     markup = types.InlineKeyboardMarkup(row_width=1)
     markup.add(
-        types.InlineKeyboardButton("💳 کارت به کارت", callback_data="gateway_type_card_to_card"),
+        types.InlineKeyboardButton("💳 کارت به کارت", callback_data=CallbackRouter.build("gateway_type", "card_to_card")),
         types.InlineKeyboardButton("🔙 انصراف", callback_data="admin_payment_management")
     )
     return markup
@@ -83,8 +108,8 @@ def get_inbound_selection_menu(server_id: int, panel_inbounds: list, active_inbo
     """
     markup = types.InlineKeyboardMarkup(row_width=2)
     markup.add(
-        types.InlineKeyboardButton("✅ انتخاب همه", callback_data=f"inbound_select_all_{server_id}"),
-        types.InlineKeyboardButton("⬜️ لغو انتخاب همه", callback_data=f"inbound_deselect_all_{server_id}")
+        types.InlineKeyboardButton("✅ انتخاب همه", callback_data=CallbackRouter.build("inbound_select_all", server_id)),
+        types.InlineKeyboardButton("⬜️ لغو انتخاب همه", callback_data=CallbackRouter.build("inbound_deselect_all", server_id))
     )
 
     for inbound in panel_inbounds:
@@ -96,13 +121,13 @@ def get_inbound_selection_menu(server_id: int, panel_inbounds: list, active_inbo
         # --- ترفند اصلی ---
         # یک پارامتر اضافی (is_active) به callback_data اضافه می‌کنیم
         # این باعث می‌شود callback_data در هر حالت (فعال/غیرفعال) متفاوت باشد
-        callback_data = f"inbound_toggle_{server_id}_{inbound_id}_{1 if is_active else 0}"
+        callback_data = CallbackRouter.build("inbound_toggle", server_id, inbound_id, is_active)
         
         markup.add(types.InlineKeyboardButton(button_text, callback_data=callback_data))
         
     markup.add(
         types.InlineKeyboardButton("🔙 بازگشت", callback_data="admin_server_management"),
-        types.InlineKeyboardButton("✔️ ثبت تغییرات", callback_data=f"inbound_save_{server_id}")
+        types.InlineKeyboardButton("✔️ ثبت تغییرات", callback_data=CallbackRouter.build("inbound_save", server_id))
     )
     return markup
 
@@ -116,6 +141,7 @@ def get_confirmation_menu(confirm_callback: str, cancel_callback: str, confirm_t
 
 # --- توابع کیبورد کاربر ---
 
+@static_markup
 def get_user_main_inline_menu():
     markup = types.InlineKeyboardMarkup(row_width=2)
     markup.add(
@@ -126,6 +152,7 @@ def get_user_main_inline_menu():
     )
     return markup
     
+@static_markup
 def get_back_button(callback_data: str, text: str = "🔙 بازگشت"):
     markup = types.InlineKeyboardMarkup(row_width=1)
     markup.add(types.InlineKeyboardButton(text, callback_data=callback_data))
@@ -134,15 +161,16 @@ def get_back_button(callback_data: str, text: str = "🔙 بازگشت"):
 def get_server_selection_menu(servers: list):
     markup = types.InlineKeyboardMarkup(row_width=1)
     for server in servers:
-        markup.add(types.InlineKeyboardButton(server['name'], callback_data=f"buy_select_server_{server['id']}"))
+        markup.add(types.InlineKeyboardButton(server['name'], callback_data=CallbackRouter.build("buy_select_server", server['id'])))
     markup.add(types.InlineKeyboardButton("🔙 بازگشت به منو", callback_data="user_main_menu"))
     return markup
     
+@static_markup
 def get_plan_type_selection_menu_user(server_id: int):
     markup = types.InlineKeyboardMarkup(row_width=2)
     markup.add(
-        types.InlineKeyboardButton("ماهانه (Fixed)", callback_data="buy_plan_type_fixed_monthly"),
-        types.InlineKeyboardButton("حجمی (Gigabyte)", callback_data="buy_plan_type_gigabyte_based")
+        types.InlineKeyboardButton("ماهانه (Fixed)", callback_data=CallbackRouter.build("buy_plan_type", "fixed_monthly")),
+        types.InlineKeyboardButton("حجمی (Gigabyte)", callback_data=CallbackRouter.build("buy_plan_type", "gigabyte_based"))
     )
     markup.add(get_back_button(f"user_buy_service").keyboard[0][0]) # Add back button
     return markup
@@ -151,10 +179,11 @@ def get_fixed_plan_selection_menu(plans: list):
     markup = types.InlineKeyboardMarkup(row_width=1)
     for plan in plans:
         button_text = f"{plan['name']} - {plan['volume_gb']:.1f}GB / {plan['duration_days']} روز - {plan['price']:,.0f} تومان"
-        markup.add(types.InlineKeyboardButton(button_text, callback_data=f"buy_select_plan_{plan['id']}"))
+        markup.add(types.InlineKeyboardButton(button_text, callback_data=CallbackRouter.build("buy_select_plan", plan['id'])))
     markup.add(get_back_button("user_buy_service").keyboard[0][0]) # Back to server selection
     return markup
     
+@static_markup
 def get_order_confirmation_menu():
     return get_confirmation_menu(
         confirm_callback="confirm_and_pay",
@@ -166,21 +195,27 @@ def get_order_confirmation_menu():
 def get_payment_gateway_selection_menu(gateways: list):
     markup = types.InlineKeyboardMarkup(row_width=1)
     for gateway in gateways:
-        markup.add(types.InlineKeyboardButton(gateway['name'], callback_data=f"select_gateway_{gateway['id']}"))
+        markup.add(types.InlineKeyboardButton(gateway['name'], callback_data=CallbackRouter.build("select_gateway", gateway['id'])))
     markup.add(get_back_button("show_order_summary", "🔙 بازگشت به خلاصه سفارش").keyboard[0][0])
     return markup
     
 def get_admin_payment_action_menu(payment_id: int):
     return get_confirmation_menu(
-        confirm_callback=f"admin_approve_payment_{payment_id}",
-        cancel_callback=f"admin_reject_payment_{payment_id}",
+        confirm_callback=CallbackRouter.build("admin_approve_payment", payment_id),
+        cancel_callback=CallbackRouter.build("admin_reject_payment", payment_id),
         confirm_text="✅ تأیید پرداخت",
         cancel_text="❌ رد کردن"
     )
     
+def get_admin_provisioning_retry_menu(payment_id: int):
+    markup = types.InlineKeyboardMarkup()
+    markup.add(types.InlineKeyboardButton("🔁 ساخت دوباره سرویس",
+                                          callback_data=CallbackRouter.build("admin_retry_provisioning", payment_id)))
+    return markup
+
 def get_single_configs_button(purchase_id: int):
     markup = types.InlineKeyboardMarkup(row_width=1)
-    markup.add(types.InlineKeyboardButton("📄 دریافت کانفیگ‌های تکی", callback_data=f"user_get_single_configs_{purchase_id}"))
+    markup.add(types.InlineKeyboardButton("📄 دریافت کانفیگ‌های تکی", callback_data=CallbackRouter.build("user_get_single_configs", purchase_id)))
     return markup
 
 def get_my_services_menu(purchases: list):
@@ -188,7 +223,7 @@ def get_my_services_menu(purchases: list):
     for purchase in purchases:
         status = "فعال ✅" if purchase['is_active'] else "غیرفعال ❌"
         btn_text = f"سرویس {purchase['id']} ({purchase['server_name']}) - {status}"
-        markup.add(types.InlineKeyboardButton(btn_text, callback_data=f"user_service_details_{purchase['id']}"))
+        markup.add(types.InlineKeyboardButton(btn_text, callback_data=CallbackRouter.build("user_service_details", purchase['id'])))
     markup.add(get_back_button("user_main_menu").keyboard[0][0])
     return markup
 
@@ -205,18 +240,19 @@ def get_my_services_menu(purchases: list):
             status_emoji = "✅" if p['is_active'] else "❌"
             expire_date_str = p['expire_date'][:10] if p['expire_date'] else "نامحدود"
             btn_text = f"{status_emoji} سرویس {p['id']} ({p['server_name']}) - انقضا: {expire_date_str}"
-            markup.add(types.InlineKeyboardButton(btn_text, callback_data=f"user_service_details_{p['id']}"))
+            markup.add(types.InlineKeyboardButton(btn_text, callback_data=CallbackRouter.build("user_service_details", p['id'])))
     
     markup.add(types.InlineKeyboardButton("🔙 بازگشت به منو اصلی", callback_data="user_main_menu"))
     return markup
 
 
 
+@static_markup
 def get_gateway_type_selection_menu():
     markup = types.InlineKeyboardMarkup(row_width=2)
     markup.add(
-        types.InlineKeyboardButton("💳 کارت به کارت", callback_data="gateway_type_card_to_card"),
-        types.InlineKeyboardButton("🟢 زرین‌پال", callback_data="gateway_type_zarinpal")
+        types.InlineKeyboardButton("💳 کارت به کارت", callback_data=CallbackRouter.build("gateway_type", "card_to_card")),
+        types.InlineKeyboardButton("🟢 زرین‌پال", callback_data=CallbackRouter.build("gateway_type", "zarinpal"))
     )
     markup.add(types.InlineKeyboardButton("🔙 انصراف", callback_data="admin_payment_management"))
     return markup
\ No newline at end of file
@@ -0,0 +1,82 @@
+# keyboards/markup_cache.py
+
+import json
+import functools
+import threading
+
+from telebot import types
+
+
+class CachedMarkup(types.JsonSerializable):
+    """
+    کیبورد فریز شده: JSON آن فقط یک بار ساخته می‌شود و در هر ارسال همان رشته به تلگرام
+    فرستاده می‌شود. دکمه‌ها (keyboard) فقط برای خواندن در دسترس‌اند و نباید تغییر کنند.
+    """
+
+    def __init__(self, markup: types.InlineKeyboardMarkup):
+        self.keyboard = markup.keyboard
+        self._json = markup.to_json()
+
+    def to_json(self):
+        return self._json
+
+    def to_dict(self):
+        return json.loads(self._json)
+
+
+def static_markup(func):
+    """کیبوردی که فقط به آرگومان‌هایش وابسته است یک بار ساخته و برای همه کاربران استفاده می‌شود."""
+    @functools.lru_cache(maxsize=512)
+    def build(*args, **kwargs):
+        return CachedMarkup(func(*args, **kwargs))
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return build(*args, **kwargs)
+
+    wrapper.cache_info = build.cache_info
+    wrapper.cache_clear = build.cache_clear
+    return wrapper
+
+
+class CatalogMarkupCache:
+    """
+    کیبوردهایی که از کاتالوگ (سرورها، پلن‌ها، درگاه‌ها) ساخته می‌شوند. هر کیبورد همراه با
+    نسخه کاتالوگ در دیتابیس نگه داشته می‌شود و تا وقتی نسخه عوض نشده، بدون خواندن و
+    رمزگشایی کاتالوگ دوباره استفاده می‌شود. نسخه در دیتابیس است، پس تغییر در یک پروسه
+    کش پروسه‌های دیگر را هم باطل می‌کند.
+    """
+
+    def __init__(self):
+        self._entries = {}  # name -> (catalog_version, CachedMarkup | None)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, db_manager, catalog, name, builder):
+        """
+        کیبورد name را برمی‌گرداند؛ builder() فقط وقتی صدا زده می‌شود که نسخه catalog عوض
+        شده باشد. builder می‌تواند None برگرداند (مثلاً وقتی هیچ سرور فعالی وجود ندارد).
+        """
+        version = db_manager.get_catalog_version(catalog)
+        if version is not None:
+            with self._lock:
+                entry = self._entries.get(name)
+                if entry is not None and entry[0] == version:
+                    self.hits += 1
+                    return entry[1]
+                self.misses += 1
+        markup = builder()
+        markup = CachedMarkup(markup) if markup is not None else None
+        # اگر نسخه خوانده نشد (خطای دیتابیس) نتیجه کش نمی‌شود
+        if version is not None:
+            with self._lock:
+                self._entries[name] = (version, markup)
+        return markup
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+catalog_markups = CatalogMarkupCache()
@@ -3,6 +3,7 @@
 import telebot
 import logging
 import os
+import threading
 
 # --- تنظیمات لاگ (تغییر در این بخش) ---
 logging.basicConfig(
@@ -17,53 +18,91 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # --- ایمپورت ماژول‌های پروژه ---
-from config import BOT_TOKEN, ADMIN_IDS, REQUIRED_CHANNEL_ID, REQUIRED_CHANNEL_LINK
+from config import (BOT_TOKEN, ADMIN_IDS,
+                    ARCHIVE_PAYMENTS_AFTER_DAYS, ARCHIVE_PURCHASES_AFTER_DAYS, ARCHIVE_BATCH_SIZE, ARCHIVE_INTERVAL_HOURS,
+                    ARCHIVE_ABANDONED_ONLINE_PAYMENT_HOURS,
+                    ENCRYPTION_OLD_KEYS, TELEGRAM_UPDATE_MODE, TELEGRAM_WEBHOOK_PATH, TELEGRAM_WEBHOOK_SECRET, WEBHOOK_DOMAIN,
+                    UPDATE_QUEUE_SIZE, UPDATE_WORKERS, STATE_STORE_BACKEND, JOB_WORKERS,
+                    BROADCAST_BATCH_SIZE, BROADCAST_CONCURRENCY, STATS_RECONCILE_INTERVAL_MINUTES,
+                    METRICS_EXPORT_INTERVAL_SECONDS)
 from database.db_manager import DatabaseManager
 from api_client.xui_api_client import XuiAPIClient
-from handlers import admin_handlers, user_handlers
-from utils import messages, helpers
-from keyboards import inline_keyboards
+from handlers.common_handlers import register_all_handlers, ALLOWED_UPDATES
+from utils.periodic import PeriodicJob
+from utils.update_queue import QueuedTeleBot
+from utils.job_queue import JobQueue
+from utils.provisioning import PaymentProvisioner
+from utils.zarinpal_verification import ZarinpalVerifier
+from utils.config_generator import ConfigGenerator
+from utils.broadcast import BroadcastEngine
+from utils.admin_notifier import AdminPaymentNotifier
+from utils.metrics import MetricsExporter
 
 # --- نمونه‌سازی (Instantiation) ---
 if not BOT_TOKEN:
     logger.critical("BOT_TOKEN is not set in the environment variables. Exiting.")
     exit()
 
-bot = telebot.TeleBot(BOT_TOKEN)
+# آپدیت‌های هر چت به ترتیب و چت‌های مختلف به صورت موازی پردازش می‌شوند
+bot = QueuedTeleBot(BOT_TOKEN, workers=UPDATE_WORKERS, maxsize=UPDATE_QUEUE_SIZE)
 db_manager = DatabaseManager()
 # نمونه‌سازی XuiAPIClient اینجا لازم نیست چون در هر فانکشن به صورت موقت ساخته می‌شود
 
-# --- هندلر دستور /start ---
-@bot.message_handler(commands=['start'])
-def send_welcome(message):
-    user_id = message.from_user.id
-    first_name = message.from_user.first_name
-    logger.info(f"Received /start from user ID: {user_id} ({first_name})")
-
-    # ذخیره/به‌روزرسانی کاربر در دیتابیس
-    db_manager.add_or_update_user(
-        telegram_id=user_id,
-        first_name=first_name,
-        last_name=message.from_user.last_name,
-        username=message.from_user.username
-    )
-
-    # بررسی عضویت در کانال
-    if REQUIRED_CHANNEL_ID and not helpers.is_user_member_of_channel(bot, REQUIRED_CHANNEL_ID, user_id):
-        bot.send_message(user_id, messages.REQUIRED_CHANNEL_PROMPT.format(channel_link=REQUIRED_CHANNEL_LINK))
-        logger.info(f"User {user_id} is not a member of the required channel.")
-        return
 
-    # نمایش منوی مناسب
-    if helpers.is_admin(user_id):
-        bot.send_message(user_id, messages.ADMIN_WELCOME, reply_markup=inline_keyboards.get_admin_main_inline_menu())
-    else:
-        welcome_text = messages.START_WELCOME.format(first_name=helpers.escape_markdown_v1(first_name))
-        bot.send_message(user_id, welcome_text, parse_mode='Markdown', reply_markup=inline_keyboards.get_user_main_inline_menu())
+def start_background_jobs():
+    # ارسال رسید برای ادمین‌ها و ساخت سرویس پرداخت‌های تأیید شده (ادمین یا زرین‌پال) در این پروسه انجام می‌شود
+    job_queue = JobQueue(db_manager, workers=JOB_WORKERS)
+    admin_notifier = AdminPaymentNotifier(bot, db_manager, ADMIN_IDS)
+    admin_notifier.register(job_queue)
+    PaymentProvisioner(bot, db_manager, ConfigGenerator(XuiAPIClient, db_manager), admin_notifier).register(job_queue)
+    # استعلام پرداخت‌های زرین‌پال که webhook_server فقط در صف ثبت می‌کند
+    ZarinpalVerifier(bot, db_manager).register(job_queue)
+    job_queue.start()
+
+    # پیام‌های همگانی (از جمله پیام‌های نیمه‌کاره پیش از ری‌استارت) در این پروسه ارسال می‌شوند
+    BroadcastEngine(bot, db_manager, batch_size=BROADCAST_BATCH_SIZE, concurrency=BROADCAST_CONCURRENCY).start()
+
+    # انتقال دوره‌ای داده‌های بسته شده به جداول آرشیو
+    if ARCHIVE_PAYMENTS_AFTER_DAYS or ARCHIVE_PURCHASES_AFTER_DAYS or ARCHIVE_ABANDONED_ONLINE_PAYMENT_HOURS:
+        PeriodicJob(
+            "archive", ARCHIVE_INTERVAL_HOURS * 3600,
+            lambda: db_manager.archive_closed_records(
+                payments_older_than_days=ARCHIVE_PAYMENTS_AFTER_DAYS,
+                purchases_expired_days=ARCHIVE_PURCHASES_AFTER_DAYS,
+                batch_size=ARCHIVE_BATCH_SIZE,
+                abandoned_online_payment_hours=ARCHIVE_ABANDONED_ONLINE_PAYMENT_HOURS
+            )
+        ).start()
+
+    # تطبیق شمارنده‌های داشبورد با جداول اصلی (اجرای اول بلافاصله پس از شروع)
+    PeriodicJob("stats-reconcile", STATS_RECONCILE_INTERVAL_MINUTES * 60, db_manager.reconcile_stats, initial_delay=5).start()
+
+    # متریک‌های این پروسه (هندلرها، پنل‌ها، دیتابیس، پرداخت‌ها و صف‌ها) برای /metrics سرور وب‌هوک
+    PeriodicJob("metrics-export", METRICS_EXPORT_INTERVAL_SECONDS, MetricsExporter(db_manager, 'bot', bot).export,
+                initial_delay=METRICS_EXPORT_INTERVAL_SECONDS).start()
+
+    # حذف وضعیت‌های گفتگوی منقضی شده از دیتابیس
+    if STATE_STORE_BACKEND == 'database':
+        PeriodicJob("state-purge", 900, db_manager.purge_expired_conversation_states).start()
+
+    # بازرمزنگاری پس‌زمینه داده‌ها با کلید جدید (فقط وقتی کلید قبلی تعریف شده باشد)
+    if ENCRYPTION_OLD_KEYS:
+        PeriodicJob("key-rotation", 3600, db_manager.rotate_encryption_keys, initial_delay=10).start()
+
+
+def set_telegram_webhook():
+    """وب‌هوک تلگرام را روی webhook_server.py تنظیم می‌کند."""
+    if not WEBHOOK_DOMAIN or not TELEGRAM_WEBHOOK_SECRET:
+        logger.critical("Webhook mode requires WEBHOOK_DOMAIN and TELEGRAM_WEBHOOK_SECRET_ALAMOR.")
+        return False
+    webhook_url = f"https://{WEBHOOK_DOMAIN}/{TELEGRAM_WEBHOOK_PATH.strip('/')}"
+    bot.set_webhook(url=webhook_url, secret_token=TELEGRAM_WEBHOOK_SECRET, allowed_updates=ALLOWED_UPDATES)
+    logger.info(f"Telegram webhook set to {webhook_url}")
+    return True
+
 
 # --- تابع اصلی ---
 def main():
-    bot.remove_webhook()
     logger.info("Bot is starting...")
 
     # ایجاد جداول دیتابیس در صورت عدم وجود
@@ -74,23 +113,25 @@ def main():
         logger.critical(f"FATAL: Could not create database tables. Error: {e}")
         return # خروج از برنامه اگر دیتابیس مشکل داشته باشد
 
-    # ثبت هندلرها
-    # XUI API Client به صورت موقت در هر تابع ساخته می‌شود، پس لازم نیست اینجا پاس داده شود
-    admin_handlers.register_admin_handlers(bot, db_manager, XuiAPIClient)
-    logger.info("Admin handlers registered.")
+    start_background_jobs()
+
+    if TELEGRAM_UPDATE_MODE == 'webhook':
+        # آپدیت‌ها توسط webhook_server.py دریافت و پردازش می‌شوند؛ این پروسه فقط کارهای پس‌زمینه را اجرا می‌کند
+        if not set_telegram_webhook():
+            return
+        logger.info("Webhook mode: updates are handled by webhook_server.py.")
+        threading.Event().wait()
+        return
 
-    user_handlers.register_user_handlers(bot, db_manager, XuiAPIClient)
-    logger.info("User handlers registered.")
+    bot.remove_webhook()
+
+    # ثبت هندلرها
+    register_all_handlers(bot, db_manager, XuiAPIClient)
 
     logger.info("Bot is now polling for updates...")
-    bot.infinity_polling(logger_level=logging.WARNING) # برای جلوگیری از لاگ‌های زیاد خود کتابخانه
+    bot.infinity_polling(logger_level=logging.WARNING, allowed_updates=ALLOWED_UPDATES) # برای جلوگیری از لاگ‌های زیاد خود کتابخانه
     logger.info("Bot polling stopped.")
 
-@bot.message_handler(commands=['myid'])
-def send_user_id(message):
-    user_id = message.from_user.id
-    bot.reply_to(message, f"آیدی عددی شما:\n`{user_id}`", parse_mode='Markdown')
-
 
 if __name__ == "__main__":
     main()
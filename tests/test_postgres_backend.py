@@ -0,0 +1,114 @@
+# tests/test_postgres_backend.py
+
+# تست بک‌اند PostgreSQL روی یک سرور واقعی (محلی). بدون DB_ENGINE_ALAMOR=postgres و آدرس سرور رد می‌شود:
+#   DB_ENGINE_ALAMOR=postgres DB_HOST_ALAMOR=localhost DB_NAME=alamor_test DB_USER=postgres DB_PASSWORD=... \
+#       python -m pytest tests/test_postgres_backend.py
+# مثل خود ربات به فایل .env (برای ENCRYPTION_KEY_ALAMOR) نیاز دارد. جداول در همان دیتابیس ساخته
+# می‌شوند؛ ردیف‌های تست با آیدی‌های تلگرام مخصوص تست ساخته و در پایان حذف می‌شوند.
+
+import os
+import json
+import random
+import datetime
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _env(name, default=None):
+    return os.getenv(f"{name}_ALAMOR") or os.getenv(name) or default
+
+
+POSTGRES_CONFIGURED = (os.getenv("DB_ENGINE_ALAMOR", "").strip().lower() == 'postgres'
+                       and bool(_env("DB_HOST")))
+
+
+@unittest.skipUnless(POSTGRES_CONFIGURED, "DB_ENGINE_ALAMOR=postgres and DB_HOST_ALAMOR are not set")
+class PostgresBackendTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        from database.backends import PostgresBackend
+        from database.db_manager import DatabaseManager
+
+        cls.backend = PostgresBackend(_env("DB_HOST"), int(_env("DB_PORT", "5432")), _env("DB_NAME"),
+                                      _env("DB_USER"), _env("DB_PASSWORD"), max_connections=10)
+        cls.db = DatabaseManager(backend=cls.backend)
+        cls.db.create_tables()
+        # آیدی‌های بزرگ‌تر از int32 تا ستون‌های BIGINT هم بررسی شوند
+        cls.telegram_id = 9_000_000_000 + random.randrange(1_000_000)
+        cls.db.add_or_update_user(cls.telegram_id, "Backend", username="backend_test")
+        cls.user = cls.db.get_user_by_telegram_id(cls.telegram_id)
+        cls.server_id = cls.db.add_server(f"pg-test-{cls.telegram_id}", "http://127.0.0.1:1", "admin", "secret",
+                                          "https://sub.example.com", "sub")
+        cls.plan_id = cls.db.add_plan(f"pg-test-{cls.telegram_id}", 'fixed_monthly', 10, 30, 50000, None)
+
+    @classmethod
+    def tearDownClass(cls):
+        conn = cls.db._get_connection()
+        try:
+            cursor = conn.cursor()
+            user_id = cls.user['id']
+            cursor.execute("DELETE FROM purchase_configs WHERE purchase_id IN (SELECT id FROM purchases WHERE user_id = ?)", (user_id,))
+            cursor.execute("DELETE FROM purchases WHERE user_id = ?", (user_id,))
+            cursor.execute("DELETE FROM payments WHERE user_id = ?", (user_id,))
+            cursor.execute("DELETE FROM plans WHERE id = ?", (cls.plan_id,))
+            cursor.execute("DELETE FROM server_inbounds WHERE server_id = ?", (cls.server_id,))
+            cursor.execute("DELETE FROM servers WHERE id = ?", (cls.server_id,))
+            cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
+            conn.commit()
+        finally:
+            conn.close()
+            cls.backend.close()
+
+    def test_user_round_trip(self):
+        self.assertEqual(self.user['telegram_id'], self.telegram_id)
+        self.assertEqual(self.user['username'], "backend_test")
+        # تاریخ‌ها مثل SQLite رشته هستند
+        self.assertIsInstance(self.user['join_date'], str)
+        self.assertEqual(len(self.user['join_date']), 19)
+
+    def test_server_credentials_round_trip(self):
+        server = self.db.get_server_by_id(self.server_id)
+        self.assertEqual(server['username'], "admin")
+        self.assertEqual(server['password'], "secret")
+
+    def test_purchase_and_services_menu(self):
+        from keyboards.inline_keyboards import get_my_services_menu
+
+        expire_date = (datetime.datetime.now() + datetime.timedelta(days=30)).strftime("%Y-%m-%d %H:%M:%S")
+        purchase_id = self.db.add_purchase(self.user['id'], self.server_id, self.plan_id, expire_date, 10,
+                                           "00000000-0000-0000-0000-000000000000", f"u{self.telegram_id}",
+                                           "pgtestsub", [{'remark': "test", 'url': "vless://test"}])
+        self.assertTrue(purchase_id)
+
+        purchases = self.db.get_user_purchases(self.user['id'])
+        purchase = next(p for p in purchases if p['id'] == purchase_id)
+        self.assertEqual(purchase['expire_date'], expire_date)
+        self.assertIsInstance(purchase['purchase_date'], str)
+
+        menu = get_my_services_menu(purchases)
+        button_texts = [button.text for row in menu.keyboard for button in row]
+        self.assertTrue(any(expire_date[:10] in text for text in button_texts))
+
+    def test_payment_round_trip(self):
+        order_details = {'server_id': self.server_id, 'plan_type': 'fixed_monthly'}
+        payment_id = self.db.add_payment(self.user['id'], 50000, None, json.dumps(order_details))
+        payment = self.db.get_payment_by_id(payment_id)
+        self.assertEqual(payment['status'], 'pending')
+        self.assertEqual(json.loads(payment['order_details_json']), order_details)
+        self.assertIsInstance(payment['payment_date'], str)
+
+        self.assertTrue(self.db.update_payment_status(payment_id, False))
+        self.assertFalse(self.db.update_payment_status(payment_id, False))
+        self.assertEqual(self.db.get_payment_by_id(payment_id)['status'], 'rejected')
+
+    def test_concurrent_claim_payment(self):
+        payment_id = self.db.add_payment(self.user['id'], 50000, None, json.dumps({}))
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda _: self.db.claim_payment(payment_id), range(8)))
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(self.db.get_payment_by_id(payment_id)['status'], 'processing')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+# tools/fake_telegram.py
+
+# Bot API آزمایشی تلگرام برای تست بار: پیام‌ها ارسال نمی‌شوند و فقط در حافظه نگه داشته می‌شوند.
+# برای استفاده، آدرس API کتابخانه telebot به این سرور تغییر داده می‌شود:
+#   telebot.apihelper.API_URL = "http://127.0.0.1:8383/bot{0}/{1}"
+
+import json
+import time
+import itertools
+import threading
+from collections import defaultdict, deque
+
+from flask import Flask, request, jsonify
+
+BOT_USER = {'id': 1000000, 'is_bot': True, 'first_name': "LoadTestBot", 'username': "load_test_bot"}
+
+
+class FakeTelegram:
+    """آخرین پیام‌های هر چت (متد، متن و کیبورد) برای بررسی در تست بار نگه داشته می‌شود."""
+
+    def __init__(self, history_per_chat=50):
+        self._messages = defaultdict(lambda: deque(maxlen=history_per_chat))
+        self._message_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self.calls = defaultdict(int)
+
+    def record(self, method, params):
+        chat_id = params.get('chat_id')
+        markup = params.get('reply_markup')
+        entry = {
+            'method': method,
+            'text': params.get('text') or params.get('caption'),
+            'reply_markup': json.loads(markup) if markup else None,
+            'message_id': next(self._message_ids),
+        }
+        with self._changed:
+            self.calls[method] += 1
+            if chat_id is not None:
+                self._messages[str(chat_id)].append(entry)
+                self._changed.notify_all()
+        return entry
+
+    def wait_for(self, chat_id, predicate, timeout=30):
+        """اولین پیام چت که predicate(entry) برایش True است را (حداکثر تا timeout) برمی‌گرداند."""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                for entry in self._messages[str(chat_id)]:
+                    if predicate(entry):
+                        return entry
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._changed.wait(remaining)
+
+    def message_result(self, entry, chat_id):
+        message = {'message_id': entry['message_id'], 'date': int(time.time()),
+                   'chat': {'id': int(chat_id or 0), 'type': 'private'}, 'from': BOT_USER}
+        if entry['method'] == 'sendPhoto':
+            message['photo'] = [{'file_id': f"photo-{entry['message_id']}", 'file_unique_id': str(entry['message_id']),
+                                 'width': 256, 'height': 256}]
+            message['caption'] = entry['text']
+        else:
+            message['text'] = entry['text'] or ''
+        return message
+
+
+def create_app(telegram=None):
+    telegram = telegram or FakeTelegram()
+    app = Flask(__name__)
+    app.config['telegram'] = telegram
+
+    @app.route('/bot<token>/<method>', methods=['GET', 'POST'])
+    def bot_api(token, method):
+        params = request.values.to_dict()
+        if request.is_json:
+            params.update(request.get_json(silent=True) or {})
+        entry = telegram.record(method, params)
+        if method == 'getMe':
+            result = BOT_USER
+        elif method == 'getChatMember':
+            result = {'status': 'member', 'user': {'id': int(params.get('user_id', 0)), 'is_bot': False, 'first_name': "user"}}
+        elif method.startswith('send') or method.startswith('edit'):
+            result = telegram.message_result(entry, params.get('chat_id'))
+        else:
+            result = True
+        return jsonify(ok=True, result=result)
+
+    return app
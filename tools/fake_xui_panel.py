@@ -0,0 +1,163 @@
+# tools/fake_xui_panel.py
+
+# پنل آزمایشی 3x-ui برای تست محلی و تست بار ساخت سرویس:
+#   python -m tools.fake_xui_panel --port 8282 --delay-ms 50
+# آدرس http://127.0.0.1:8282 را با هر نام کاربری و رمزی به عنوان سرور در ربات ثبت کنید.
+
+import json
+import time
+import random
+import argparse
+import threading
+
+from flask import Flask, request, jsonify
+
+SESSION_COOKIE = '3x-ui'
+
+
+def _default_inbound(inbound_id):
+    return {
+        'id': inbound_id, 'remark': f"fake-{inbound_id}", 'protocol': 'vless', 'port': 20000 + inbound_id,
+        'enable': True, 'settings': json.dumps({'clients': []}),
+        'streamSettings': json.dumps({'network': 'ws', 'security': 'none', 'wsSettings': {'path': '/ws'}}),
+    }
+
+
+class FakeXuiPanel:
+    """
+    وضعیت پنل آزمایشی: اینباندها و کلاینت‌ها فقط در حافظه نگه داشته می‌شوند. delay_ms و
+    jitter_ms تأخیر هر درخواست API و fail_rate احتمال پاسخ ناموفق ({"success": false}) است.
+    """
+
+    def __init__(self, inbounds=1, delay_ms=0, jitter_ms=0, fail_rate=0.0, seed=None):
+        self.delay_ms = delay_ms
+        self.jitter_ms = jitter_ms
+        self.fail_rate = fail_rate
+        self._random = random.Random(seed)
+        self._inbounds = {i: _default_inbound(i) for i in range(1, inbounds + 1)}
+        self._clients = {}  # email -> client settings
+        self._lock = threading.Lock()
+        self.stats = {'logins': 0, 'api_calls': 0, 'clients_added': 0, 'failures': 0}
+
+    def simulate(self):
+        """تأخیر و خطای تزریق شده؛ True یعنی درخواست باید ناموفق پاسخ داده شود."""
+        with self._lock:
+            delay = self.delay_ms + self._random.uniform(0, self.jitter_ms)
+            fail = self._random.random() < self.fail_rate
+            self.stats['api_calls'] += 1
+            if fail:
+                self.stats['failures'] += 1
+        if delay:
+            time.sleep(delay / 1000)
+        return fail
+
+    def add_clients(self, inbound_id, settings):
+        clients = json.loads(settings).get('clients', [])
+        with self._lock:
+            if inbound_id not in self._inbounds:
+                return False
+            for client in clients:
+                if client.get('email') in self._clients:
+                    return False
+            for client in clients:
+                self._clients[client['email']] = {**client, 'inboundId': inbound_id, 'up': 0, 'down': 0}
+            self.stats['clients_added'] += len(clients)
+        return True
+
+    def client_traffics(self, email):
+        with self._lock:
+            client = self._clients.get(email)
+        if client is None:
+            return None
+        return {'email': email, 'inboundId': client['inboundId'], 'enable': client.get('enable', True),
+                'up': client['up'], 'down': client['down'], 'total': client.get('totalGB', 0),
+                'expiryTime': client.get('expiryTime', 0)}
+
+    def inbounds(self):
+        with self._lock:
+            return list(self._inbounds.values())
+
+    def inbound(self, inbound_id):
+        with self._lock:
+            return self._inbounds.get(inbound_id)
+
+
+def create_app(panel=None):
+    panel = panel or FakeXuiPanel()
+    app = Flask(__name__)
+    app.config['panel'] = panel
+
+    def result(obj=None, success=True, msg=""):
+        return jsonify(success=success, msg=msg, obj=obj)
+
+    def failed():
+        return result(success=False, msg="injected failure")
+
+    @app.route('/login', methods=['POST'])
+    def login():
+        with panel._lock:
+            panel.stats['logins'] += 1
+        if panel.simulate():
+            return failed()
+        response = result()
+        response.set_cookie(SESSION_COOKIE, 'fake-session')
+        return response
+
+    @app.before_request
+    def require_session():
+        if request.path.startswith('/panel/') and SESSION_COOKIE not in request.cookies:
+            return jsonify(success=False, msg="unauthorized", obj=None), 401
+
+    @app.route('/panel/api/inbounds/list', methods=['GET'])
+    def list_inbounds():
+        return failed() if panel.simulate() else result(panel.inbounds())
+
+    @app.route('/panel/api/inbounds/get/<int:inbound_id>', methods=['GET'])
+    def get_inbound(inbound_id):
+        if panel.simulate():
+            return failed()
+        inbound = panel.inbound(inbound_id)
+        return result(inbound) if inbound else result(success=False, msg="inbound not found")
+
+    @app.route('/panel/api/inbounds/addClient', methods=['POST'])
+    def add_client():
+        if panel.simulate():
+            return failed()
+        data = request.get_json(silent=True) or {}
+        if not panel.add_clients(int(data.get('id', 0)), data.get('settings', '{}')):
+            return result(success=False, msg="inbound not found or duplicate email")
+        return result(msg="Client(s) added")
+
+    @app.route('/panel/api/inbounds/getClientTraffics/<email>', methods=['GET'])
+    def client_traffics(email):
+        if panel.simulate():
+            return failed()
+        return result(panel.client_traffics(email))
+
+    @app.route('/panel/api/inbounds/onlines', methods=['POST'])
+    def onlines():
+        return failed() if panel.simulate() else result([])
+
+    @app.route('/_stats', methods=['GET'])
+    def stats():
+        return jsonify(panel.stats)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local 3x-ui panel stand-in.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8282)
+    parser.add_argument('--inbounds', type=int, default=1)
+    parser.add_argument('--delay-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    panel = FakeXuiPanel(inbounds=args.inbounds, delay_ms=args.delay_ms, jitter_ms=args.jitter_ms,
+                         fail_rate=args.fail_rate)
+    create_app(panel).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+# tools/fake_zarinpal.py
+
+# درگاه آزمایشی زرین‌پال برای تست محلی و تست بار (هیچ پولی جابه‌جا نمی‌شود):
+#   python -m tools.fake_zarinpal --port 8181 --delay-ms 300 --fail-rate 0.05
+# سپس در .env:
+#   ZARINPAL_API_URL_ALAMOR="http://127.0.0.1:8181/pg/v4/payment/request.json"
+#   ZARINPAL_VERIFY_URL_ALAMOR="http://127.0.0.1:8181/pg/v4/payment/verify.json"
+#   ZARINPAL_STARTPAY_URL_ALAMOR="http://127.0.0.1:8181/pg/StartPay/"
+
+import time
+import random
+import argparse
+import itertools
+import threading
+from urllib.parse import urlencode
+
+from flask import Flask, request, jsonify, redirect
+
+# کدهای خطای API نسخه ۴ زرین‌پال که درگاه آزمایشی برمی‌گرداند
+CODE_VALIDATION_ERROR = -9
+CODE_AMOUNT_MISMATCH = -50
+CODE_NOT_PAID = -51
+CODE_UNKNOWN_AUTHORITY = -54
+
+
+class FakeZarinpal:
+    """
+    وضعیت درگاه آزمایشی: درخواست پرداخت authority می‌سازد، StartPay آن را پرداخت شده می‌کند و
+    verify اولین بار کد 100 و دفعات بعد کد 101 برمی‌گرداند. delay_ms و jitter_ms تأخیر هر
+    درخواست API، fail_rate احتمال خطای 500 و reject_rate احتمال رد شدن verify (کد -51) است.
+    """
+
+    def __init__(self, delay_ms=0, jitter_ms=0, fail_rate=0.0, reject_rate=0.0, seed=None):
+        self.delay_ms = delay_ms
+        self.jitter_ms = jitter_ms
+        self.fail_rate = fail_rate
+        self.reject_rate = reject_rate
+        self._random = random.Random(seed)
+        self._payments = {}  # authority -> dict
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'verifies': 0, 'verified': 0, 'rejected': 0, 'failures': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _simulate_network(self):
+        """تأخیر و خطای تزریق شده؛ True یعنی این درخواست باید با خطای 500 پاسخ داده شود."""
+        with self._lock:
+            delay = self.delay_ms + self._random.uniform(0, self.jitter_ms)
+            fail = self._random.random() < self.fail_rate
+        if delay:
+            time.sleep(delay / 1000)
+        if fail:
+            self._count('failures')
+        return fail
+
+    @staticmethod
+    def _error(code, message):
+        return jsonify(data=[], errors={'code': code, 'message': message, 'validations': []})
+
+    def request_payment(self, payload):
+        self._count('requests')
+        amount = payload.get('amount')
+        if not payload.get('merchant_id') or not isinstance(amount, int) or amount < 1000 or not payload.get('callback_url'):
+            return self._error(CODE_VALIDATION_ERROR, "The input params invalid, validation error.")
+        authority = f"A{next(self._ids):035d}"
+        with self._lock:
+            self._payments[authority] = {
+                'merchant_id': payload['merchant_id'], 'amount': amount, 'callback_url': payload['callback_url'],
+                'paid': False, 'ref_id': None,
+            }
+        return jsonify(data={'code': 100, 'message': "Success", 'authority': authority, 'fee_type': "Merchant", 'fee': 0},
+                       errors=[])
+
+    def start_pay(self, authority, status):
+        """معادل پرداخت کاربر در صفحه درگاه؛ به callback_url فروشنده برمی‌گرداند."""
+        with self._lock:
+            payment = self._payments.get(authority)
+            if payment is None:
+                return None
+            payment['paid'] = status == 'OK'
+            callback_url = payment['callback_url']
+        separator = '&' if '?' in callback_url else '?'
+        return f"{callback_url}{separator}{urlencode({'Authority': authority, 'Status': status})}"
+
+    def verify_payment(self, payload):
+        self._count('verifies')
+        with self._lock:
+            payment = self._payments.get(payload.get('authority'))
+            reject = self._random.random() < self.reject_rate
+        if payment is None or payment['merchant_id'] != payload.get('merchant_id'):
+            return self._error(CODE_UNKNOWN_AUTHORITY, "Authority is invalid.")
+        if payment['amount'] != payload.get('amount'):
+            return self._error(CODE_AMOUNT_MISMATCH, "Session is not valid, amounts values is not the same.")
+        if not payment['paid'] or (reject and payment['ref_id'] is None):
+            self._count('rejected')
+            return self._error(CODE_NOT_PAID, "Session is not valid, session is not active paid try.")
+        with self._lock:
+            code = 101 if payment['ref_id'] else 100
+            if payment['ref_id'] is None:
+                payment['ref_id'] = self._random.randint(10 ** 8, 10 ** 9)
+                self.stats['verified'] += 1
+        return jsonify(data={'code': code, 'message': "Verified" if code == 100 else "Already verified",
+                             'card_pan': "502229******5995", 'ref_id': payment['ref_id'], 'fee_type': "Merchant", 'fee': 0},
+                       errors=[])
+
+
+def create_app(gateway=None):
+    gateway = gateway or FakeZarinpal()
+    app = Flask(__name__)
+    app.config['gateway'] = gateway
+
+    @app.route('/pg/v4/payment/request.json', methods=['POST'])
+    def payment_request():
+        if gateway._simulate_network():
+            return "Internal Server Error", 500
+        return gateway.request_payment(request.get_json(silent=True) or {})
+
+    @app.route('/pg/v4/payment/verify.json', methods=['POST'])
+    def payment_verify():
+        if gateway._simulate_network():
+            return "Internal Server Error", 500
+        return gateway.verify_payment(request.get_json(silent=True) or {})
+
+    @app.route('/pg/StartPay/<authority>', methods=['GET'])
+    def start_pay(authority):
+        # ?status=NOK انصراف کاربر از پرداخت را شبیه‌سازی می‌کند
+        target = gateway.start_pay(authority, request.args.get('status', 'OK'))
+        if target is None:
+            return "Unknown authority", 404
+        return redirect(target)
+
+    @app.route('/_stats', methods=['GET'])
+    def stats():
+        return jsonify(gateway.stats)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Zarinpal gateway stand-in.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8181)
+    parser.add_argument('--delay-ms', type=float, default=0, help="base latency of every API call")
+    parser.add_argument('--jitter-ms', type=float, default=0, help="extra random latency (0..jitter)")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="probability of an HTTP 500 response")
+    parser.add_argument('--reject-rate', type=float, default=0.0, help="probability that verify answers -51")
+    args = parser.parse_args()
+    gateway = FakeZarinpal(delay_ms=args.delay_ms, jitter_ms=args.jitter_ms,
+                           fail_rate=args.fail_rate, reject_rate=args.reject_rate)
+    create_app(gateway).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+# tools/load_test_payments.py
+
+# تست بار کامل فرآیند پرداخت آنلاین با درگاه، پنل و Bot API آزمایشی (بدون هیچ سرویس واقعی):
+#   python -m tools.load_test_payments --users 200 --concurrency 20 --gateway-delay-ms 300 --panel-delay-ms 50
+#
+# هر کاربر مجازی همان مسیر واقعی را طی می‌کند: کلیک‌های خرید تا select_payment_gateway (ساخت لینک
+# پرداخت با API درگاه)، پرداخت در StartPay، بازگشت به handle_zarinpal_callback روی webhook_server،
+# خواندن /zarinpal/status مثل صفحه مرورگر و در نهایت ساخت سرویس در پنل توسط صف کارها.
+# دیتابیس یک فایل SQLite موقت است و به دیتابیس اصلی ربات دست نمی‌زند.
+#
+# config.py فایل .env را الزامی می‌داند. روی سیستمی که ربات روی آن نصب نیست، یک .env آزمایشی
+# (که در git ثبت نمی‌شود) کافی است؛ توکن و ادمین واقعی لازم نیست چون Bot API هم آزمایشی است:
+#   cp .env.example .env
+#   BOT_TOKEN_ALAMOR="123456:LOAD-TEST"
+#   ADMIN_IDS_ALAMOR="[111]"
+#   ENCRYPTION_KEY_ALAMOR=<خروجی python -c "from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())">
+
+import os
+import time
+import argparse
+import itertools
+import tempfile
+import threading
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import telebot
+from werkzeug.serving import make_server
+
+import config
+from tools.fake_telegram import FakeTelegram, create_app as create_telegram_app
+from tools.fake_xui_panel import FakeXuiPanel, create_app as create_panel_app
+from tools.fake_zarinpal import FakeZarinpal, create_app as create_gateway_app
+
+BOT_TOKEN = "123456:LOAD-TEST"
+FIRST_USER_ID = 7_000_000_000
+
+
+def start_server(app):
+    """اپلیکیشن WSGI را روی یک پورت آزاد (چندتردی) اجرا می‌کند."""
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name=f"server-{server.server_port}", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="End-to-end load test of the Zarinpal payment flow.")
+    parser.add_argument('--users', type=int, default=50, help="number of simulated purchases")
+    parser.add_argument('--concurrency', type=int, default=10, help="purchases running at the same time")
+    parser.add_argument('--gateway-delay-ms', type=float, default=200)
+    parser.add_argument('--gateway-jitter-ms', type=float, default=100)
+    parser.add_argument('--gateway-fail-rate', type=float, default=0.0)
+    parser.add_argument('--gateway-reject-rate', type=float, default=0.0)
+    parser.add_argument('--panel-delay-ms', type=float, default=50)
+    parser.add_argument('--panel-jitter-ms', type=float, default=50)
+    parser.add_argument('--panel-fail-rate', type=float, default=0.0)
+    parser.add_argument('--update-workers', type=int, default=config.UPDATE_WORKERS)
+    parser.add_argument('--job-workers', type=int, default=config.JOB_WORKERS)
+    parser.add_argument('--timeout', type=float, default=120, help="per-purchase timeout in seconds")
+    parser.add_argument('--keep-db', action='store_true', help="keep the temporary SQLite database")
+    return parser.parse_args()
+
+
+class PaymentLoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.telegram = FakeTelegram()
+        self.gateway = FakeZarinpal(delay_ms=args.gateway_delay_ms, jitter_ms=args.gateway_jitter_ms,
+                                    fail_rate=args.gateway_fail_rate, reject_rate=args.gateway_reject_rate)
+        self.panel = FakeXuiPanel(delay_ms=args.panel_delay_ms, jitter_ms=args.panel_jitter_ms,
+                                  fail_rate=args.panel_fail_rate)
+        self._update_ids = itertools.count(1)
+        self.results = []
+
+    def setup(self):
+        self._servers = []
+        telegram_server, telegram_url = start_server(create_telegram_app(self.telegram))
+        gateway_server, gateway_url = start_server(create_gateway_app(self.gateway))
+        panel_server, self.panel_url = start_server(create_panel_app(self.panel))
+        self._servers += [telegram_server, gateway_server, panel_server]
+
+        # آدرس‌ها باید قبل از وارد کردن هندلرها تغییر کنند (هندلرها مقدارشان را هنگام import می‌خوانند)
+        telebot.apihelper.API_URL = telegram_url + "/bot{0}/{1}"
+        config.ZARINPAL_API_URL = f"{gateway_url}/pg/v4/payment/request.json"
+        config.ZARINPAL_VERIFY_URL = f"{gateway_url}/pg/v4/payment/verify.json"
+        config.ZARINPAL_STARTPAY_URL = f"{gateway_url}/pg/StartPay/"
+
+        from api_client.xui_api_client import XuiAPIClient
+        from database.backends import SQLiteBackend
+        from database.db_manager import DatabaseManager
+        from handlers.common_handlers import register_all_handlers
+        from utils.config_generator import ConfigGenerator
+        from utils.job_queue import JobQueue
+        from utils.provisioning import PaymentProvisioner
+        from utils.update_queue import QueuedTeleBot
+        from utils.zarinpal_verification import ZarinpalVerifier
+        import webhook_server
+
+        self.db_path = os.path.join(tempfile.mkdtemp(prefix='alamor-load-'), 'load_test.db')
+        self.db = DatabaseManager(backend=SQLiteBackend(self.db_path))
+        self.db.create_tables()
+        self._seed()
+
+        self.bot = QueuedTeleBot(BOT_TOKEN, workers=self.args.update_workers, maxsize=10000)
+        register_all_handlers(self.bot, self.db, XuiAPIClient)
+        self.job_queue = JobQueue(self.db, workers=self.args.job_workers, poll_interval=0.2, retry_base_delay=1)
+        ZarinpalVerifier(self.bot, self.db, verify_url=config.ZARINPAL_VERIFY_URL).register(self.job_queue)
+        PaymentProvisioner(self.bot, self.db, ConfigGenerator(XuiAPIClient, self.db)).register(self.job_queue)
+        self.job_queue.start()
+
+        # همان اپلیکیشن Flask سرور وب‌هوک، روی دیتابیس موقت و به صورت چندتردی
+        webhook_server.db_manager = self.db
+        webhook_server.bot = self.bot
+        webhook_server.processed_authorities.clear()
+        webhook, self.webhook_url = start_server(webhook_server.app)
+        self._servers.append(webhook)
+
+    def _seed(self):
+        self.server_id = self.db.add_server("load-test", self.panel_url, "admin", "admin", "https://sub.example.com:2096", "sub")
+        self.db.update_server_status(self.server_id, True, time.strftime("%Y-%m-%d %H:%M:%S"))
+        self.db.update_server_inbounds(self.server_id, [{'id': 1, 'remark': 'fake-1'}])
+        self.plan_id = self.db.add_plan("load-test", 'fixed_monthly', 10, 30, 50000, None)
+        self.gateway_id = self.db.add_payment_gateway("load-test", 'zarinpal', merchant_id="00000000-0000-0000-0000-000000000000")
+        for index in range(self.args.users):
+            self.db.add_or_update_user(FIRST_USER_ID + index, f"user{index}")
+
+    def _click(self, user_id, data):
+        update = telebot.types.Update.de_json({
+            'update_id': next(self._update_ids),
+            'callback_query': {
+                'id': f"{user_id}-{data}", 'chat_instance': 'load-test', 'data': data,
+                'from': {'id': user_id, 'is_bot': False, 'first_name': "user"},
+                'message': {'message_id': 1, 'date': int(time.time()), 'text': "menu",
+                            'chat': {'id': user_id, 'type': 'private'}},
+            },
+        })
+        self.bot.process_new_updates([update])
+
+    @staticmethod
+    def _payment_url(entry):
+        for row in (entry.get('reply_markup') or {}).get('inline_keyboard', []):
+            for button in row:
+                if '/StartPay/' in (button.get('url') or ''):
+                    return button['url']
+        return None
+
+    def run_purchase(self, index):
+        from utils.callback_router import callback_data
+        user_id = FIRST_USER_ID + index
+        result = {'user_id': user_id, 'ok': False}
+        http = requests.Session()
+        started = time.perf_counter()
+        try:
+            for data in ("user_buy_service", callback_data("buy_select_server", self.server_id),
+                         callback_data("buy_plan_type", 'fixed_monthly'), callback_data("buy_select_plan", self.plan_id),
+                         "confirm_and_pay", callback_data("select_gateway", self.gateway_id)):
+                self._click(user_id, data)
+            entry = self.telegram.wait_for(user_id, self._payment_url, timeout=self.args.timeout)
+            if entry is None:
+                result['error'] = "no payment link"
+                return result
+            result['checkout'] = time.perf_counter() - started
+
+            # پرداخت در صفحه درگاه و بازگشت مرورگر به سرور وب‌هوک
+            redirect = http.get(self._payment_url(entry), allow_redirects=False, timeout=30)
+            query = urlsplit(redirect.headers['Location']).query
+            callback_started = time.perf_counter()
+            page = http.get(f"{self.webhook_url}/zarinpal/verify?{query}", timeout=30)
+            result['callback'] = time.perf_counter() - callback_started
+            if page.status_code != 200:
+                result['error'] = f"callback HTTP {page.status_code}"
+                return result
+
+            authority = query.split('Authority=')[1].split('&')[0]
+            deadline = started + self.args.timeout
+            state = 'processing'
+            while state == 'processing' and time.perf_counter() < deadline:
+                time.sleep(0.2)
+                state = http.get(f"{self.webhook_url}/zarinpal/status", params={'authority': authority}, timeout=30).json()['state']
+            result['verified'] = time.perf_counter() - callback_started
+            if state != 'success':
+                result['error'] = f"payment state {state}"
+                return result
+
+            # سرویس وقتی تحویل شده است که QR کد اشتراک برای کاربر ارسال شود
+            delivered = self.telegram.wait_for(user_id, lambda entry: entry['method'] == 'sendPhoto',
+                                               timeout=max(deadline - time.perf_counter(), 0))
+            payment = self.db.get_payment_status_by_authority(authority)
+            if delivered is None or not payment or payment['status'] != 'confirmed':
+                result['error'] = "provisioning timeout"
+                return result
+            result['end_to_end'] = time.perf_counter() - started
+            result['ok'] = True
+            return result
+        except Exception as e:
+            result['error'] = f"{type(e).__name__}: {e}"
+            return result
+
+    def run(self):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.args.concurrency, thread_name_prefix="virtual-user") as pool:
+            self.results = list(pool.map(self.run_purchase, range(self.args.users)))
+        self.elapsed = time.perf_counter() - started
+
+    def report(self):
+        ok = [r for r in self.results if r['ok']]
+        failed = [r for r in self.results if not r['ok']]
+        print("\n=== Payment flow load test ===")
+        print(f"purchases: {len(self.results)}  succeeded: {len(ok)}  failed: {len(failed)}")
+        print(f"wall time: {self.elapsed:.1f}s  throughput: {len(ok) / self.elapsed:.2f} payments/s")
+        print(f"\n{'latency (ms)':<28}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+        for key, label in (('checkout', "clicks -> payment link"), ('callback', "gateway return page"),
+                           ('verified', "return -> verified"), ('end_to_end', "clicks -> service ready")):
+            values = [r[key] * 1000 for r in self.results if key in r]
+            if values:
+                print(f"{label:<28}" + "".join(f"{percentile(values, p):>9.0f}" for p in (50, 95, 99, 100)))
+        errors = {}
+        for r in failed:
+            errors[r.get('error')] = errors.get(r.get('error'), 0) + 1
+        for error, count in sorted(errors.items(), key=lambda item: -item[1]):
+            print(f"  {count} x {error}")
+        print(f"\ngateway: {self.gateway.stats}")
+        print(f"panel:   {self.panel.stats}")
+        print(f"bot api: {dict(self.telegram.calls)}")
+        print(f"send scheduler: {self.bot.send_scheduler.stats()}")
+
+    def teardown(self):
+        self.job_queue.stop()
+        for server in self._servers:
+            server.shutdown()
+        if self.args.keep_db:
+            print(f"database kept at {self.db_path}")
+        else:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(self.db_path + suffix):
+                    os.remove(self.db_path + suffix)
+
+
+def main():
+    load_test = PaymentLoadTest(parse_args())
+    load_test.setup()
+    try:
+        load_test.run()
+        load_test.report()
+    finally:
+        load_test.teardown()
+
+
+if __name__ == '__main__':
+    main()
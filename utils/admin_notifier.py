@@ -0,0 +1,108 @@
+# utils/admin_notifier.py
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import telebot
+
+from keyboards import inline_keyboards
+from utils.send_scheduler import send_priority, PRIORITY_NOTIFICATION
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_ADMINS_PAYMENT_JOB = 'notify_admins_payment'
+
+
+def enqueue_admin_payment_notification(db_manager, payment_id, receipt_file_id, caption):
+    """ارسال رسید پرداخت برای ادمین‌ها را به صف کارها می‌سپارد تا کاربر منتظر آن نماند."""
+    payload = {'payment_id': payment_id, 'receipt_file_id': receipt_file_id, 'caption': caption}
+    return db_manager.enqueue_job(
+        NOTIFY_ADMINS_PAYMENT_JOB, payload, dedupe_key=f"{NOTIFY_ADMINS_PAYMENT_JOB}:{payment_id}"
+    )
+
+
+class AdminPaymentNotifier:
+    """
+    اعلان پرداخت را به صورت هم‌زمان برای همه ادمین‌ها می‌فرستد و شناسه پیام هر ادمین را ثبت
+    می‌کند تا پس از تأیید یا رد، نسخه همه ادمین‌ها یک‌جا به‌روزرسانی شود.
+    """
+
+    def __init__(self, bot: telebot.TeleBot, db_manager, admin_ids, max_workers=8):
+        self.bot = bot
+        self.db_manager = db_manager
+        self.admin_ids = list(admin_ids)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(self.admin_ids))),
+                                        thread_name_prefix="admin-notify")
+
+    def register(self, job_queue):
+        job_queue.register(NOTIFY_ADMINS_PAYMENT_JOB, self.notify_new_payment)
+
+    def _map(self, func, items):
+        # اولویت ارسال در ترد فراخواننده تعیین می‌شود و باید به تردهای pool هم منتقل شود
+        def run(item):
+            with send_priority(PRIORITY_NOTIFICATION):
+                return func(item)
+        return list(self._pool.map(run, items))
+
+    def notify_new_payment(self, payload, job=None):
+        """
+        رسید را برای ادمین‌هایی که هنوز دریافت نکرده‌اند می‌فرستد؛ در تلاش مجدد کار، برای
+        ادمین‌هایی که قبلاً پیام گرفته‌اند دوباره ارسال نمی‌شود.
+        """
+        payment_id = payload['payment_id']
+        already_notified = {admin_id for admin_id, _ in self.db_manager.get_payment_admin_messages(payment_id)}
+        pending = [admin_id for admin_id in self.admin_ids if admin_id not in already_notified]
+        if not pending:
+            return
+        markup = inline_keyboards.get_admin_payment_action_menu(payment_id)
+
+        def send(admin_id):
+            try:
+                sent_msg = self.bot.send_photo(admin_id, payload['receipt_file_id'], caption=payload['caption'],
+                                               parse_mode='Markdown', reply_markup=markup)
+                return admin_id, sent_msg.message_id
+            except Exception as e:
+                logger.error(f"Failed to send payment notification to admin {admin_id}: {e}")
+                return admin_id, None
+
+        results = self._map(send, pending)
+        delivered = [(admin_id, message_id) for admin_id, message_id in results if message_id]
+        self.db_manager.add_payment_admin_messages(payment_id, delivered)
+        first_admin_message = dict(delivered).get(self.admin_ids[0]) if self.admin_ids else None
+        if first_admin_message:
+            self.db_manager.update_payment_admin_notification_id(payment_id, first_admin_message)
+        failed = len(results) - len(delivered)
+        if failed:
+            raise RuntimeError(f"Payment notification failed for {failed} of {len(results)} admins.")
+
+    def notify_admins(self, text, parse_mode=None, reply_markup=None):
+        """پیام متنی را هم‌زمان برای همه ادمین‌ها می‌فرستد."""
+        def send(admin_id):
+            try:
+                self.bot.send_message(admin_id, text, parse_mode=parse_mode, reply_markup=reply_markup)
+            except Exception as e:
+                logger.error(f"Failed to send notification to admin {admin_id}: {e}")
+
+        self._map(send, self.admin_ids)
+
+    def update_payment_messages(self, payment_id, caption, parse_mode=None, fallback=None, reply_markup=None):
+        """
+        کپشن پیام اعلان پرداخت را نزد همه ادمین‌ها ویرایش می‌کند. دکمه‌ها حذف می‌شوند مگر
+        reply_markup داده شود. fallback=(chat_id, message_id) برای پرداخت‌های قدیمی که
+        پیام‌هایشان ثبت نشده است.
+        """
+        targets = self.db_manager.get_payment_admin_messages(payment_id)
+        if fallback and tuple(fallback) not in targets:
+            targets.append(tuple(fallback))
+
+        def edit(target):
+            try:
+                self.bot.edit_message_caption(caption, target[0], target[1], parse_mode=parse_mode,
+                                              reply_markup=reply_markup)
+            except telebot.apihelper.ApiTelegramException as e:
+                if 'message is not modified' not in e.description:
+                    logger.warning(f"Could not update payment {payment_id} message for admin {target[0]}: {e}")
+            except Exception as e:
+                logger.warning(f"Could not update payment {payment_id} message for admin {target[0]}: {e}")
+
+        self._map(edit, targets)
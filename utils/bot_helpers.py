@@ -1,11 +1,10 @@
 # utils/bot_helpers.py (نسخه نهایی و اصلاح شده)
 
 import telebot
-import qrcode
-from io import BytesIO
 import logging
 
 from utils import messages, helpers
+from utils.qr_service import qr_service
 
 logger = logging.getLogger(__name__)
 
@@ -22,15 +21,8 @@ def send_subscription_info(bot: telebot.TeleBot, user_id: int, sub_link: str):
     # ابتدا لینک متنی اصلاح شده ارسال می‌شود
     bot.send_message(user_id, messages.CONFIG_DELIVERY_SUB_LINK.format(sub_link=sub_link), parse_mode='Markdown')
     
-    # سپس QR کد در یک پیام جداگانه با لینک اصلاح شده ساخته می‌شود
+    # سپس QR کد در یک پیام جداگانه ارسال می‌شود (از کش، در صورت وجود)
     try:
-        qr_image = qrcode.make(sub_link)
-        bio = BytesIO()
-        bio.name = 'qrcode.jpeg'
-        qr_image.save(bio, 'JPEG')
-        bio.seek(0)
-
-        bot.send_photo(user_id, bio, caption=messages.QR_CODE_CAPTION)
-        
+        qr_service.send(bot, user_id, sub_link, caption=messages.QR_CODE_CAPTION)
     except Exception as e:
         logger.error(f"Failed to generate or send QR code: {e}")
\ No newline at end of file
@@ -0,0 +1,134 @@
+# utils/broadcast.py
+
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import telebot
+from telebot import types
+
+from utils import messages
+from keyboards import inline_keyboards
+from utils.send_scheduler import send_priority, PRIORITY_BULK, PRIORITY_NOTIFICATION
+
+logger = logging.getLogger(__name__)
+
+
+def broadcast_content_from_message(message):
+    """محتوای پیام همگانی را از پیام ادمین استخراج می‌کند (متن، عکس یا پیام فوروارد شده)."""
+    if message.forward_date:
+        return {'content_type': 'forward', 'source_chat_id': message.chat.id, 'source_message_id': message.message_id}
+    if message.content_type == 'photo':
+        entities = [e.to_dict() for e in message.caption_entities or []]
+        return {'content_type': 'photo', 'file_id': message.photo[-1].file_id, 'text': message.caption,
+                'entities_json': json.dumps(entities) if entities else None}
+    if message.content_type == 'text':
+        entities = [e.to_dict() for e in message.entities or []]
+        return {'content_type': 'text', 'text': message.text, 'entities_json': json.dumps(entities) if entities else None}
+    return None
+
+
+class BroadcastEngine:
+    """
+    پیام‌های همگانی ثبت شده در جدول broadcasts را یکی‌یکی ارسال می‌کند. گیرندگان به صورت
+    دسته‌ای و به ترتیب id از دیتابیس خوانده می‌شوند و هر دسته به صورت موازی (با اولویت پایین
+    در SendScheduler) ارسال می‌شود. نتیجه هر گیرنده ثبت می‌شود، پس پیامی که با ری‌استارت
+    متوقف شده از همان‌جا ادامه پیدا می‌کند.
+    """
+
+    def __init__(self, bot: telebot.TeleBot, db_manager, batch_size=200, concurrency=8, poll_interval=5.0):
+        self.bot = bot
+        self.db_manager = db_manager
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="broadcast-engine", daemon=True)
+        self._thread.start()
+        logger.info(f"Broadcast engine started (batch {self.batch_size}, concurrency {self.concurrency}).")
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _loop(self):
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="broadcast") as pool:
+            while not self._stop_event.is_set():
+                broadcast = self.db_manager.get_next_active_broadcast()
+                if broadcast is None:
+                    self._stop_event.wait(self.poll_interval)
+                    continue
+                try:
+                    self.run(broadcast, pool)
+                except Exception as e:
+                    logger.error(f"Error running broadcast {broadcast['id']}: {e}", exc_info=True)
+                    self._stop_event.wait(self.poll_interval)
+
+    def run(self, broadcast, pool):
+        broadcast_id = broadcast['id']
+        if not self.db_manager.update_broadcast_status(broadcast_id, 'running'):
+            return
+        logger.info(f"Running broadcast {broadcast_id} from user id {broadcast['last_user_id']}.")
+        last_user_id = broadcast['last_user_id']
+        while not self._stop_event.is_set():
+            recipients = self.db_manager.get_broadcast_recipients(broadcast_id, last_user_id, self.batch_size)
+            if not recipients:
+                self.db_manager.update_broadcast_status(broadcast_id, 'done')
+                break
+            results = list(pool.map(lambda user: self._deliver(broadcast, user), recipients))
+            last_user_id = recipients[-1]['id']
+            self.db_manager.record_broadcast_batch(broadcast_id, results, last_user_id)
+
+            # لغو توسط ادمین بین دسته‌ها بررسی می‌شود
+            broadcast = self.db_manager.get_broadcast(broadcast_id)
+            if broadcast is None or broadcast['status'] != 'running':
+                break
+            self._report_progress(broadcast)
+        broadcast = self.db_manager.get_broadcast(broadcast_id)
+        if broadcast and broadcast['status'] != 'running':
+            self._report_progress(broadcast)
+            logger.info(f"Broadcast {broadcast_id} {broadcast['status']}: {broadcast['sent_count']} sent, "
+                        f"{broadcast['failed_count']} failed, {broadcast['blocked_count']} blocked.")
+
+    def _deliver(self, broadcast, user):
+        """پیام را برای یک کاربر می‌فرستد و (user_id, status, error) برمی‌گرداند."""
+        with send_priority(PRIORITY_BULK):
+            try:
+                self._send(broadcast, user['telegram_id'])
+                return user['id'], 'sent', None
+            except telebot.apihelper.ApiTelegramException as e:
+                # 403: کاربر ربات را مسدود کرده یا حسابش حذف شده است
+                status = 'blocked' if e.error_code == 403 else 'failed'
+                return user['id'], status, e.description[:200]
+            except Exception as e:
+                return user['id'], 'failed', str(e)[:200]
+
+    def _send(self, broadcast, chat_id):
+        content_type = broadcast['content_type']
+        if content_type == 'forward':
+            return self.bot.forward_message(chat_id, broadcast['source_chat_id'], broadcast['source_message_id'])
+        entities = [types.MessageEntity.de_json(e) for e in json.loads(broadcast['entities_json'])] \
+            if broadcast['entities_json'] else None
+        if content_type == 'photo':
+            return self.bot.send_photo(chat_id, broadcast['file_id'], caption=broadcast['text'], caption_entities=entities)
+        return self.bot.send_message(chat_id, broadcast['text'], entities=entities)
+
+    def _report_progress(self, broadcast):
+        if not broadcast['status_message_id']:
+            return
+        text = messages.BROADCAST_PROGRESS.format(
+            id=broadcast['id'], status=messages.BROADCAST_STATUS_LABELS.get(broadcast['status'], broadcast['status']),
+            sent=broadcast['sent_count'], failed=broadcast['failed_count'], blocked=broadcast['blocked_count'],
+            total=broadcast['total_recipients']
+        )
+        markup = inline_keyboards.get_broadcast_progress_menu(broadcast['id']) if broadcast['status'] == 'running' else None
+        with send_priority(PRIORITY_NOTIFICATION):
+            try:
+                self.bot.edit_message_text(text, broadcast['status_chat_id'], broadcast['status_message_id'],
+                                           parse_mode='Markdown', reply_markup=markup)
+            except telebot.apihelper.ApiTelegramException as e:
+                if 'message is not modified' not in e.description:
+                    logger.warning(f"Could not update progress of broadcast {broadcast['id']}: {e}")
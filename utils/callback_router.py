@@ -0,0 +1,161 @@
+# utils/callback_router.py
+
+import logging
+
+import telebot
+
+from utils import helpers, messages
+from utils.metrics import set_handler_label
+
+logger = logging.getLogger(__name__)
+
+# حداکثر طول callback_data در تلگرام (بایت)
+MAX_CALLBACK_DATA_BYTES = 64
+ARG_SEPARATOR = ':'
+
+
+class _Route:
+    __slots__ = ('name', 'handler', 'arg_types', 'admin_only', 'answer')
+
+    def __init__(self, name, handler, arg_types, admin_only, answer):
+        self.name = name
+        self.handler = handler
+        self.arg_types = arg_types
+        self.admin_only = admin_only
+        self.answer = answer
+
+
+class _TrieNode:
+    __slots__ = ('children', 'route')
+
+    def __init__(self):
+        self.children = {}
+        self.route = None
+
+
+class CallbackRouter:
+    """
+    مسیریاب دکمه‌های شیشه‌ای. هر مسیر یک نام و آرگومان‌های نوع‌دار دارد و callback_data به
+    شکل فشرده `name:arg1:arg2` ساخته می‌شود. مسیرها فقط یک بار ثبت می‌شوند و کل ربات یک
+    callback_query_handler دارد، پس هزینه هر کلیک با اضافه شدن امکانات جدید ثابت می‌ماند.
+
+    دکمه‌های قدیمی که هنوز در چت کاربران هستند (مثل `admin_approve_payment_12`) با یک
+    درخت پیشوندی روی `name_` شناسایی و آرگومان‌هایشان با `_` جدا می‌شوند.
+    """
+
+    def __init__(self):
+        self._routes = {}
+        self._legacy = _TrieNode()
+        self._fallbacks = []
+        # ActionThrottle اختیاری؛ کلیک‌های بیش از حد کاربران (نه ادمین‌ها) قبل از اجرای هندلر رد می‌شوند
+        self.throttle = None
+
+    @classmethod
+    def for_bot(cls, bot: telebot.TeleBot):
+        """مسیریاب مشترک یک ربات؛ در اولین فراخوانی به عنوان هندلر کلیک‌ها ثبت می‌شود."""
+        router = getattr(bot, '_callback_router', None)
+        if router is None:
+            router = bot._callback_router = cls()
+
+            def handle_callback_query(call):
+                router.dispatch(bot, call)
+            bot.register_callback_query_handler(handle_callback_query, func=None)
+        return router
+
+    # --- ثبت مسیرها ---
+    def add(self, name, handler, *arg_types, admin_only=False, answer=True):
+        """
+        handler(call, *args) را برای مسیر name ثبت می‌کند. arg_types نوع آرگومان‌ها (مثلاً int
+        یا str) است. answer=True یعنی کلیک قبل از اجرای هندلر پاسخ داده می‌شود.
+        """
+        if ARG_SEPARATOR in name:
+            raise ValueError(f"Callback route name '{name}' must not contain '{ARG_SEPARATOR}'.")
+        if name in self._routes:
+            raise ValueError(f"Callback route '{name}' is already registered.")
+        route = _Route(name, handler, tuple(arg_types), admin_only, answer)
+        self._routes[name] = route
+        if arg_types:
+            node = self._legacy
+            for char in f"{name}_":
+                node = node.children.setdefault(char, _TrieNode())
+            node.route = route
+
+    def route(self, name, *arg_types, admin_only=False, answer=True):
+        def decorator(handler):
+            self.add(name, handler, *arg_types, admin_only=admin_only, answer=answer)
+            return handler
+        return decorator
+
+    def fallback(self, handler):
+        """handler(call) برای کلیک‌هایی که مسیری ندارند صدا زده می‌شود؛ True یعنی رسیدگی شد."""
+        self._fallbacks.append(handler)
+        return handler
+
+    # --- ساخت و تجزیه callback_data ---
+    @staticmethod
+    def build(name, *args):
+        data = ARG_SEPARATOR.join([name] + [str(int(a) if isinstance(a, bool) else a) for a in args])
+        if len(data.encode('utf-8')) > MAX_CALLBACK_DATA_BYTES:
+            raise ValueError(f"Callback data '{data}' exceeds {MAX_CALLBACK_DATA_BYTES} bytes.")
+        return data
+
+    def resolve(self, data):
+        """(route, args) مربوط به callback_data یا None اگر مسیری پیدا نشود."""
+        if not data:
+            return None
+        if ARG_SEPARATOR in data:
+            name, _, raw = data.partition(ARG_SEPARATOR)
+            route = self._routes.get(name)
+            raw_args = raw.split(ARG_SEPARATOR, len(route.arg_types) - 1) if route and route.arg_types else []
+        else:
+            route = self._routes.get(data)
+            raw_args = []
+            if route is None or route.arg_types:
+                route, raw_args = self._resolve_legacy(data)
+        if route is None or len(raw_args) != len(route.arg_types):
+            return None
+        try:
+            return route, [arg_type(raw) for arg_type, raw in zip(route.arg_types, raw_args)]
+        except ValueError:
+            return None
+
+    def _resolve_legacy(self, data):
+        node, matched, matched_at = self._legacy, None, 0
+        for index, char in enumerate(data):
+            node = node.children.get(char)
+            if node is None:
+                break
+            if node.route is not None:
+                matched, matched_at = node.route, index + 1
+        if matched is None:
+            return None, []
+        return matched, data[matched_at:].split('_', len(matched.arg_types) - 1)
+
+    # --- اجرای هندلر ---
+    def dispatch(self, bot, call):
+        resolved = self.resolve(call.data)
+        if resolved and resolved[0].admin_only and not helpers.is_admin(call.from_user.id):
+            logger.warning(f"User {call.from_user.id} tried admin callback '{call.data}'.")
+            resolved = None
+        if resolved is None:
+            for handler in self._fallbacks:
+                if handler(call):
+                    return
+            bot.answer_callback_query(call.id)
+            return
+        route, args = resolved
+        # زمان اجرای کلیک با نام مسیر (نه هندلر عمومی مسیریاب) در متریک‌ها ثبت می‌شود
+        set_handler_label(f"callback:{route.name}")
+        if self.throttle is not None and not helpers.is_admin(call.from_user.id):
+            allowed, retry_after = self.throttle.check(call.from_user.id, route.name)
+            if not allowed:
+                bot.answer_callback_query(call.id, messages.ACTION_THROTTLED.format(seconds=retry_after))
+                return
+        if route.answer:
+            bot.answer_callback_query(call.id)
+        route.handler(call, *args)
+
+
+def callback_data(name, *args):
+    """callback_data فشرده یک مسیر را می‌سازد (مثلاً `admin_approve_payment:12`)."""
+    return CallbackRouter.build(name, *args)
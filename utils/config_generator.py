@@ -17,9 +17,24 @@ class ConfigGenerator:
         self.db_manager = db_manager
         logger.info("ConfigGenerator initialized.")
 
-    def create_client_and_configs(self, user_telegram_id: int, server_id: int, total_gb: float, duration_days: int or None):
+    @staticmethod
+    def new_client_identity():
+        """
+        شناسه‌های تصادفی کلاینت (subId، پایه UUID و پسوند ایمیل). اگر قبل از ساخت کلاینت ذخیره
+        شوند، تکرار create_client_and_configs با همین مقادیر کلاینت تکراری در پنل نمی‌سازد.
+        """
+        return {
+            'sub_id': generate_random_string(12),
+            'uuid_seed': str(uuid.uuid4()),
+            'email_suffix': generate_random_string(4),
+        }
+
+    def create_client_and_configs(self, user_telegram_id: int, server_id: int, total_gb: float, duration_days: int or None,
+                                  identity=None):
         """
         کلاینت را در پنل X-UI ایجاد می‌کند و لینک سابسکریپشن و کانفیگ‌های تکی را برمی‌گرداند.
+        identity (خروجی new_client_identity) شناسه‌های کلاینت را ثابت می‌کند؛ کلاینتی که در
+        تلاش قبلی با همین شناسه‌ها ساخته شده دوباره ساخته نمی‌شود.
         """
         logger.info(f"Starting config generation for user:{user_telegram_id} on server:{server_id}")
 
@@ -42,7 +57,9 @@ class ConfigGenerator:
             return None, None, None
 
         # --- ۱. آماده‌سازی اطلاعات کلاینت ---
-        master_sub_id = generate_random_string(12)
+        identity = identity or self.new_client_identity()
+        master_sub_id = identity['sub_id']
+        uuid_seed = uuid.UUID(identity['uuid_seed'])
         expiry_time_ms = 0
         if duration_days is not None and duration_days > 0:
             expire_date = datetime.datetime.now() + datetime.timedelta(days=duration_days)
@@ -63,8 +80,8 @@ class ConfigGenerator:
         # --- ۳. حلقه روی اینباندها و ساخت کلاینت در پنل ---
         for db_inbound in active_inbounds_from_db:
             inbound_id_on_panel = db_inbound['inbound_id']
-            client_uuid = str(uuid.uuid4())
-            client_email = f"u{user_telegram_id}.s{server_id}.{generate_random_string(4)}"
+            client_uuid = str(uuid.uuid5(uuid_seed, str(inbound_id_on_panel)))
+            client_email = f"u{user_telegram_id}.s{server_id}.{identity['email_suffix']}{inbound_id_on_panel}"
 
             if not representative_client_uuid:
                 representative_client_uuid = client_uuid
@@ -88,8 +105,11 @@ class ConfigGenerator:
             
             logger.info(f"Adding client {client_email} to inbound {inbound_id_on_panel}...")
             if not temp_xui_client.add_client(add_client_payload):
-                logger.error(f"Failed to add client to inbound {inbound_id_on_panel}. Aborting.")
-                return None, None, None
+                # ممکن است کلاینت در تلاش قبلی ساخته شده ولی پاسخ آن نرسیده باشد
+                if temp_xui_client.get_client_traffics(client_email) is None:
+                    logger.error(f"Failed to add client to inbound {inbound_id_on_panel}. Aborting.")
+                    return None, None, None
+                logger.info(f"Client {client_email} already exists on inbound {inbound_id_on_panel}; reusing it.")
 
             # --- ۴. ساخت کانفیگ تکی برای کلاینت ایجاد شده ---
             inbound_details = temp_xui_client.get_inbound(inbound_id_on_panel)
@@ -97,13 +117,25 @@ class ConfigGenerator:
                 logger.warning(f"Could not get details for inbound {inbound_id_on_panel}. Skipping single config.")
                 continue
 
-            single_config_url = self._generate_single_config_url(
-                client_uuid=client_uuid,
+            # قالب کانفیگ یک بار برای اینباند ساخته و ذخیره می‌شود؛ کانفیگ کلاینت فقط جایگزینی UUID است
+            placeholder = self.db_manager.CONFIG_UUID_PLACEHOLDER
+            config_template = self._generate_single_config_url(
+                client_uuid=placeholder,
                 server_data=server_data,
                 inbound_panel_details=inbound_details
             )
-            if single_config_url:
-                all_generated_configs.append(single_config_url)
+            if config_template:
+                self.db_manager.set_inbound_config_template(
+                    server_id, inbound_id_on_panel, config_template['url'],
+                    protocol=config_template['protocol'], network=config_template['network'],
+                    remark=config_template['remark']
+                )
+                all_generated_configs.append({
+                    **config_template,
+                    "url": config_template['url'].replace(placeholder, client_uuid),
+                    "inbound_id": inbound_id_on_panel,
+                    "client_uuid": client_uuid
+                })
         
         # --- ۵. ساخت لینک نهایی سابسکریپشن ---
         sub_base_url = server_data['subscription_base_url'].rstrip('/')
@@ -6,10 +6,15 @@ import random
 import string
 
 # این خط برای دسترسی به لیست ادمین‌ها اضافه شده است
-from config import ADMIN_IDS
+from config import ADMIN_IDS, MEMBERSHIP_CACHE_TTL_SECONDS, MEMBERSHIP_NEGATIVE_TTL_SECONDS
+from utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+MEMBER_STATUSES = ('member', 'creator', 'administrator')
+# (channel_id, user_id) -> عضو هست یا نه
+_membership_cache = TTLCache(max_entries=50000, ttl_seconds=MEMBERSHIP_CACHE_TTL_SECONDS)
+
 
 # تابع is_admin در اینجا تعریف شده است
 def is_admin(user_id: int) -> bool:
@@ -19,18 +24,33 @@ def is_admin(user_id: int) -> bool:
 
 def is_user_member_of_channel(bot: telebot.TeleBot, channel_id: int, user_id: int) -> bool:
     """
-    بررسی می‌کند که آیا کاربر در کانال مورد نظر عضو است یا خیر.
+    بررسی می‌کند که آیا کاربر در کانال مورد نظر عضو است یا خیر. نتیجه کش می‌شود تا هر /start
+    یا کلیک یک درخواست get_chat_member به تلگرام نفرستد.
     """
     if channel_id is None:
         return True
 
+    cached = _membership_cache.get((channel_id, user_id))
+    if cached is not None:
+        return cached
     try:
         chat_member = bot.get_chat_member(channel_id, user_id)
-        return chat_member.status in ['member', 'creator', 'administrator']
     except Exception as e:
         logger.error(f"Error checking user {user_id} membership in channel {channel_id}: {e}")
         # در صورت بروز خطا (مثلا اگر ربات از کانال حذف شده باشد)، دسترسی را مجاز می‌دانیم تا ربات متوقف نشود
         return True
+    is_member = chat_member.status in MEMBER_STATUSES
+    _membership_cache.set((channel_id, user_id), is_member,
+                          ttl=None if is_member else MEMBERSHIP_NEGATIVE_TTL_SECONDS)
+    return is_member
+
+
+def update_channel_membership(chat_member_updated) -> None:
+    """کش عضویت را با آپدیت chat_member تلگرام (وقتی ربات ادمین کانال است) به‌روز می‌کند."""
+    new_member = chat_member_updated.new_chat_member
+    is_member = new_member.status in MEMBER_STATUSES
+    _membership_cache.set((chat_member_updated.chat.id, new_member.user.id), is_member,
+                          ttl=None if is_member else MEMBERSHIP_NEGATIVE_TTL_SECONDS)
 
 
 def is_float_or_int(value) -> bool:
@@ -62,4 +82,13 @@ def generate_random_string(length=10) -> str:
     یک رشته تصادفی از حروف کوچک و اعداد به طول مشخص تولید می‌کند.
     """
     characters = string.ascii_lowercase + string.digits
-    return ''.join(random.choice(characters) for i in range(length))
\ No newline at end of file
+    return ''.join(random.choice(characters) for i in range(length))
+
+
+def format_bytes(num_bytes) -> str:
+    """
+    حجم را به صورت خوانا (مگابایت یا گیگابایت) برمی‌گرداند.
+    """
+    if num_bytes < 1024 ** 3:
+        return f"{num_bytes / 1024 ** 2:.0f} MB"
+    return f"{num_bytes / 1024 ** 3:.2f} GB"
@@ -0,0 +1,89 @@
+# utils/job_queue.py
+
+import logging
+import threading
+
+from utils.send_scheduler import send_priority, PRIORITY_NOTIFICATION
+
+logger = logging.getLogger(__name__)
+
+
+class PermanentJobError(Exception):
+    """خطایی که تلاش مجدد آن بی‌فایده است؛ کار مستقیماً به وضعیت failed می‌رود."""
+
+
+class JobQueue:
+    """
+    صف کار ماندگار روی جدول jobs دیتابیس با چند ترد کارگر. کارها پس از ری‌استارت از دست
+    نمی‌روند و در صورت خطا با تأخیر افزایشی دوباره اجرا می‌شوند.
+    """
+
+    def __init__(self, db_manager, workers=2, poll_interval=2.0, retry_base_delay=30, stale_after_seconds=900):
+        self.db_manager = db_manager
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.retry_base_delay = retry_base_delay
+        self.stale_after_seconds = stale_after_seconds
+        self._handlers = {}
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._threads = []
+
+    def register(self, job_type, handler, on_final_failure=None):
+        """
+        handler(payload, job) کار را انجام می‌دهد. on_final_failure(payload, job, error) وقتی
+        صدا زده می‌شود که همه تلاش‌ها شکست خورده باشند.
+        """
+        self._handlers[job_type] = (handler, on_final_failure)
+
+    def enqueue(self, job_type, payload, dedupe_key=None, max_attempts=5):
+        job_id = self.db_manager.enqueue_job(job_type, payload, dedupe_key=dedupe_key, max_attempts=max_attempts)
+        self._wakeup.set()
+        return job_id
+
+    def start(self):
+        # کارهایی که هنگام توقف قبلی نیمه‌کاره مانده‌اند دوباره در صف قرار می‌گیرند
+        self.db_manager.requeue_stale_jobs(self.stale_after_seconds)
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{i + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Job queue started with {self.workers} workers for {list(self._handlers)}.")
+
+    def stop(self):
+        self._stop_event.set()
+        self._wakeup.set()
+
+    def _worker(self):
+        # پیام‌های کارهای پس‌زمینه بعد از پاسخ‌های تعاملی کاربران ارسال می‌شوند
+        with send_priority(PRIORITY_NOTIFICATION):
+            self._work_loop()
+
+    def _work_loop(self):
+        while not self._stop_event.is_set():
+            job = self.db_manager.claim_next_job(list(self._handlers))
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._run(job)
+
+    def _run(self, job):
+        handler, on_final_failure = self._handlers[job['job_type']]
+        try:
+            handler(job['payload'], job)
+            self.db_manager.complete_job(job['id'])
+        except Exception as e:
+            final = isinstance(e, PermanentJobError) or job['attempts'] >= job['max_attempts']
+            if final:
+                logger.error(f"Job {job['id']} ({job['job_type']}) failed permanently: {e}", exc_info=True)
+                self.db_manager.fail_job(job['id'], e)
+                if on_final_failure:
+                    try:
+                        on_final_failure(job['payload'], job, e)
+                    except Exception as notify_error:
+                        logger.error(f"Error in failure handler of job {job['id']}: {notify_error}")
+            else:
+                delay = self.retry_base_delay * 2 ** (job['attempts'] - 1)
+                logger.warning(f"Job {job['id']} ({job['job_type']}) failed on attempt {job['attempts']}, retrying in {delay}s: {e}")
+                self.db_manager.fail_job(job['id'], e, retry_delay_seconds=delay)
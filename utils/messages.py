@@ -16,6 +16,18 @@ INVALID_NUMBER_INPUT = "ورودی نامعتبر است. لطفاً یک عدد
 # SECTION: پیام‌های پنل ادمین
 # =============================================================================
 ADMIN_WELCOME = "👑 به پنل مدیریت Alamor VPN خوش آمدید!\n\nاز طریق دکمه‌های زیر می‌توانید ربات را مدیریت کنید."
+ADMIN_DASHBOARD_TEXT = (
+    "📊 **داشبورد**\n\n"
+    "👥 **کاربران:** `{users_total}` (امروز: `{users_today}`)\n"
+    "📦 **سرویس‌های فعال:** `{purchases_active}`\n"
+    "🧾 **رسیدهای منتظر بررسی:** `{payments_pending}`\n\n"
+    "💰 **درآمد امروز:** `{revenue_today:,.0f}` تومان\n"
+    "💰 **درآمد ۷ روز اخیر:** `{revenue_week:,.0f}` تومان\n"
+    "💰 **درآمد ۳۰ روز اخیر:** `{revenue_month:,.0f}` تومان\n\n"
+    "🌐 **سرورهای آنلاین:** `{servers_online}` از `{servers_total}`\n"
+    "🟢 **کاربران متصل:** `{online_users}`\n\n"
+    "_روزها بر اساس UTC محاسبه می‌شوند._"
+)
 SERVER_MGMT_MENU_TEXT = "⚙️ گزینه‌های مدیریت سرور:"
 PLAN_MGMT_MENU_TEXT = "💰 گزینه‌های مدیریت پلن:"
 PAYMENT_GATEWAY_MGMT_MENU_TEXT = "💳 گزینه‌های مدیریت درگاه‌های پرداخت:"
@@ -91,6 +103,51 @@ GATEWAY_STATUS_TOGGLED_ERROR = "❌ خطایی در تغییر وضعیت درگ
 # --- مدیریت کاربران ---
 LIST_USERS_HEADER = "👥 **لیست کاربران ربات:**\n\n"
 NO_USERS_FOUND = "هیچ کاربری در ربات ثبت‌نام نکرده است."
+SEARCH_USER_PROMPT = "🔎 نام، نام کاربری، آیدی عددی تلگرام، شماره سرویس، ایمیل کلاینت یا لینک اشتراک/کانفیگ کاربر را ارسال کنید:"
+SEARCH_USER_RESULTS_HEADER = "🔎 **نتایج جستجو برای** `{query}`:\n\n"
+SEARCH_USER_NO_RESULTS = "هیچ کاربری با عبارت `{query}` یافت نشد."
+SEARCH_USER_RESULT_ITEM = (
+    "👤 **{first_name}** (@{username})\n"
+    "   آیدی تلگرام: `{telegram_id}` | ID: `{id}`\n"
+    "   تاریخ عضویت: {join_date}\n"
+)
+SEARCH_USER_MATCHED_PURCHASE = "   🔗 سرویس مرتبط: `{purchase_id}`\n"
+
+# --- پیام همگانی ---
+BROADCAST_PROMPT = "📣 پیامی که می‌خواهید برای همه کاربران ارسال شود را بفرستید (متن، عکس یا یک پیام فوروارد شده):"
+BROADCAST_UNSUPPORTED = "❌ این نوع پیام پشتیبانی نمی‌شود. لطفاً متن، عکس یا یک پیام فوروارد شده بفرستید."
+BROADCAST_CONFIRM = "پیام بالا برای `{recipients}` کاربر ارسال شود؟"
+BROADCAST_CREATE_ERROR = "❌ خطا در ثبت پیام همگانی. لطفاً دوباره تلاش کنید."
+BROADCAST_PROGRESS = (
+    "📣 **پیام همگانی #{id}** ({status})\n\n"
+    "✅ ارسال شده: `{sent}` از `{total}`\n"
+    "⚠️ ناموفق: `{failed}`\n"
+    "🚫 ربات را مسدود کرده‌اند: `{blocked}`"
+)
+BROADCAST_STATUS_LABELS = {
+    'queued': "در صف",
+    'running': "در حال ارسال",
+    'done': "پایان یافته",
+    'cancelled': "لغو شده",
+}
+BROADCAST_CANCELLED = "⛔ پیام همگانی #{id} لغو شد."
+BROADCAST_NOT_ACTIVE = "این پیام همگانی قبلاً پایان یافته یا لغو شده است."
+DB_STATS_HEADER = "🗄️ **آمار زمان‌بندی دیتابیس** ({backend})\n\n"
+QUEUE_STATS_TEXT = (
+    "📥 **صف آپدیت‌ها**\n\n"
+    "در انتظار: `{pending}` از `{capacity}`\n"
+    "چت‌های منتظر: `{chats_waiting}` (بیشترین عمق: `{max_chat_depth}`)\n"
+    "کارگرهای مشغول: `{busy_workers}` از `{workers}`\n"
+    "پردازش شده: `{processed}` | رد شده: `{rejected}`\n\n"
+    "📤 **صف ارسال**\n\n"
+    "منتظر ارسال: `{send_waiting}`\n"
+    "ارسال شده: `{send_sent}` (با تأخیر: `{send_delayed}`) | خطای 429: `{send_rate_limited}`\n\n"
+    "🚦 **محدودیت کاربران**\n\n"
+    "مجاز: `{throttle_allowed}` | رد شده: `{throttle_blocked}` (کاربران: `{throttle_users}`)\n"
+    "بیشترین رد: `{throttle_top}`"
+)
+QUEUE_STATS_UNAVAILABLE = "صف آپدیت در این پروسه فعال نیست."
+ACTION_THROTTLED = "⏳ کمی آهسته‌تر! لطفاً {seconds} ثانیه دیگر دوباره امتحان کنید."
 
 # --- نوتیفیکیشن ادمین ---
 ADMIN_NEW_PAYMENT_NOTIFICATION_HEADER = "🔔 **درخواست پرداخت جدید** 🔔\n\n"
@@ -104,11 +161,27 @@ ADMIN_NEW_PAYMENT_NOTIFICATION_DETAILS = (
 )
 ADMIN_PAYMENT_CONFIRMED_DISPLAY = "✅ *این پرداخت توسط {admin_username} تأیید شد.*"
 ADMIN_PAYMENT_REJECTED_DISPLAY = "❌ *این پرداخت توسط {admin_username} رد شد.*"
+PAYMENT_ALREADY_PROCESSED = "این پرداخت قبلاً پردازش شده است."
+PROVISIONING_QUEUED_ADMIN = "⏳ در صف ساخت سرویس..."
+PROVISIONING_IN_PROGRESS = "⏳ در حال ساخت سرویس... (تلاش {attempt})"
+PROVISIONING_FAILED_ADMIN = "❌ ساخت سرویس پس از {attempts} تلاش ناموفق بود. جزئیات در لاگ ربات ثبت شده است."
+PROVISIONING_FAILED_ONLINE_ADMIN = (
+    "❌ ساخت سرویس پرداخت آنلاین #{payment_id} (کاربر {user_id}، کد رهگیری {ref_id}) پس از {attempts} تلاش ناموفق بود.\n"
+    "مبلغ از کاربر دریافت شده است؛ پس از رفع مشکل، ساخت سرویس را دوباره اجرا کنید."
+)
+PROVISIONING_RETRY_FAILED_ADMIN = "ساخت دوباره این سرویس ممکن نیست (پرداخت در حال پردازش است یا قبلاً تکمیل شده)."
+PROVISIONING_STARTED_USER = "✅ پرداخت شما تأیید شد. سرویس شما در حال ساخت است، لطفاً چند لحظه صبر کنید..."
+PROVISIONING_DONE_USER = "✅ پرداخت شما تأیید و سرویس شما فعال گردید."
+PROVISIONING_FAILED_USER = "❌ در فعال‌سازی سرویس شما خطایی رخ داد. لطفاً با پشتیبانی تماس بگیرید."
+ZARINPAL_PAYMENT_CANCELLED_USER = "شما فرآیند پرداخت را لغو کردید. سفارش شما ناتمام باقی ماند."
+ZARINPAL_PAYMENT_FAILED_USER = "❌ پرداخت شما توسط درگاه تایید نشد. (خطا: {error_message})"
+ZARINPAL_VERIFY_FAILED_USER = "❌ بررسی پرداخت شما با درگاه ممکن نشد. اگر مبلغ از حساب شما کسر شده است، لطفاً با پشتیبانی تماس بگیرید."
 
 # =============================================================================
 # SECTION: پیام‌های پنل کاربر
 # =============================================================================
 USER_MAIN_MENU_TEXT = "👇 لطفاً یکی از گزینه‌های زیر را انتخاب کنید:"
+REQUIRED_CHANNEL_ALERT = "🙏 برای استفاده از ربات ابتدا باید در کانال ما عضو شوید."
 REQUIRED_CHANNEL_PROMPT = "🙏 برای استفاده از امکانات ربات، لطفاً ابتدا در کانال ما عضو شوید:\n{channel_link}\n\nپس از عضویت، دوباره دستور /start را بزنید."
 NO_ACTIVE_SERVERS_FOR_BUY = "😔 متاسفانه در حال حاضر سرور فعالی برای خرید وجود ندارد. لطفاً بعداً دوباره تلاش کنید."
 SELECT_SERVER_PROMPT = "📍 از کدام یک از سرورهای پرسرعت ما می‌خواهید استفاده کنید؟"
@@ -164,6 +237,18 @@ MY_SERVICES_ITEM = (
     "--------------------\n"
 )
 NO_SERVICES_FOUND = "شما در حال حاضر هیچ سرویس فعالی ندارید."
+SERVICE_USAGE_DETAILS = (
+    "\n\n📊 **وضعیت مصرف:**\n"
+    "   **مصرف شده:** {used}\n"
+    "   **باقی‌مانده:** {remaining}\n"
+    "   **تاریخ انقضا:** {expire_date}\n"
+    "   **وضعیت:** {status}"
+)
+SERVICE_USAGE_UNAVAILABLE = "\n\n📊 اطلاعات مصرف در حال حاضر از سرور قابل دریافت نیست؛ لطفاً کمی بعد دوباره تلاش کنید."
+USAGE_UNLIMITED = "نامحدود"
+USAGE_STATUS_ONLINE = "🟢 متصل"
+USAGE_STATUS_OFFLINE = "⚪️ غیرمتصل"
+USAGE_STATUS_DISABLED = "🔴 غیرفعال"
 
 
 # --- مدیریت درگاه پرداخت ---
@@ -0,0 +1,295 @@
+# utils/metrics.py
+
+import os
+import re
+import time
+import bisect
+import logging
+import functools
+import threading
+from urllib.parse import urlsplit
+
+from database.instrumentation import db_stats, LATENCY_BUCKETS_MS
+
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = 'alamor_'
+# مرزهای هیستوگرام تأخیر (ثانیه)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# توضیح متریک‌ها در خروجی /metrics
+METRIC_HELP = {
+    'telegram_updates_total': "Telegram updates handled, by handler and outcome.",
+    'telegram_handler_duration_seconds': "Time spent in Telegram update handlers.",
+    'panel_requests_total': "X-UI panel API requests, by panel, endpoint and HTTP status.",
+    'panel_request_duration_seconds': "Latency of X-UI panel API requests.",
+    'payments_total': "Payment outcomes, by gateway.",
+    'payment_provisioning_duration_seconds': "Time to create the service of a confirmed payment.",
+    'db_method_duration_seconds': "Latency of DatabaseManager methods.",
+    'db_method_errors_total': "DatabaseManager methods that raised or hit a database error.",
+    'update_queue_pending': "Telegram updates waiting in the per-chat update queue.",
+    'update_queue_busy_workers': "Update queue workers currently running a handler.",
+    'update_queue_rejected_total': "Updates rejected because the update queue was full or closed.",
+    'send_queue_waiting': "Bot API calls waiting for a rate limit token.",
+    'send_rate_limited_total': "Bot API calls that received 429 Too Many Requests.",
+    'jobs': "Background jobs in the database, by status.",
+    'process_resident_memory_bytes': "Resident memory of the process.",
+    'process_start_time_seconds': "Start time of the process since the Unix epoch.",
+    'metrics_snapshot_age_seconds': "Seconds since the process last exported its metrics.",
+}
+
+_PROCESS_START_TIME = time.time()
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class _Histogram:
+    __slots__ = ('buckets', 'sum', 'count')
+
+    def __init__(self):
+        # یک خانه اضافه برای مقادیر بزرگ‌تر از آخرین مرز (+Inf)
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+class MetricsRegistry:
+    """
+    شمارنده‌ها و هیستوگرام‌های یک پروسه (thread-safe). مقادیر از شروع پروسه تجمعی‌اند و
+    snapshot آن‌ها به صورت JSON برای خروجی /metrics یا ذخیره در دیتابیس برگردانده می‌شود.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}    # name -> {label_key: value}
+        self._histograms = {}  # name -> {label_key: _Histogram}
+
+    def inc(self, name, value=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            histogram = self._histograms.setdefault(name, {}).get(key)
+            if histogram is None:
+                histogram = self._histograms[name][key] = _Histogram()
+            histogram.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            histogram.sum += seconds
+            histogram.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': {name: [[dict(key), value] for key, value in series.items()]
+                             for name, series in self._counters.items()},
+                'histograms': {name: [[dict(key), _cumulative(h.buckets, LATENCY_BUCKETS), h.sum, h.count]
+                                      for key, h in series.items()]
+                               for name, series in self._histograms.items()},
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+def _cumulative(buckets, bounds):
+    """شمارش هر خانه را به قالب تجمعی Prometheus ([[le, count], ...]) تبدیل می‌کند."""
+    total, result = 0, []
+    for bound, count in zip([*bounds, '+Inf'], buckets):
+        total += count
+        result.append([bound, total])
+    return result
+
+
+# نمونه سراسری هر پروسه
+metrics = MetricsRegistry()
+
+
+# --- هندلرهای تلگرام ---
+_handler_local = threading.local()
+
+
+def timed_handler(function):
+    """
+    هندلر تلگرام را زمان‌بندی می‌کند. برچسب پیش‌فرض نام تابع است و هندلرهای عمومی (مثل
+    مسیریاب دکمه‌ها) می‌توانند با set_handler_label برچسب دقیق‌تری بدهند.
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        _handler_local.label = function.__name__
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            result = function(*args, **kwargs)
+            outcome = 'ok'
+            return result
+        finally:
+            label = _handler_local.label
+            metrics.observe('telegram_handler_duration_seconds', time.perf_counter() - start, handler=label)
+            metrics.inc('telegram_updates_total', handler=label, outcome=outcome)
+    return wrapper
+
+
+def set_handler_label(label):
+    _handler_local.label = label
+
+
+# --- پنل‌های X-UI ---
+# مسیرهایی که بخش آخرشان ایمیل یا شناسه کلاینت است (برای محدود ماندن تعداد سری‌ها)
+_CLIENT_SEGMENT_ROUTES = {'getClientTraffics', 'clientIps', 'clearClientIps', 'resetClientTraffic', 'delClient',
+                          'updateClient'}
+_NUMERIC_SEGMENT = re.compile(r'^\d+$')
+
+
+def panel_endpoint_label(endpoint):
+    parts = endpoint.split('?', 1)[0].split('/')
+    for i, part in enumerate(parts):
+        if _NUMERIC_SEGMENT.match(part):
+            parts[i] = '{id}'
+        elif i and parts[i - 1] in _CLIENT_SEGMENT_ROUTES:
+            parts[i] = '{client}'
+    return '/'.join(parts)
+
+
+def observe_panel_request(panel_url, endpoint, status, seconds):
+    panel = urlsplit(panel_url).netloc or panel_url
+    endpoint = panel_endpoint_label(endpoint)
+    metrics.observe('panel_request_duration_seconds', seconds, panel=panel, endpoint=endpoint)
+    metrics.inc('panel_requests_total', panel=panel, endpoint=endpoint, status=status)
+
+
+# --- پرداخت‌ها ---
+def record_payment_outcome(gateway, outcome):
+    """gateway یکی از 'card' یا 'zarinpal' و outcome یکی از confirmed/rejected/cancelled/failed است."""
+    metrics.inc('payments_total', gateway=gateway, outcome=outcome)
+
+
+# --- وضعیت پروسه ---
+def process_memory_bytes():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        try:
+            import resource
+            # بیشینه حافظه (نه مقدار فعلی)؛ فقط وقتی /proc در دسترس نیست (واحد لینوکس: کیلوبایت)
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        except (ImportError, OSError):
+            return None
+
+
+def collect_process_metrics(bot=None):
+    """
+    snapshot کامل این پروسه: شمارنده‌ها و هیستوگرام‌ها، زمان‌بندی متدهای دیتابیس و
+    مقادیر لحظه‌ای (صف‌ها و حافظه).
+    """
+    snapshot = metrics.snapshot()
+    db_methods = db_stats.snapshot()
+    bounds = [ms / 1000 for ms in LATENCY_BUCKETS_MS]
+    snapshot['histograms']['db_method_duration_seconds'] = [
+        [{'method': method}, _cumulative(list(stats['buckets'].values()), bounds), stats['total_ms'] / 1000, stats['calls']]
+        for method, stats in db_methods.items()
+    ]
+    snapshot['counters']['db_method_errors_total'] = [
+        [{'method': method}, stats['errors']] for method, stats in db_methods.items()
+    ]
+
+    gauges = {'process_resident_memory_bytes': process_memory_bytes(),
+              'process_start_time_seconds': _PROCESS_START_TIME}
+    send_scheduler = getattr(bot, 'send_scheduler', None)
+    if send_scheduler is not None:
+        send_stats = send_scheduler.stats()
+        gauges['send_queue_waiting'] = send_stats['send_waiting']
+        snapshot['counters']['send_rate_limited_total'] = [[{}, send_stats['send_rate_limited']]]
+    update_queue = getattr(bot, 'update_queue', None)
+    if update_queue is not None:
+        queue_stats = update_queue.stats()
+        gauges['update_queue_pending'] = queue_stats['pending']
+        gauges['update_queue_busy_workers'] = queue_stats['busy_workers']
+        snapshot['counters']['update_queue_rejected_total'] = [[{}, queue_stats['rejected']]]
+    snapshot['gauges'] = {name: [[{}, value]] for name, value in gauges.items() if value is not None}
+    snapshot['exported_at'] = time.time()
+    return snapshot
+
+
+class MetricsExporter:
+    """
+    snapshot متریک‌های پروسه ربات را به صورت دوره‌ای در دیتابیس ذخیره می‌کند تا
+    webhook_server (پروسه جدا) آن‌ها را در /metrics نمایش دهد.
+    """
+
+    def __init__(self, db_manager, process_name, bot=None):
+        self.db_manager = db_manager
+        self.process_name = process_name
+        self.bot = bot
+
+    def export(self):
+        return self.db_manager.save_metrics_snapshot(self.process_name, collect_process_metrics(self.bot))
+
+
+# --- قالب متنی Prometheus ---
+def _escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape_label_value(value)}"' for key, value in sorted(labels.items())) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(snapshots):
+    """
+    snapshots: {process_name: snapshot}. خروجی متنی نسخه 0.0.4 Prometheus که در آن هر سری
+    برچسب process دارد.
+    """
+    families = {}  # name -> (type, [lines])
+
+    def family(name, metric_type):
+        return families.setdefault(name, (metric_type, []))[1]
+
+    now = time.time()
+    for process, snapshot in sorted(snapshots.items()):
+        for name, series in snapshot.get('counters', {}).items():
+            lines = family(name, 'counter')
+            for labels, value in series:
+                lines.append(f"{METRIC_PREFIX}{name}{_format_labels({**labels, 'process': process})} {_format_value(value)}")
+        for name, series in snapshot.get('gauges', {}).items():
+            lines = family(name, 'gauge')
+            for labels, value in series:
+                lines.append(f"{METRIC_PREFIX}{name}{_format_labels({**labels, 'process': process})} {_format_value(value)}")
+        for name, series in snapshot.get('histograms', {}).items():
+            lines = family(name, 'histogram')
+            for labels, buckets, total, count in series:
+                labels = {**labels, 'process': process}
+                for bound, cumulative in buckets:
+                    le = bound if bound == '+Inf' else _format_value(float(bound))
+                    lines.append(f"{METRIC_PREFIX}{name}_bucket{_format_labels({**labels, 'le': le})} {cumulative}")
+                lines.append(f"{METRIC_PREFIX}{name}_sum{_format_labels(labels)} {_format_value(float(total))}")
+                lines.append(f"{METRIC_PREFIX}{name}_count{_format_labels(labels)} {count}")
+        if 'exported_at' in snapshot:
+            family('metrics_snapshot_age_seconds', 'gauge').append(
+                f"{METRIC_PREFIX}metrics_snapshot_age_seconds{_format_labels({'process': process})} "
+                f"{_format_value(round(max(now - snapshot['exported_at'], 0.0), 3))}"
+            )
+
+    output = []
+    for name, (metric_type, lines) in sorted(families.items()):
+        if not lines:
+            continue
+        output.append(f"# HELP {METRIC_PREFIX}{name} {METRIC_HELP.get(name, name)}")
+        output.append(f"# TYPE {METRIC_PREFIX}{name} {metric_type}")
+        output.extend(lines)
+    return "\n".join(output) + "\n"
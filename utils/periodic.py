@@ -0,0 +1,46 @@
+# utils/periodic.py
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicJob:
+    """
+    یک کار پس‌زمینه که در یک ترد daemon با فاصله زمانی ثابت اجرا می‌شود.
+    خطای هر اجرا فقط لاگ می‌شود تا اجرای بعدی متوقف نشود.
+    """
+
+    def __init__(self, name, interval_seconds, func, initial_delay=60):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.func = func
+        self.initial_delay = initial_delay
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name=f"job-{self.name}", daemon=True)
+        self._thread.start()
+        logger.info(f"Periodic job '{self.name}' started (every {self.interval_seconds}s).")
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run_once(self):
+        try:
+            return self.func()
+        except Exception as e:
+            logger.error(f"Periodic job '{self.name}' failed: {e}", exc_info=True)
+            return None
+
+    def _run(self):
+        if self._stop_event.wait(self.initial_delay):
+            return
+        while not self._stop_event.is_set():
+            self.run_once()
+            if self._stop_event.wait(self.interval_seconds):
+                break
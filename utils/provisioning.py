@@ -0,0 +1,200 @@
+# utils/provisioning.py
+
+import json
+import time
+import logging
+import datetime
+
+import telebot
+
+from config import JOB_MAX_ATTEMPTS
+from keyboards import inline_keyboards
+from utils import messages
+from utils.bot_helpers import send_subscription_info
+from utils.job_queue import PermanentJobError
+from utils.metrics import metrics, record_payment_outcome
+
+logger = logging.getLogger(__name__)
+
+PROVISION_PAYMENT_JOB = 'provision_payment'
+
+
+def enqueue_payment_provisioning(db_manager, payment_id, source, **details):
+    """
+    ساخت سرویس یک پرداخت تأیید شده را به صف کارها می‌سپارد. source یکی از 'admin' (رسید
+    کارت به کارت) یا 'zarinpal' است. هر پرداخت فقط یک کار در صف دارد؛ اگر کار قبلی آن
+    شکست نهایی خورده باشد (و پرداخت دوباره رزرو شده باشد)، همان کار با payload جدید از نو
+    اجرا می‌شود.
+    """
+    payload = {'payment_id': payment_id, 'source': source, **details}
+    dedupe_key = f"{PROVISION_PAYMENT_JOB}:{payment_id}"
+    job_id = db_manager.enqueue_job(PROVISION_PAYMENT_JOB, payload, dedupe_key=dedupe_key, max_attempts=JOB_MAX_ATTEMPTS)
+    return job_id or db_manager.requeue_failed_job(dedupe_key, payload)
+
+
+def retry_payment_provisioning(db_manager, payment_id):
+    """کار شکست‌خورده ساخت سرویس پرداخت را با همان payload قبلی دوباره اجرا می‌کند."""
+    return db_manager.requeue_failed_job(f"{PROVISION_PAYMENT_JOB}:{payment_id}")
+
+
+def get_order_terms(order_details):
+    """حجم، مدت و شناسه پلن سفارش را برمی‌گرداند."""
+    if order_details['plan_type'] == 'fixed_monthly':
+        plan = order_details['plan_details']
+        return plan['volume_gb'], plan['duration_days'], plan['id']
+    gb_plan = order_details['gb_plan_details']
+    return order_details['requested_gb'], gb_plan.get('duration_days', 0), gb_plan['id']
+
+
+def payment_gateway_label(source):
+    """برچسب درگاه در متریک‌ها: پرداخت‌های تأیید شده توسط ادمین کارت به کارت هستند."""
+    return 'zarinpal' if source == 'zarinpal' else 'card'
+
+
+class PaymentProvisioner:
+    """کار ساخت سرویس در پنل، ثبت خرید و اطلاع‌رسانی به ادمین/کاربر را انجام می‌دهد."""
+
+    def __init__(self, bot: telebot.TeleBot, db_manager, config_generator, admin_notifier=None):
+        self.bot = bot
+        self.db_manager = db_manager
+        self.config_generator = config_generator
+        self.admin_notifier = admin_notifier
+
+    def register(self, job_queue):
+        job_queue.register(PROVISION_PAYMENT_JOB, self.provision, on_final_failure=self.on_final_failure)
+
+    def provision(self, payload, job):
+        started = time.perf_counter()
+        payment_id = payload['payment_id']
+        payment = self.db_manager.get_payment_by_id(payment_id)
+        if not payment:
+            raise PermanentJobError(f"Payment {payment_id} not found.")
+        if payment['status'] == 'confirmed':
+            logger.info(f"Payment {payment_id} is already confirmed; nothing to provision.")
+            return
+        if payment['status'] == 'rejected':
+            raise PermanentJobError(f"Payment {payment_id} was rejected.")
+
+        self._report_progress(payload, messages.PROVISIONING_IN_PROGRESS.format(attempt=job['attempts']))
+
+        user = self.db_manager.get_user_by_id(payment['user_id'])
+        if not user:
+            raise PermanentJobError(f"User of payment {payment_id} not found.")
+        order_details = json.loads(payment['order_details_json'])
+        # پیشرفت تلاش‌های قبلی: کلاینتی که در پنل ساخته شده یا خریدی که ثبت شده دوباره ساخته نمی‌شود
+        progress = json.loads(payment.get('provisioning_json') or '{}')
+        if not progress.get('purchase_id'):
+            progress = self._create_service(payment, user, order_details, progress)
+
+        if payload['source'] == 'zarinpal':
+            confirmed = self.db_manager.confirm_online_payment(payment_id, payload.get('ref_id'))
+        else:
+            confirmed = self.db_manager.update_payment_status(payment_id, True, payload.get('admin_id'))
+        if not confirmed:
+            # سرویس ساخته شده است؛ تلاش بعدی فقط تأیید پرداخت را تکرار می‌کند
+            raise RuntimeError(f"Failed to confirm payment {payment_id} after provisioning.")
+        gateway = payment_gateway_label(payload['source'])
+        record_payment_outcome(gateway, 'confirmed')
+        metrics.observe('payment_provisioning_duration_seconds', time.perf_counter() - started, gateway=gateway)
+
+        self._report_success(payload)
+        self._safe_call(self.bot.send_message, user['telegram_id'], messages.SERVICE_ACTIVATION_SUCCESS_USER)
+        self._safe_call(send_subscription_info, self.bot, user['telegram_id'], progress['sub_link'])
+
+    def _create_service(self, payment, user, order_details, progress):
+        """
+        کلاینت را در پنل می‌سازد و خرید را ثبت می‌کند. شناسه‌های کلاینت پیش از فراخوانی پنل و
+        شناسه خرید در همان تراکنش ثبت خرید روی پرداخت ذخیره می‌شوند.
+        """
+        payment_id = payment['id']
+        total_gb, duration_days, plan_id = get_order_terms(order_details)
+        if not progress.get('client_identity'):
+            progress = {'client_identity': self.config_generator.new_client_identity()}
+            if not self.db_manager.save_payment_provisioning(payment_id, progress):
+                raise RuntimeError(f"Failed to save provisioning progress of payment {payment_id}.")
+
+        client_details, sub_link, single_configs = self.config_generator.create_client_and_configs(
+            user['telegram_id'], order_details['server_id'], total_gb, duration_days,
+            identity=progress['client_identity']
+        )
+        if not client_details:
+            raise RuntimeError("Failed to create the client on the X-UI panel.")
+
+        progress = {**progress, 'sub_link': sub_link}
+        expire_date = (datetime.datetime.now() + datetime.timedelta(days=duration_days)) if duration_days and duration_days > 0 else None
+        purchase_id = self.db_manager.add_purchase(
+            payment['user_id'], order_details['server_id'], plan_id,
+            expire_date.strftime("%Y-%m-%d %H:%M:%S") if expire_date else None,
+            total_gb, client_details['uuid'], client_details['email'],
+            client_details['subscription_id'], single_configs,
+            payment_id=payment_id, provisioning=progress
+        )
+        if not purchase_id:
+            raise RuntimeError("Failed to save the purchase in the database.")
+        return {**progress, 'purchase_id': purchase_id}
+
+    def on_final_failure(self, payload, job, error):
+        # رزرو پرداخت آزاد می‌شود تا ادمین بتواند دوباره آن را تأیید یا رد کند
+        payment_id = payload['payment_id']
+        self.db_manager.release_payment_claim(payment_id)
+        record_payment_outcome(payment_gateway_label(payload['source']), 'failed')
+        if payload['source'] == 'admin':
+            # دکمه‌های تأیید/رد برمی‌گردند؛ تأیید دوباره همین کار را از نو اجرا می‌کند
+            self._edit_admin_caption(payload, messages.PROVISIONING_FAILED_ADMIN.format(attempts=job['attempts']),
+                                     reply_markup=inline_keyboards.get_admin_payment_action_menu(payment_id))
+            return
+        if payload.get('user_message_id'):
+            self._safe_call(self.bot.edit_message_text, messages.PROVISIONING_FAILED_USER,
+                            payload['user_telegram_id'], payload['user_message_id'])
+        # پرداخت آنلاین تأیید شده ولی سرویسی ساخته نشده است؛ ادمین‌ها می‌توانند ساخت را دوباره اجرا کنند
+        if self.admin_notifier:
+            self.admin_notifier.notify_admins(
+                messages.PROVISIONING_FAILED_ONLINE_ADMIN.format(
+                    payment_id=payment_id, user_id=payload.get('user_telegram_id'),
+                    ref_id=payload.get('ref_id'), attempts=job['attempts']
+                ),
+                reply_markup=inline_keyboards.get_admin_provisioning_retry_menu(payment_id)
+            )
+        else:
+            logger.error(f"Provisioning of online payment {payment_id} failed and no admin notifier is configured.")
+
+    # --- اطلاع‌رسانی ---
+    def _report_progress(self, payload, text):
+        if payload['source'] == 'admin':
+            self._edit_admin_caption(payload, text)
+        elif payload.get('user_message_id'):
+            self._safe_call(self.bot.edit_message_text, text, payload['user_telegram_id'], payload['user_message_id'])
+
+    def _report_success(self, payload):
+        if payload['source'] == 'admin':
+            admin_id = payload.get('admin_id')
+            admin_name = str(admin_id)
+            try:
+                admin_user = self.bot.get_chat_member(admin_id, admin_id).user
+                admin_name = f"@{admin_user.username}" if admin_user.username else admin_user.first_name
+            except Exception as e:
+                logger.warning(f"Could not load admin {admin_id} profile: {e}")
+            self._edit_admin_caption(payload, messages.ADMIN_PAYMENT_CONFIRMED_DISPLAY.format(admin_username=admin_name))
+        elif payload.get('user_message_id'):
+            self._safe_call(self.bot.edit_message_text, messages.PROVISIONING_DONE_USER,
+                            payload['user_telegram_id'], payload['user_message_id'])
+
+    def _edit_admin_caption(self, payload, status_text, reply_markup=None):
+        caption = (payload.get('caption') or '') + "\n\n" + status_text
+        if self.admin_notifier:
+            # نسخه پیام همه ادمین‌ها به‌روزرسانی می‌شود
+            self.admin_notifier.update_payment_messages(payload['payment_id'], caption, parse_mode='Markdown',
+                                                        fallback=(payload['chat_id'], payload['message_id']),
+                                                        reply_markup=reply_markup)
+        else:
+            self._safe_call(self.bot.edit_message_caption, caption, payload['chat_id'], payload['message_id'],
+                            parse_mode='Markdown', reply_markup=reply_markup)
+
+    @staticmethod
+    def _safe_call(func, *args, **kwargs):
+        # خطای ارسال پیام نباید باعث تکرار ساخت سرویس شود
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            logger.warning(f"Notification failed in provisioning job: {e}")
+            return None
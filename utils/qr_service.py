@@ -0,0 +1,78 @@
+# utils/qr_service.py
+
+import logging
+import threading
+from io import BytesIO
+from collections import OrderedDict
+
+import qrcode
+import telebot
+
+from config import QR_CACHE_MAX_BYTES
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class QRCodeService:
+    """
+    ساخت و ارسال QR کد لینک اشتراک. تصویر هر لینک فقط یک بار ساخته و در یک LRU با سقف حجم
+    نگه داشته می‌شود و file_id اولین آپلود در تلگرام ذخیره می‌شود؛ نمایش‌های بعدی فقط با
+    file_id ارسال می‌شوند (بدون پردازش و بدون آپلود دوباره).
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024, max_file_ids=20000):
+        self.max_bytes = max_bytes
+        self._images = OrderedDict()  # sub_link -> PNG bytes
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._file_ids = TTLCache(max_entries=max_file_ids, ttl_seconds=30 * 24 * 3600)
+
+    def render(self, sub_link):
+        """تصویر PNG مربوط به لینک را (از کش یا با ساخت جدید) برمی‌گرداند."""
+        with self._lock:
+            data = self._images.get(sub_link)
+            if data is not None:
+                self._images.move_to_end(sub_link)
+                return data
+        bio = BytesIO()
+        # تصویر QR سیاه و سفید است و به صورت PNG چند برابر کم‌حجم‌تر از JPEG ذخیره می‌شود
+        qrcode.make(sub_link).save(bio, 'PNG')
+        data = bio.getvalue()
+        with self._lock:
+            if sub_link not in self._images:
+                self._images[sub_link] = data
+                self._total_bytes += len(data)
+                while self._total_bytes > self.max_bytes and len(self._images) > 1:
+                    _, evicted = self._images.popitem(last=False)
+                    self._total_bytes -= len(evicted)
+        return data
+
+    def send(self, bot: telebot.TeleBot, chat_id, sub_link, caption=None):
+        """QR کد را ارسال می‌کند؛ در صورت وجود file_id از آپلود دوباره صرف‌نظر می‌شود."""
+        file_id = self._file_ids.get(sub_link)
+        if file_id:
+            try:
+                return bot.send_photo(chat_id, file_id, caption=caption)
+            except telebot.apihelper.ApiTelegramException as e:
+                if e.error_code != 400:
+                    raise
+                # file_id دیگر معتبر نیست؛ تصویر دوباره آپلود می‌شود
+                logger.warning(f"Cached QR file_id rejected by Telegram, re-uploading: {e}")
+                self._file_ids.invalidate(sub_link)
+        photo = BytesIO(self.render(sub_link))
+        photo.name = 'qrcode.png'
+        sent_msg = bot.send_photo(chat_id, photo, caption=caption)
+        if sent_msg and sent_msg.photo:
+            self._file_ids.set(sub_link, sent_msg.photo[-1].file_id)
+        return sent_msg
+
+    def stats(self):
+        return {
+            'images': len(self._images),
+            'bytes': self._total_bytes,
+            'file_ids': len(self._file_ids),
+        }
+
+
+qr_service = QRCodeService(max_bytes=QR_CACHE_MAX_BYTES)
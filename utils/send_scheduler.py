@@ -0,0 +1,258 @@
+# utils/send_scheduler.py
+
+import time
+import bisect
+import logging
+import itertools
+import threading
+import contextlib
+from collections import OrderedDict
+
+import telebot
+from telebot.apihelper import ApiTelegramException
+
+logger = logging.getLogger(__name__)
+
+# اولویت ارسال‌ها: عدد کمتر زودتر ارسال می‌شود
+PRIORITY_INTERACTIVE = 0    # پاسخ مستقیم به کاربری که همین الان با ربات کار می‌کند
+PRIORITY_NOTIFICATION = 1   # اعلان به ادمین‌ها و نتیجه کارهای پس‌زمینه
+PRIORITY_BULK = 2           # ارسال‌های انبوه (پیام همگانی، اعلان انقضا)
+
+_priority_local = threading.local()
+
+
+@contextlib.contextmanager
+def send_priority(priority):
+    """اولویت ارسال‌هایی که در این بلوک (و در همین ترد) انجام می‌شوند را تعیین می‌کند."""
+    previous = getattr(_priority_local, 'priority', PRIORITY_INTERACTIVE)
+    _priority_local.priority = priority
+    try:
+        yield
+    finally:
+        _priority_local.priority = previous
+
+
+def current_send_priority():
+    return getattr(_priority_local, 'priority', PRIORITY_INTERACTIVE)
+
+
+class TokenBucket:
+    """سطل توکن ساده: rate توکن در ثانیه تا سقف capacity."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def wait_time(self, now):
+        """چند ثانیه تا در دسترس بودن یک توکن باقی مانده است (0 = همین الان)."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now, 0.0)
+
+    def consume(self):
+        self.tokens -= 1
+
+
+class SendScheduler:
+    """
+    زمان‌بند مرکزی ارسال به Bot API تلگرام. هر ارسال قبل از اجرا یک توکن از سطل کلی و یک
+    توکن از سطل چت مقصد می‌گیرد؛ ترد فراخواننده تا آن زمان منتظر می‌ماند و نتیجه ارسال را
+    مثل قبل مستقیماً دریافت می‌کند. بین ارسال‌های منتظر، اولویت بالاتر و سپس ترتیب ورود
+    رعایت می‌شود، ولی چتی که سطلش خالی است جلوی چت‌های دیگر را نمی‌گیرد.
+
+    ویرایش پیام‌ها (که هر کلیک منو یکی از آن‌هاست) سطل جداگانه و بسیار آزادتری برای هر چت
+    دارند تا جابه‌جایی سریع در منوها پشت محدودیت ارسال پیام جدید نماند؛ سقف کلی برای آن‌ها
+    هم اعمال می‌شود.
+
+    در خطای 429 مقدار retry_after تلگرام رعایت شده و ارسال دوباره تلاش می‌شود.
+    محدودیت‌ها برای هر پروسه جداگانه اعمال می‌شوند.
+    """
+
+    def __init__(self, global_rate=25, chat_rate=1.0, chat_burst=3, group_rate_per_minute=20,
+                 max_retries=3, max_retry_after=60, max_chat_buckets=10000, edit_rate=10.0, edit_burst=10):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.edit_rate = edit_rate
+        self.edit_burst = edit_burst
+        self.group_rate = group_rate_per_minute / 60.0
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+        self.max_chat_buckets = max_chat_buckets
+        self._cond = threading.Condition()
+        self._global = TokenBucket(global_rate, max(1, int(global_rate)))
+        self._chats = OrderedDict()  # (chat_id, is_edit) -> TokenBucket (LRU)
+        self._waiters = []           # [(priority, seq, chat_id, is_edit)] مرتب
+        self._seq = itertools.count()
+        self._sent = 0
+        self._delayed = 0
+        self._rate_limited = 0
+
+    def _chat_bucket(self, chat_id, is_edit=False):
+        key = (chat_id, is_edit)
+        bucket = self._chats.get(key)
+        if bucket is None:
+            # شناسه منفی (یا @username) مربوط به گروه/کانال است که محدودیت دقیقه‌ای دارد
+            try:
+                is_group = int(chat_id) < 0
+            except ValueError:
+                is_group = True
+            if is_edit:
+                bucket = TokenBucket(self.edit_rate, self.edit_burst)
+            elif is_group:
+                bucket = TokenBucket(self.group_rate, 1)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chats[key] = bucket
+            while len(self._chats) > self.max_chat_buckets:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(key)
+        return bucket
+
+    def _wait_time(self, ticket, now):
+        """
+        زمان انتظار این نوبت. None یعنی نوبت دیگری با اولویت بالاتر آماده ارسال است و باید
+        تا اطلاع بعدی صبر کرد.
+        """
+        global_wait = self._global.wait_time(now)
+        for waiter in self._waiters:
+            chat_wait = self._chat_bucket(waiter[2], waiter[3]).wait_time(now) if waiter[2] is not None else 0.0
+            if waiter is ticket:
+                return max(chat_wait, global_wait)
+            if chat_wait == 0.0:
+                return global_wait or None
+        return global_wait
+
+    def acquire(self, chat_id, priority=None, is_edit=False):
+        """تا زمانی که ارسال به chat_id مجاز شود صبر می‌کند و توکن‌های آن را برمی‌دارد."""
+        if priority is None:
+            priority = current_send_priority()
+        ticket = (priority, next(self._seq), chat_id, is_edit)
+        with self._cond:
+            bisect.insort(self._waiters, ticket)
+            delayed = False
+            try:
+                while True:
+                    wait = self._wait_time(ticket, time.monotonic())
+                    if wait == 0.0:
+                        break
+                    delayed = True
+                    self._cond.wait(min(wait, 1.0) if wait is not None else 1.0)
+                self._global.consume()
+                if chat_id is not None:
+                    self._chat_bucket(chat_id, is_edit).consume()
+                self._sent += 1
+                self._delayed += delayed
+            finally:
+                self._waiters.remove(ticket)
+                self._cond.notify_all()
+
+    def backoff(self, chat_id, retry_after):
+        """
+        خطای 429: چت مقصد تا retry_after ثانیه مسدود و سطل کلی خالی می‌شود تا فشار روی
+        API کم شود.
+        """
+        with self._cond:
+            now = time.monotonic()
+            self._rate_limited += 1
+            if chat_id is not None:
+                # مسدود شدن چت هم ارسال‌ها و هم ویرایش‌های آن را متوقف می‌کند
+                for is_edit in (False, True):
+                    bucket = self._chat_bucket(chat_id, is_edit)
+                    bucket.blocked_until = max(bucket.blocked_until, now + retry_after)
+            self._global.wait_time(now)
+            self._global.tokens = min(self._global.tokens, 0)
+            self._cond.notify_all()
+
+    def call(self, chat_id, func, /, *args, **kwargs):
+        """func را با رعایت محدودیت‌ها اجرا و در صورت 429 دوباره تلاش می‌کند."""
+        return self._call(chat_id, False, func, args, kwargs)
+
+    def call_edit(self, chat_id, func, /, *args, **kwargs):
+        """مثل call برای ویرایش پیام‌ها، با سطل جداگانه و آزادتر هر چت."""
+        return self._call(chat_id, True, func, args, kwargs)
+
+    def _call(self, chat_id, is_edit, func, args, kwargs):
+        attempt = 0
+        while True:
+            self.acquire(chat_id, is_edit=is_edit)
+            try:
+                return func(*args, **kwargs)
+            except ApiTelegramException as e:
+                if e.error_code != 429 or attempt >= self.max_retries:
+                    raise
+                retry_after = (e.result_json or {}).get('parameters', {}).get('retry_after', 1)
+                if retry_after > self.max_retry_after:
+                    raise
+                attempt += 1
+                logger.warning(f"Telegram rate limit for chat {chat_id}; retrying in {retry_after}s (attempt {attempt}).")
+                self.backoff(chat_id, retry_after)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'send_waiting': len(self._waiters),
+                'send_sent': self._sent,
+                'send_delayed': self._delayed,
+                'send_rate_limited': self._rate_limited,
+            }
+
+
+def create_send_scheduler():
+    """زمان‌بند ارسال را بر اساس تنظیمات SEND_*_ALAMOR در فایل .env می‌سازد."""
+    from config import (SEND_GLOBAL_RATE, SEND_CHAT_RATE, SEND_CHAT_BURST, SEND_GROUP_RATE_PER_MINUTE,
+                        SEND_MAX_RETRIES, SEND_MAX_RETRY_AFTER, SEND_EDIT_RATE, SEND_EDIT_BURST)
+    return SendScheduler(global_rate=SEND_GLOBAL_RATE, chat_rate=SEND_CHAT_RATE, chat_burst=SEND_CHAT_BURST,
+                         group_rate_per_minute=SEND_GROUP_RATE_PER_MINUTE, max_retries=SEND_MAX_RETRIES,
+                         max_retry_after=SEND_MAX_RETRY_AFTER, edit_rate=SEND_EDIT_RATE, edit_burst=SEND_EDIT_BURST)
+
+
+# متدهای ارسال/ویرایش TeleBot و جایگاه آرگومان chat_id در آن‌ها
+SCHEDULED_METHODS = {
+    'send_message': 0,
+    'send_photo': 0,
+    'send_document': 0,
+    'send_video': 0,
+    'send_animation': 0,
+    'send_media_group': 0,
+    'copy_message': 0,
+    'forward_message': 0,
+    'edit_message_text': 1,
+    'edit_message_caption': 1,
+    'edit_message_media': 1,
+    'edit_message_reply_markup': 0,
+}
+# ویرایش‌ها از سطل جداگانه ویرایش هر چت استفاده می‌کنند
+EDIT_METHODS = {'edit_message_text', 'edit_message_caption', 'edit_message_media', 'edit_message_reply_markup'}
+
+
+def _scheduled_method(name, chat_id_position):
+    def method(self, *args, **kwargs):
+        parent = getattr(super(ScheduledTeleBot, self), name)
+        if self.send_scheduler is None:
+            return parent(*args, **kwargs)
+        chat_id = kwargs.get('chat_id', args[chat_id_position] if len(args) > chat_id_position else None)
+        if name in EDIT_METHODS:
+            return self.send_scheduler.call_edit(chat_id, parent, *args, **kwargs)
+        return self.send_scheduler.call(chat_id, parent, *args, **kwargs)
+    method.__name__ = name
+    return method
+
+
+class ScheduledTeleBot(telebot.TeleBot):
+    """
+    TeleBot که همه ارسال‌ها و ویرایش‌های پیام را از SendScheduler عبور می‌دهد؛ کد هندلرها
+    بدون تغییر همان `bot.send_message(...)` را صدا می‌زند.
+    """
+
+    def __init__(self, token, send_scheduler=None, **kwargs):
+        super().__init__(token, **kwargs)
+        self.send_scheduler = send_scheduler or create_send_scheduler()
+
+
+for _name, _position in SCHEDULED_METHODS.items():
+    setattr(ScheduledTeleBot, _name, _scheduled_method(_name, _position))
@@ -0,0 +1,188 @@
+# utils/state_store.py
+
+import abc
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+_stores = []
+
+
+def _dumps(value):
+    # JSON فشرده (بدون فاصله و بدون escape حروف فارسی) برای کم بودن حجم هر وضعیت
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+
+
+class StateStore(abc.ABC):
+    """
+    انبار وضعیت گفتگوی کاربران/ادمین‌ها با رابطی شبیه dict.
+
+    هندلرها وضعیت را مستقیماً تغییر می‌دهند (مثلاً `states[uid]['data']['x'] = 1`)؛ برای همین
+    هر ترد یک «جلسه» دارد که اشیای خوانده شده را نگه می‌دارد و flush() در پایان پردازش هر
+    آپدیت، تغییرات را در انبار ذخیره می‌کند. انتساب و حذف مستقیم بلافاصله ذخیره می‌شوند.
+    """
+
+    def __init__(self, ttl_seconds=3600):
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        _stores.append(self)
+
+    # --- رابط پیاده‌سازی‌ها ---
+    @abc.abstractmethod
+    def _load(self, key):
+        """رشته JSON ذخیره شده برای key یا None."""
+
+    @abc.abstractmethod
+    def _save(self, key, blob):
+        """رشته JSON وضعیت key را ذخیره می‌کند."""
+
+    @abc.abstractmethod
+    def _delete(self, key):
+        """وضعیت key را حذف می‌کند."""
+
+    def purge_expired(self):
+        return 0
+
+    # --- جلسه ترد جاری ---
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = {}
+        return session
+
+    def flush(self):
+        """تغییرات درجای وضعیت‌های خوانده شده در این ترد را ذخیره و جلسه را پاک می‌کند."""
+        session = self._session()
+        self._local.session = {}
+        for key, (value, blob) in session.items():
+            if value is None:
+                continue
+            new_blob = _dumps(value)
+            if new_blob != blob:
+                self._save(key, new_blob)
+
+    # --- رابط dict ---
+    def get(self, key, default=None):
+        session = self._session()
+        if key not in session:
+            blob = self._load(key)
+            session[key] = (json.loads(blob) if blob else None, blob)
+        value = session[key][0]
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        blob = _dumps(value)
+        self._save(key, blob)
+        self._session()[key] = (value, blob)
+
+    def __delitem__(self, key):
+        self._delete(key)
+        self._session()[key] = (None, None)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def pop(self, key, default=None):
+        value = self.get(key)
+        if value is None:
+            return default
+        del self[key]
+        return value
+
+
+class MemoryStateStore(StateStore):
+    """انبار داخل حافظه با حداکثر تعداد ورودی (LRU) و انقضای زمانی (TTL)."""
+
+    def __init__(self, ttl_seconds=3600, max_entries=10000):
+        super().__init__(ttl_seconds)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (blob, expires_at)
+        self._lock = threading.Lock()
+
+    def _load(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def _save(self, key, blob):
+        with self._lock:
+            self._entries[key] = (blob, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def purge_expired(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (_, expires_at) in self._entries.items() if expires_at <= now]
+            for key in expired:
+                del self._entries[key]
+        return len(expired)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DatabaseStateStore(StateStore):
+    """
+    انبار ماندگار در جدول conversation_states دیتابیس ربات؛ پس از ری‌استارت باقی می‌ماند و
+    بین چند پروسه (مثلاً چند نمونه وب‌هوک) مشترک است.
+    """
+
+    def __init__(self, db_manager, namespace, ttl_seconds=3600):
+        super().__init__(ttl_seconds)
+        self.db_manager = db_manager
+        self.namespace = namespace
+
+    def _load(self, key):
+        return self.db_manager.get_conversation_state(self.namespace, str(key))
+
+    def _save(self, key, blob):
+        self.db_manager.save_conversation_state(self.namespace, str(key), blob, time.time() + self.ttl_seconds)
+
+    def _delete(self, key):
+        self.db_manager.delete_conversation_state(self.namespace, str(key))
+
+    def purge_expired(self):
+        return self.db_manager.purge_expired_conversation_states(self.namespace)
+
+
+def create_state_store(namespace, db_manager):
+    """انبار وضعیت را بر اساس STATE_STORE_BACKEND_ALAMOR در فایل .env می‌سازد."""
+    from config import STATE_STORE_BACKEND, STATE_TTL_SECONDS, STATE_MAX_ENTRIES
+    if STATE_STORE_BACKEND == 'database':
+        return DatabaseStateStore(db_manager, namespace, ttl_seconds=STATE_TTL_SECONDS)
+    return MemoryStateStore(ttl_seconds=STATE_TTL_SECONDS, max_entries=STATE_MAX_ENTRIES)
+
+
+def flush_sessions():
+    """پس از پردازش هر آپدیت صدا زده می‌شود تا تغییرات همه انبارها ذخیره شوند."""
+    for store in _stores:
+        try:
+            store.flush()
+        except Exception as e:
+            logger.error(f"Error flushing conversation state: {e}", exc_info=True)
+
+
+def purge_expired_states():
+    return sum(store.purge_expired() for store in _stores)
@@ -0,0 +1,103 @@
+# utils/throttle.py
+
+import math
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from utils.send_scheduler import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# محدودیت پیش‌فرض اکشن‌های پرهزینه: (تعداد مجاز پشت سر هم, بازه به ثانیه)
+DEFAULT_THROTTLE_RULES = {
+    'start': (5, 30),
+    'user_free_test': (2, 60),
+    'user_buy_service': (5, 30),
+    'user_my_services': (5, 30),
+    'user_service_details': (5, 30),
+    'user_get_single_configs': (3, 30),
+    'buy_select_server': (6, 30),
+    'select_gateway': (3, 30),
+}
+
+
+def parse_throttle_rules(spec):
+    """
+    رشته تنظیمات را به قوانین تبدیل می‌کند؛ قالب: `action=burst/seconds` جدا شده با کاما،
+    مثلاً `user_free_test=1/60,user_buy_service=10/30`. burst برابر 0 محدودیت را برمی‌دارد.
+    """
+    rules = {}
+    for item in (spec or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            action, limit = item.split('=', 1)
+            burst, seconds = limit.split('/', 1)
+            rules[action.strip()] = (int(burst), float(seconds))
+        except ValueError:
+            logger.warning(f"Ignoring invalid throttle rule '{item}'.")
+    return rules
+
+
+class ActionThrottle:
+    """
+    محدودیت نرخ هر کاربر برای هر اکشن با سطل توکن: کاربر می‌تواند burst بار پشت سر هم
+    اکشن را اجرا کند و بعد از آن هر seconds/burst ثانیه یک توکن دوباره به دست می‌آورد.
+    اکشن‌هایی که قانونی ندارند محدود نمی‌شوند. شمارنده‌های کلی برای مانیتورینگ نگه داشته
+    می‌شوند. محدودیت‌ها برای هر پروسه جداگانه اعمال می‌شوند.
+    """
+
+    def __init__(self, rules=None, max_buckets=50000):
+        self.rules = {action: rule for action, rule in (rules or {}).items() if rule[0] > 0}
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()  # (user_id, action) -> TokenBucket
+        self._lock = threading.Lock()
+        self._allowed = 0
+        self._blocked = 0
+        self._blocked_by_action = {}
+
+    def check(self, user_id, action):
+        """
+        (True, 0) اگر اکشن مجاز باشد، در غیر این صورت (False, ثانیه تا مجاز شدن).
+        """
+        rule = self.rules.get(action)
+        if rule is None:
+            return True, 0
+        burst, seconds = rule
+        now = time.monotonic()
+        key = (user_id, action)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(burst / seconds, burst)
+                while len(self._buckets) > self.max_buckets:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            wait = bucket.wait_time(now)
+            if wait > 0:
+                self._blocked += 1
+                self._blocked_by_action[action] = self._blocked_by_action.get(action, 0) + 1
+                return False, math.ceil(wait)
+            bucket.consume()
+            self._allowed += 1
+            return True, 0
+
+    def stats(self):
+        with self._lock:
+            top = sorted(self._blocked_by_action.items(), key=lambda item: item[1], reverse=True)[:3]
+            return {
+                'throttle_allowed': self._allowed,
+                'throttle_blocked': self._blocked,
+                'throttle_users': len(self._buckets),
+                'throttle_top': ', '.join(f"{action}={count}" for action, count in top) or '-',
+            }
+
+
+def create_action_throttle():
+    """محدودیت‌ها را از قوانین پیش‌فرض و THROTTLE_RULES_ALAMOR در فایل .env می‌سازد."""
+    from config import THROTTLE_RULES
+    return ActionThrottle({**DEFAULT_THROTTLE_RULES, **parse_throttle_rules(THROTTLE_RULES)})
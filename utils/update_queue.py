@@ -0,0 +1,194 @@
+# utils/update_queue.py
+
+import time
+import logging
+import threading
+from collections import deque
+
+from utils.state_store import flush_sessions
+from utils.send_scheduler import ScheduledTeleBot
+from utils.metrics import timed_handler
+
+logger = logging.getLogger(__name__)
+
+
+def get_update_chat_id(update):
+    """شناسه چتی که آپدیت به آن تعلق دارد؛ آپدیت‌های یک چت به ترتیب پردازش می‌شوند."""
+    for attr in ('message', 'edited_message', 'channel_post', 'edited_channel_post', 'my_chat_member', 'chat_member',
+                 'chat_join_request'):
+        obj = getattr(update, attr, None)
+        if obj is not None:
+            return obj.chat.id
+    callback = getattr(update, 'callback_query', None)
+    if callback is not None:
+        return callback.message.chat.id if callback.message else callback.from_user.id
+    for attr in ('inline_query', 'chosen_inline_result', 'shipping_query', 'pre_checkout_query'):
+        obj = getattr(update, attr, None)
+        if obj is not None:
+            return obj.from_user.id
+    # آپدیت بدون چت: ترتیب مهم نیست
+    return f"update:{update.update_id}"
+
+
+class UpdateQueue:
+    """
+    صف محدود آپدیت‌ها با تضمین ترتیب برای هر چت: آپدیت‌های یک کاربر هیچ‌وقت هم‌زمان روی
+    دو ترد اجرا نمی‌شوند (از race روی وضعیت گفتگو جلوگیری می‌کند)، ولی چت‌های مختلف به صورت
+    موازی روی تعداد مشخصی ترد کارگر پردازش می‌شوند.
+    """
+
+    def __init__(self, handler, maxsize=1000, workers=4):
+        self.handler = handler
+        self.maxsize = maxsize
+        self._lock = threading.Condition()
+        self._pending = {}          # chat_id -> deque آپدیت‌های منتظر
+        self._ready = deque()       # چت‌هایی که آپدیت دارند و هیچ کارگری رویشان کار نمی‌کند
+        self._active = set()        # چت‌هایی که الان در حال پردازش‌اند
+        self._size = 0
+        self._processed = 0
+        self._rejected = 0
+        self._busy_workers = 0
+        self._closed = False
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"update-worker-{i + 1}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+        logger.info(f"Update queue started with {workers} workers (capacity {maxsize}).")
+
+    def submit(self, update, block=False, timeout=None):
+        """
+        آپدیت را در صف چت خودش قرار می‌دهد. اگر صف پر باشد و block=False، آپدیت رد شده و
+        False برگردانده می‌شود (وب‌هوک)؛ در حالت polling تا خالی شدن جا صبر می‌شود.
+        """
+        chat_id = get_update_chat_id(update)
+        deadline = time.monotonic() + timeout if timeout else None
+        with self._lock:
+            if self._closed:
+                self._rejected += 1
+                return False
+            while self._size >= self.maxsize:
+                remaining = deadline - time.monotonic() if deadline else None
+                if not block or (remaining is not None and remaining <= 0):
+                    self._rejected += 1
+                    logger.warning(f"Update queue is full; rejecting update {update.update_id}.")
+                    return False
+                self._lock.wait(remaining)
+            chat_queue = self._pending.get(chat_id)
+            if chat_queue is None:
+                chat_queue = self._pending[chat_id] = deque()
+            chat_queue.append(update)
+            self._size += 1
+            if chat_id not in self._active and len(chat_queue) == 1:
+                self._ready.append(chat_id)
+                self._lock.notify_all()
+        return True
+
+    def close(self, timeout=None):
+        """
+        آپدیت جدید پذیرفته نمی‌شود (وب‌هوک 503 می‌دهد و تلگرام بعداً دوباره می‌فرستد) و تا
+        پردازش آپدیت‌های موجود صبر می‌شود. True یعنی صف قبل از timeout خالی شد.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._lock:
+            self._closed = True
+            while self._size or self._busy_workers:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    logger.warning(f"Update queue closed with {self._size} pending updates.")
+                    return False
+                self._lock.wait(remaining)
+        logger.info("Update queue drained and closed.")
+        return True
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def qsize(self):
+        return self._size
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': self._size,
+                'capacity': self.maxsize,
+                'chats_waiting': len(self._pending),
+                'max_chat_depth': max((len(q) for q in self._pending.values()), default=0),
+                'busy_workers': self._busy_workers,
+                'workers': len(self._workers),
+                'processed': self._processed,
+                'rejected': self._rejected,
+            }
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                while not self._ready:
+                    self._lock.wait()
+                chat_id = self._ready.popleft()
+                chat_queue = self._pending[chat_id]
+                update = chat_queue.popleft()
+                if not chat_queue:
+                    del self._pending[chat_id]
+                self._active.add(chat_id)
+                self._size -= 1
+                self._busy_workers += 1
+                self._lock.notify_all()
+            try:
+                self.handler(update)
+            except Exception as e:
+                logger.error(f"Error processing update {update.update_id}: {e}", exc_info=True)
+            finally:
+                with self._lock:
+                    self._active.discard(chat_id)
+                    self._busy_workers -= 1
+                    self._processed += 1
+                    # آپدیت بعدی همین چت فقط بعد از پایان آپدیت قبلی برداشته می‌شود
+                    if chat_id in self._pending:
+                        self._ready.append(chat_id)
+                    # کارگرهای منتظر و close() که منتظر خالی شدن صف است بیدار می‌شوند
+                    self._lock.notify_all()
+
+
+class QueuedTeleBot(ScheduledTeleBot):
+    """
+    TeleBot که آپدیت‌ها را به جای thread pool داخلی telebot به UpdateQueue می‌سپارد.
+    هم infinity_polling و هم روت وب‌هوک از طریق process_new_updates از آن استفاده می‌کنند.
+    ارسال‌های آن مانند ScheduledTeleBot از زمان‌بند ارسال عبور می‌کنند.
+    """
+
+    def __init__(self, token, workers=4, maxsize=1000, **kwargs):
+        kwargs['threaded'] = False
+        super().__init__(token, **kwargs)
+        self.update_queue = UpdateQueue(self._handle_update, maxsize=maxsize, workers=workers)
+
+    def process_new_updates(self, updates):
+        # در polling، پر بودن صف باعث توقف دریافت آپدیت‌های جدید می‌شود (backpressure)
+        for update in updates:
+            self.update_queue.submit(update, block=True)
+
+    def _handle_update(self, update):
+        try:
+            super().process_new_updates([update])
+        finally:
+            # تغییرات وضعیت گفتگو که هندلرها به صورت درجا انجام داده‌اند ذخیره می‌شوند
+            flush_sessions()
+
+
+# انواع هندلرهایی که زمان اجرایشان در متریک‌ها (برچسب handler) ثبت می‌شود
+TIMED_HANDLER_TYPES = ('message', 'edited_message', 'callback_query', 'inline', 'my_chat_member', 'chat_member',
+                       'chat_join_request')
+
+
+def _timed_add_handler(name):
+    def method(self, handler_dict):
+        handler_dict['function'] = timed_handler(handler_dict['function'])
+        return getattr(super(QueuedTeleBot, self), name)(handler_dict)
+    method.__name__ = name
+    return method
+
+
+for _type in TIMED_HANDLER_TYPES:
+    setattr(QueuedTeleBot, f"add_{_type}_handler", _timed_add_handler(f"add_{_type}_handler"))
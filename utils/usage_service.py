@@ -0,0 +1,183 @@
+# utils/usage_service.py
+
+import logging
+import datetime
+import threading
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class UsageService:
+    """
+    مصرف لحظه‌ای سرویس‌ها را از پنل X-UI می‌خواند. درخواست‌ها بر اساس سرور گروه‌بندی و
+    سرورهای مختلف به صورت هم‌زمان بررسی می‌شوند؛ درخواست‌های یک پنل پشت سر هم و با یک
+    سشن لاگین شده ارسال می‌شوند. نتیجه هر کلاینت (بر اساس xui_client_email) برای مدت کوتاهی
+    کش می‌شود و کلیک‌های تکراری در حین یک درخواست، منتظر همان درخواست می‌مانند
+    (single-flight)، پس فشار روی پنل با تعداد کلیک‌ها زیاد نمی‌شود.
+    """
+
+    def __init__(self, db_manager, xui_api_class, ttl_seconds=60, max_workers=8, timeout=10.0):
+        self.db_manager = db_manager
+        self.xui_api_class = xui_api_class
+        self.ttl_seconds = ttl_seconds
+        self.timeout = timeout
+        self._usages = TTLCache(max_entries=20000, ttl_seconds=ttl_seconds)  # email -> usage | None
+        self._online = TTLCache(max_entries=1000, ttl_seconds=ttl_seconds)  # server_id -> set(email)
+        self._inflight = {}  # email -> Future
+        self._inflight_lock = threading.Lock()
+        self._clients = {}  # server_id -> (credentials, client, lock)
+        self._clients_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="usage-lookup")
+
+    def prefetch(self, purchases):
+        """خواندن مصرف سرویس‌ها را بدون انتظار شروع می‌کند (مثلاً هنگام نمایش لیست سرویس‌ها)."""
+        self._lookup(purchases)
+
+    def get_usages(self, purchases, timeout=None):
+        """
+        {purchase_id: usage} را برمی‌گرداند. usage برای سرویس‌هایی که پنلشان در زمان
+        timeout پاسخ نداده None است.
+        """
+        cached, pending = self._lookup(purchases)
+        if pending:
+            wait(pending.values(), timeout=self.timeout if timeout is None else timeout)
+        usages = {}
+        for purchase in purchases:
+            email = purchase.get('xui_client_email')
+            if email in cached:
+                usages[purchase['id']] = cached[email]
+            elif email in pending and pending[email].done():
+                usages[purchase['id']] = pending[email].result()
+            else:
+                usages[purchase['id']] = None
+        return usages
+
+    def get_usage(self, purchase, timeout=None):
+        return self.get_usages([purchase], timeout=timeout).get(purchase['id'])
+
+    def count_online_users(self, servers, timeout=None):
+        """
+        مجموع کاربران متصل سرورهای داده شده را برمی‌گرداند (هر سرور هم‌زمان و با کش). اگر
+        هیچ پنلی پاسخ ندهد None برمی‌گردد.
+        """
+        futures = [self._pool.submit(self._server_online_emails, server['id']) for server in servers]
+        if not futures:
+            return 0
+        wait(futures, timeout=self.timeout if timeout is None else timeout)
+        counts = [len(f.result()) for f in futures if f.done() and f.result() is not None]
+        return sum(counts) if counts else None
+
+    def invalidate(self, email):
+        self._usages.invalidate(email)
+
+    # --- داخلی ---
+    def _lookup(self, purchases):
+        cached, pending = {}, {}
+        to_fetch = defaultdict(list)  # server_id -> [email]
+        with self._inflight_lock:
+            for purchase in purchases:
+                email = purchase.get('xui_client_email')
+                if not email or email in cached or email in pending:
+                    continue
+                usage = self._usages.get(email, _MISSING)
+                if usage is not _MISSING:
+                    cached[email] = usage
+                    continue
+                future = self._inflight.get(email)
+                if future is None:
+                    future = self._inflight[email] = Future()
+                    to_fetch[purchase['server_id']].append(email)
+                pending[email] = future
+        for server_id, emails in to_fetch.items():
+            self._pool.submit(self._fetch_server, server_id, emails)
+        return cached, pending
+
+    def _resolve(self, email, usage):
+        # ابتدا کش پر می‌شود و بعد درخواست در حال اجرا حذف می‌شود تا فراخواننده جدید یکی از این دو را ببیند
+        # نتیجه ناموفق کوتاه‌تر کش می‌شود تا پنل در دسترس نبودن با کلیک‌های پشت سر هم زیر فشار نرود
+        self._usages.set(email, usage, ttl=None if usage is not None else min(self.ttl_seconds, 15))
+        with self._inflight_lock:
+            future = self._inflight.pop(email, None)
+        if future is not None:
+            future.set_result(usage)
+
+    def _fetch_server(self, server_id, emails):
+        resolved = set()
+        try:
+            entry = self._client_for(server_id)
+            if entry is None:
+                return
+            _, client, lock = entry
+            with lock:
+                online = self._online_emails(server_id, client)
+                for email in emails:
+                    traffic = client.get_client_traffics(email)
+                    self._resolve(email, self._parse_traffic(traffic, email, online) if traffic else None)
+                    resolved.add(email)
+        except Exception as e:
+            logger.error(f"Error reading usage from server {server_id}: {e}", exc_info=True)
+        finally:
+            for email in emails:
+                if email not in resolved:
+                    self._resolve(email, None)
+
+    def _server_online_emails(self, server_id):
+        try:
+            entry = self._client_for(server_id)
+            if entry is None:
+                return None
+            _, client, lock = entry
+            with lock:
+                return self._online_emails(server_id, client)
+        except Exception as e:
+            logger.error(f"Error reading online users from server {server_id}: {e}")
+            return None
+
+    def _client_for(self, server_id):
+        """کلاینت پنل هر سرور نگه داشته می‌شود تا برای هر درخواست دوباره لاگین نشود."""
+        server = self.db_manager.get_server_by_id(server_id)
+        if not server:
+            return None
+        credentials = (server['panel_url'], server['username'], server['password'])
+        with self._clients_lock:
+            entry = self._clients.get(server_id)
+            if entry is None or entry[0] != credentials:
+                client = self.xui_api_class(panel_url=server['panel_url'], username=server['username'], password=server['password'])
+                entry = self._clients[server_id] = (credentials, client, threading.Lock())
+            return entry
+
+    def _online_emails(self, server_id, client):
+        online = self._online.get(server_id, _MISSING)
+        if online is _MISSING:
+            emails = client.get_online_users()
+            online = set(emails) if emails is not None else None
+            self._online.set(server_id, online)
+        return online
+
+    @staticmethod
+    def _parse_traffic(traffic, email, online):
+        used = (traffic.get('up') or 0) + (traffic.get('down') or 0)
+        total = traffic.get('total') or 0
+        expiry_ms = traffic.get('expiryTime') or 0
+        return {
+            'used_bytes': used,
+            'total_bytes': total or None,  # 0 یعنی نامحدود
+            'remaining_bytes': max(total - used, 0) if total else None,
+            # مقدار منفی در 3x-ui یعنی شروع مدت از اولین اتصال؛ تاریخ قطعی وجود ندارد
+            'expiry_time': datetime.datetime.fromtimestamp(expiry_ms / 1000) if expiry_ms > 0 else None,
+            'enabled': bool(traffic.get('enable', True)),
+            'online': (email in online) if online is not None else None,
+        }
+
+
+def create_usage_service(db_manager, xui_api_class):
+    """سرویس مصرف را بر اساس تنظیمات USAGE_*_ALAMOR در فایل .env می‌سازد."""
+    from config import USAGE_CACHE_TTL_SECONDS, USAGE_LOOKUP_WORKERS, USAGE_LOOKUP_TIMEOUT
+    return UsageService(db_manager, xui_api_class, ttl_seconds=USAGE_CACHE_TTL_SECONDS,
+                        max_workers=USAGE_LOOKUP_WORKERS, timeout=USAGE_LOOKUP_TIMEOUT)
@@ -0,0 +1,128 @@
+# utils/zarinpal_verification.py
+
+import json
+import logging
+
+import requests
+import telebot
+
+from config import JOB_MAX_ATTEMPTS, ZARINPAL_VERIFY_URL
+from utils import messages
+from utils.job_queue import PermanentJobError
+from utils.metrics import record_payment_outcome
+from utils.provisioning import enqueue_payment_provisioning
+
+logger = logging.getLogger(__name__)
+
+VERIFY_ZARINPAL_JOB = 'verify_zarinpal_payment'
+
+
+def enqueue_zarinpal_verification(db_manager, payment_id, authority, status):
+    """
+    استعلام پرداخت از زرین‌پال را به صف کارها می‌سپارد تا صفحه بازگشت درگاه بلافاصله نمایش
+    داده شود. status همان پارامتر Status بازگشتی درگاه است (OK یا NOK). هر پرداخت فقط یک کار
+    در صف دارد؛ اگر استعلام قبلی پس از همه تلاش‌ها شکست خورده باشد، بازگشت دوباره کاربر همان
+    کار را از نو اجرا می‌کند.
+    """
+    payload = {'payment_id': payment_id, 'authority': authority, 'status': status}
+    dedupe_key = f"{VERIFY_ZARINPAL_JOB}:{payment_id}"
+    job_id = db_manager.enqueue_job(VERIFY_ZARINPAL_JOB, payload, dedupe_key=dedupe_key, max_attempts=JOB_MAX_ATTEMPTS)
+    return job_id or db_manager.requeue_failed_job(dedupe_key, payload)
+
+
+def zarinpal_verification_failed(db_manager, payment_id):
+    """آیا استعلام این پرداخت پس از همه تلاش‌ها شکست خورده است (پرداخت در این حالت pending می‌ماند)."""
+    return db_manager.get_job_status(f"{VERIFY_ZARINPAL_JOB}:{payment_id}") == 'failed'
+
+
+class ZarinpalVerifier:
+    """
+    استعلام پرداخت از زرین‌پال و سپردن ساخت سرویس به صف کارها. خطای ارتباط با درگاه با
+    تلاش مجدد صف کارها جبران می‌شود؛ رزرو پرداخت (claim) تضمین می‌کند که هر پرداخت فقط یک
+    بار سرویس بگیرد.
+    """
+
+    def __init__(self, bot: telebot.TeleBot, db_manager, verify_url=ZARINPAL_VERIFY_URL, timeout=20):
+        self.bot = bot
+        self.db_manager = db_manager
+        self.verify_url = verify_url
+        self.timeout = timeout
+
+    def register(self, job_queue):
+        job_queue.register(VERIFY_ZARINPAL_JOB, self.verify, on_final_failure=self.on_final_failure)
+
+    def verify(self, payload, job):
+        payment_id = payload['payment_id']
+        payment = self.db_manager.get_payment_by_id(payment_id)
+        if not payment:
+            raise PermanentJobError(f"Payment {payment_id} not found.")
+        user = self.db_manager.get_user_by_id(payment['user_id'])
+        if not user:
+            raise PermanentJobError(f"User of payment {payment_id} not found.")
+        user_telegram_id = user['telegram_id']
+
+        if payment['status'] == 'processing':
+            # تلاش قبلی پس از رزرو پرداخت متوقف شده است؛ ثبت کار ساخت سرویس تکراری نمی‌شود
+            self._enqueue_provisioning(payment, user_telegram_id, payment.get('ref_id'), None)
+            return
+        if payment['status'] != 'pending':
+            logger.info(f"Payment {payment_id} is already {payment['status']}; nothing to verify.")
+            return
+
+        if payload['status'] != 'OK':
+            # پرداخت لغو شده بسته می‌شود تا صفحه وضعیت و گزارش‌ها آن را در انتظار نشان ندهند
+            if self.db_manager.update_payment_status(payment_id, False):
+                record_payment_outcome('zarinpal', 'cancelled')
+            self._safe_call(self.bot.send_message, user_telegram_id, messages.ZARINPAL_PAYMENT_CANCELLED_USER)
+            return
+
+        order_details = json.loads(payment['order_details_json'])
+        gateway = self.db_manager.get_payment_gateway_by_id(order_details['gateway_details']['id'])
+        if not gateway:
+            raise PermanentJobError(f"Gateway of payment {payment_id} not found.")
+        request_payload = {"merchant_id": gateway['merchant_id'], "amount": int(payment['amount']) * 10,
+                           "authority": payload['authority']}
+        # خطای شبکه یا پاسخ خطای سرور درگاه باعث تلاش مجدد کار می‌شود
+        response = requests.post(self.verify_url, json=request_payload, timeout=self.timeout)
+        response.raise_for_status()
+        result = response.json()
+
+        if result.get("data") and result.get("data", {}).get("code") in [100, 101]:
+            ref_id = str(result.get("data", {}).get("ref_id", "N/A"))
+            logger.info(f"Payment {payment_id} verified successfully. Ref ID: {ref_id}")
+            if not self.db_manager.claim_payment(payment_id, ref_id=ref_id):
+                logger.info(f"Payment {payment_id} was claimed by another request.")
+                return
+            sent = self._safe_call(self.bot.send_message, user_telegram_id, messages.PROVISIONING_STARTED_USER)
+            self._enqueue_provisioning(payment, user_telegram_id, ref_id, sent.message_id if sent else None)
+        else:
+            error_message = result.get("errors", {}).get("message", "خطای نامشخص")
+            logger.warning(f"Zarinpal rejected payment {payment_id}: {error_message}")
+            if self.db_manager.update_payment_status(payment_id, False):
+                record_payment_outcome('zarinpal', 'rejected')
+            self._safe_call(self.bot.send_message, user_telegram_id,
+                            messages.ZARINPAL_PAYMENT_FAILED_USER.format(error_message=error_message))
+
+    def on_final_failure(self, payload, job, error):
+        # پرداخت pending می‌ماند (ممکن است مبلغ کسر شده باشد)؛ صفحه وضعیت خطای استعلام را نشان
+        # می‌دهد و بازگشت دوباره کاربر از درگاه استعلام را از نو اجرا می‌کند
+        record_payment_outcome('zarinpal', 'failed')
+        payment = self.db_manager.get_payment_by_id(payload['payment_id'])
+        user = self.db_manager.get_user_by_id(payment['user_id']) if payment else None
+        if user:
+            self._safe_call(self.bot.send_message, user['telegram_id'], messages.ZARINPAL_VERIFY_FAILED_USER)
+
+    def _enqueue_provisioning(self, payment, user_telegram_id, ref_id, user_message_id):
+        enqueue_payment_provisioning(
+            self.db_manager, payment['id'], 'zarinpal', ref_id=ref_id,
+            user_telegram_id=user_telegram_id, user_message_id=user_message_id
+        )
+
+    @staticmethod
+    def _safe_call(func, *args, **kwargs):
+        # خطای ارسال پیام نباید باعث تکرار استعلام شود
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            logger.warning(f"Notification failed in Zarinpal verification job: {e}")
+            return None
@@ -1,23 +1,28 @@
 # webhook_server.py
 
-from flask import Flask, request, render_template
-import requests
-import json
+from flask import Flask, Response, request, render_template, abort, jsonify
+import hmac
 import logging
 import os
 import sys
-import datetime
+import threading
 
 # افزودن مسیر پروژه به sys.path
 project_path = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, project_path)
 
 # وارد کردن ماژول‌های پروژه
-from config import BOT_TOKEN, BOT_USERNAME_ALAMOR # <-- اصلاح شد
+from config import (BOT_TOKEN, BOT_USERNAME_ALAMOR, TELEGRAM_UPDATE_MODE, TELEGRAM_WEBHOOK_PATH,
+                    TELEGRAM_WEBHOOK_SECRET, UPDATE_QUEUE_SIZE, UPDATE_WORKERS, WEBHOOK_SERVER_BIND,
+                    WEBHOOK_SERVER_GRACEFUL_TIMEOUT, METRICS_TOKEN, METRICS_EXPORT_INTERVAL_SECONDS)
 from database.db_manager import DatabaseManager
-from utils.bot_helpers import send_subscription_info
-from utils.config_generator import ConfigGenerator
+from utils.zarinpal_verification import enqueue_zarinpal_verification, zarinpal_verification_failed
 from api_client.xui_api_client import XuiAPIClient
+from handlers.common_handlers import register_all_handlers
+from utils.update_queue import QueuedTeleBot
+from utils.send_scheduler import ScheduledTeleBot
+from utils.cache import TTLCache
+from utils.metrics import collect_process_metrics, render_prometheus
 import telebot
 
 # تنظیمات اولیه
@@ -26,19 +31,116 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 db_manager = DatabaseManager()
-bot = telebot.TeleBot(BOT_TOKEN)
-config_gen = ConfigGenerator(XuiAPIClient, db_manager)
+bot = ScheduledTeleBot(BOT_TOKEN)
+
+# در حالت وب‌هوک، همان هندلرهای حالت polling روی یک ربات با صف مرتب‌شده بر اساس چت ثبت می‌شوند
+update_queue = None
+if TELEGRAM_UPDATE_MODE == 'webhook':
+    bot = QueuedTeleBot(BOT_TOKEN, workers=UPDATE_WORKERS, maxsize=UPDATE_QUEUE_SIZE)
+    register_all_handlers(bot, db_manager, XuiAPIClient)
+    update_queue = bot.update_queue
 
-# آدرس API واقعی زرین‌پال
-ZARINPAL_VERIFY_URL = "https://api.zarinpal.com/pg/v4/payment/verify.json"
 BOT_USERNAME = BOT_USERNAME_ALAMOR # <-- اصلاح شد
 
+# Authority هایی که بازگشتشان ثبت شده است؛ بازگشت تکراری (رفرش صفحه، دوباره ارسال شدن
+# درخواست) تا وقتی استعلام قبلی شکست نهایی نخورده کار جدیدی ثبت نمی‌کند و فقط وضعیت فعلی را نشان می‌دهد
+processed_authorities = TTLCache(max_entries=10000, ttl_seconds=600)
+
+VERIFICATION_FAILED_MESSAGE = ("بررسی پرداخت با درگاه ممکن نشد. اگر مبلغ از حساب شما کسر شده است، "
+                               "این صفحه را دوباره بارگذاری کنید یا با پشتیبانی تماس بگیرید.")
+
+# نتیجه بررسی دسترسی به Bot API کوتاه‌مدت کش می‌شود تا هر probe یک درخواست به تلگرام نفرستد
+_readiness_cache = TTLCache(max_entries=10, ttl_seconds=30)
+_shutting_down = threading.Event()
+
 @app.route('/', methods=['GET'])
 def index():
     return "AlamorVPN Bot Webhook Server is running."
 
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """زنده بودن پروسه (liveness)؛ وابستگی‌های خارجی بررسی نمی‌شوند تا قطعی آن‌ها باعث ری‌استارت نشود."""
+    return jsonify(status='ok')
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """آمادگی برای دریافت درخواست (readiness): دسترسی به دیتابیس و Bot API تلگرام."""
+    checks = {'database': db_manager.ping(), 'telegram': _telegram_reachable()}
+    if update_queue is not None:
+        checks['update_queue'] = not update_queue.closed
+    ready = all(checks.values()) and not _shutting_down.is_set()
+    return jsonify(status='ready' if ready else 'unavailable', checks=checks), 200 if ready else 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    متریک‌ها در قالب متنی Prometheus: متریک‌های زنده همین پروسه (process="webhook") به همراه
+    آخرین snapshot پروسه ربات که در دیتابیس ذخیره شده است (process="bot").
+    """
+    if not _metrics_authorized():
+        abort(403)
+    # snapshot پروسه‌ای که مدتی است متریک ذخیره نکرده (متوقف شده) نمایش داده نمی‌شود
+    snapshots = db_manager.get_metrics_snapshots(max_age_seconds=max(10 * METRICS_EXPORT_INTERVAL_SECONDS, 300))
+    webhook = collect_process_metrics(bot)
+    webhook['gauges']['jobs'] = [[{'status': status}, total] for status, total in db_manager.get_job_counts().items()]
+    snapshots['webhook'] = webhook
+    return Response(render_prometheus(snapshots), mimetype='text/plain; version=0.0.4')
+
+def _metrics_authorized():
+    if METRICS_TOKEN:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {METRICS_TOKEN}")
+    # بدون توکن فقط درخواست مستقیم از خود سرور پذیرفته می‌شود؛ درخواست‌هایی که از nginx می‌آیند هدر X-Real-IP دارند
+    return (request.remote_addr in ('127.0.0.1', '::1')
+            and 'X-Real-IP' not in request.headers and 'X-Forwarded-For' not in request.headers)
+
+def _telegram_reachable():
+    reachable = _readiness_cache.get('telegram')
+    if reachable is None:
+        try:
+            bot.get_me()
+            reachable = True
+        except Exception as e:
+            logger.warning(f"Readiness check: Telegram Bot API is unreachable: {e}")
+            reachable = False
+        # نتیجه ناموفق کوتاه‌تر کش می‌شود تا بازگشت سرویس سریع دیده شود
+        _readiness_cache.set('telegram', reachable, ttl=None if reachable else 5)
+    return reachable
+
+def shutdown(timeout=WEBHOOK_SERVER_GRACEFUL_TIMEOUT):
+    """
+    توقف تمیز: /readyz ناموفق می‌شود، آپدیت جدید تلگرام پذیرفته نمی‌شود (503 و ارسال دوباره
+    توسط تلگرام) و آپدیت‌های در صف حداکثر تا timeout ثانیه پردازش می‌شوند.
+    """
+    if _shutting_down.is_set():
+        return
+    _shutting_down.set()
+    logger.info("Webhook server is shutting down...")
+    if update_queue is not None:
+        update_queue.close(timeout)
+
+@app.route('/' + TELEGRAM_WEBHOOK_PATH.strip('/'), methods=['POST'])
+def handle_telegram_update():
+    """آپدیت ارسالی تلگرام را پس از بررسی توکن مخفی در صف پردازش قرار می‌دهد."""
+    if update_queue is None:
+        abort(404)
+    secret = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+    if not TELEGRAM_WEBHOOK_SECRET or not hmac.compare_digest(secret, TELEGRAM_WEBHOOK_SECRET):
+        logger.warning(f"Rejected Telegram webhook call with invalid secret from {request.remote_addr}")
+        abort(403)
+    update = telebot.types.Update.de_json(request.get_data(as_text=True))
+    if update is None:
+        abort(400)
+    if not update_queue.submit(update):
+        # تلگرام در صورت پاسخ خطا، آپدیت را بعداً دوباره ارسال می‌کند
+        return "Busy", 503
+    return ""
+
 @app.route('/zarinpal/verify', methods=['GET'])
 def handle_zarinpal_callback():
+    """
+    بازگشت از درگاه: فقط پرداخت پیدا و استعلام آن در صف کارها ثبت می‌شود. استعلام از زرین‌پال و
+    ساخت سرویس در پروسه ربات انجام می‌شود و این صفحه وضعیت را از /zarinpal/status می‌خواند.
+    """
     authority = request.args.get('Authority')
     status = request.args.get('Status')
 
@@ -47,72 +149,53 @@ def handle_zarinpal_callback():
     if not authority or not status:
         return render_template('payment_status.html', status='error', message="اطلاعات بازگشتی از درگاه ناقص است.", bot_username=BOT_USERNAME)
 
-    payment = db_manager.get_payment_by_authority(authority)
+    first_callback = processed_authorities.add(authority)
+    payment = db_manager.get_payment_status_by_authority(authority)
     if not payment:
         logger.warning(f"Payment not found for Authority: {authority}")
+        processed_authorities.invalidate(authority)
         return render_template('payment_status.html', status='error', message="تراکنش یافت نشد.", bot_username=BOT_USERNAME)
-    
-    user_db_info = db_manager.get_user_by_id(payment['user_id'])
-    user_telegram_id = user_db_info['telegram_id']
 
-    if payment['is_confirmed']:
-        logger.warning(f"Payment ID {payment['id']} has already been confirmed.")
-        return render_template('payment_status.html', status='success', ref_id=payment.get('ref_id'), bot_username=BOT_USERNAME)
+    if payment['status'] != 'pending':
+        logger.warning(f"Payment with Authority {authority} has already been processed ({payment['status']}).")
+        return _render_payment_state(payment, authority)
 
-    if status == 'OK':
-        order_details = json.loads(payment['order_details_json'])
-        gateway = db_manager.get_payment_gateway_by_id(order_details['gateway_details']['id'])
-        
-        payload = {"merchant_id": gateway['merchant_id'], "amount": int(payment['amount']) * 10, "authority": authority}
-        
-        try:
-            response = requests.post(ZARINPAL_VERIFY_URL, json=payload, timeout=20)
-            response.raise_for_status()
-            result = response.json()
-
-            if result.get("data") and result.get("data", {}).get("code") in [100, 101]:
-                ref_id = result.get("data", {}).get("ref_id", "N/A")
-                logger.info(f"Payment {payment['id']} verified successfully. Ref ID: {ref_id}")
-                
-                if order_details['plan_type'] == 'fixed_monthly':
-                    plan = order_details['plan_details']
-                    total_gb, duration_days = plan['volume_gb'], plan['duration_days']
-                else:
-                    gb_plan = order_details['gb_plan_details']
-                    total_gb, duration_days = order_details['requested_gb'], gb_plan.get('duration_days', 0)
-                
-                client_details, sub_link, single_configs = config_gen.create_client_and_configs(user_telegram_id, order_details['server_id'], total_gb, duration_days)
-                
-                if sub_link:
-                    expire_date = (datetime.datetime.now() + datetime.timedelta(days=duration_days)) if duration_days and duration_days > 0 else None
-                    plan_id = order_details.get('plan_details', {}).get('id') or order_details.get('gb_plan_details', {}).get('id')
-                    
-                    db_manager.add_purchase(
-                        user_id=payment['user_id'], server_id=order_details['server_id'], plan_id=plan_id,
-                        expire_date=expire_date.strftime("%Y-%m-%d %H:%M:%S") if expire_date else None,
-                        initial_volume_gb=total_gb, client_uuid=client_details['uuid'],
-                        client_email=client_details['email'], sub_id=client_details['subscription_id'],
-                        single_configs=single_configs
-                    )
-                    
-                    db_manager.confirm_online_payment(payment['id'], str(ref_id))
-                    bot.send_message(user_telegram_id, "✅ پرداخت شما با موفقیت تایید و سرویس شما فعال گردید.")
-                    send_subscription_info(bot, user_telegram_id, sub_link)
-                else:
-                    bot.send_message(user_telegram_id, "❌ در فعال‌سازی سرویس شما خطایی رخ داد. لطفاً با پشتیبانی تماس بگیرید.")
-                
-                return render_template('payment_status.html', status='success', ref_id=ref_id, bot_username=BOT_USERNAME)
-            else:
-                error_message = result.get("errors", {}).get("message", "خطای نامشخص")
-                bot.send_message(user_telegram_id, f"❌ پرداخت شما توسط درگاه تایید نشد. (خطا: {error_message})")
-                return render_template('payment_status.html', status='error', message=error_message, bot_username=BOT_USERNAME)
-
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error verifying with Zarinpal: {e}")
-            return render_template('payment_status.html', status='error', message="خطا در ارتباط با سرور درگاه پرداخت.", bot_username=BOT_USERNAME)
-    else:
-        bot.send_message(user_telegram_id, "شما فرآیند پرداخت را لغو کردید. سفارش شما ناتمام باقی ماند.")
+    # بازگشت تکراری فقط وقتی استعلام را دوباره ثبت می‌کند که استعلام قبلی شکست نهایی خورده باشد
+    if not first_callback and not zarinpal_verification_failed(db_manager, payment['id']):
+        logger.info(f"Duplicate Zarinpal callback for Authority: {authority}")
+        return _render_payment_state(payment, authority)
+
+    enqueue_zarinpal_verification(db_manager, payment['id'], authority, status)
+    if status != 'OK':
         return render_template('payment_status.html', status='error', message="تراکنش توسط شما لغو شد.", bot_username=BOT_USERNAME)
+    return render_template('payment_status.html', status='processing', authority=authority, bot_username=BOT_USERNAME)
+
+@app.route('/zarinpal/status', methods=['GET'])
+def zarinpal_payment_status():
+    """وضعیت سبک پرداخت برای صفحه در حال پردازش (فقط یک SELECT روی ایندکس authority)."""
+    payment = db_manager.get_payment_status_by_authority(request.args.get('authority', ''))
+    if not payment:
+        return jsonify(state='error', message="تراکنش یافت نشد."), 404
+    if payment['status'] in ('processing', 'confirmed'):
+        return jsonify(state='success', ref_id=payment.get('ref_id'))
+    if payment['status'] == 'rejected':
+        return jsonify(state='error', message="پرداخت توسط درگاه تأیید نشد یا لغو شد.")
+    if zarinpal_verification_failed(db_manager, payment['id']):
+        return jsonify(state='error', message=VERIFICATION_FAILED_MESSAGE)
+    return jsonify(state='processing')
+
+def _render_payment_state(payment, authority):
+    """صفحه وضعیت پرداخت را فقط از روی دیتابیس (بدون استعلام از درگاه) نمایش می‌دهد."""
+    if payment and payment['status'] in ('processing', 'confirmed'):
+        return render_template('payment_status.html', status='success', ref_id=payment.get('ref_id'), bot_username=BOT_USERNAME)
+    if payment and payment['status'] == 'pending':
+        return render_template('payment_status.html', status='processing', authority=authority, bot_username=BOT_USERNAME)
+    return render_template('payment_status.html', status='error', message="این تراکنش قبلاً پردازش شده است.", bot_username=BOT_USERNAME)
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8080)
\ No newline at end of file
+    # اجرای مستقیم فقط برای توسعه است؛ در production از gunicorn استفاده کنید (wsgi.py)
+    host, _, port = WEBHOOK_SERVER_BIND.rpartition(':')
+    try:
+        app.run(host=host or '0.0.0.0', port=int(port), threaded=True)
+    finally:
+        shutdown()
\ No newline at end of file
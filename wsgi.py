@@ -0,0 +1,5 @@
+# wsgi.py
+
+# نقطه ورود WSGI سرور وب‌هوک برای اجرا در production:
+#   gunicorn -c gunicorn.conf.py wsgi:app
+from webhook_server import app  # noqa: F401